@@ -87,6 +87,8 @@ function MainApp() {
   useEffect(() => {
     // Initialize socket connection
     const newSocket = io(import.meta.env.VITE_API_URL, {
+      // Read on every (re)connect so a refreshed token is picked up
+      auth: (cb) => cb({ token: localStorage.getItem('tubby_token') }),
       transports: ['websocket', 'polling'],
       reconnection: true,
       reconnectionAttempts: 10,
@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+"""
+Benchmark concurrent inserts into the local SQLite store (app.db)
+
+Starts one process per gunicorn worker (cpu_count * 2 + 1 by default, as
+in gunicorn.conf.py), all inserting command-log-sized rows into the same
+database file for a fixed time, and compares:
+
+    default      SQLAlchemy defaults: rollback journal, synchronous=FULL,
+                 one commit per insert
+    wal          local_store engine options and pragmas (WAL,
+                 synchronous=NORMAL, busy timeout, pooled connections),
+                 one commit per insert
+    wal-batched  the same engine behind WriteBehindBatcher
+
+It reports sustained committed inserts/sec across all workers (the
+batcher's final flush is included in the time), the caller-visible
+latency of one write, and writes that failed with "database is locked".
+
+    cd backend
+    python benchmarks/bench_local_store.py
+    python benchmarks/bench_local_store.py --workers 8 --duration 10 --modes wal,wal-batched
+"""
+
+import argparse
+import multiprocessing
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+# local_store lives next to main.py at the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from sqlalchemy import Column, Integer, MetaData, String, Table, Text, create_engine, func, select
+
+from local_store import WriteBehindBatcher, configure_sqlite_engine, sqlite_engine_options
+
+MODES = ('default', 'wal', 'wal-batched')
+
+metadata = MetaData()
+command_log = Table(
+    'bench_command_log', metadata,
+    Column('id', Integer, primary_key=True),
+    Column('worker', Integer, nullable=False),
+    Column('terminal_id', String(64), nullable=False),
+    Column('command', Text, nullable=False),
+    Column('output', Text),
+    Column('created_at', Integer, nullable=False),
+)
+
+
+def make_engine(mode, db_path):
+    url = f"sqlite:///{db_path}"
+    if mode == 'default':
+        return create_engine(url)
+    return configure_sqlite_engine(create_engine(url, **sqlite_engine_options()))
+
+
+def worker(mode, db_path, worker_id, start_at, duration, row_bytes, results):
+    engine = make_engine(mode, db_path)
+    batcher = WriteBehindBatcher(engine, name=f"bench-{worker_id}") if mode == 'wal-batched' else None
+    output = 'x' * row_bytes
+    latencies = []
+    locked = 0
+    written = 0
+
+    while time.time() < start_at:
+        time.sleep(0.001)
+    deadline = start_at + duration
+    n = 0
+    while time.time() < deadline:
+        row = {
+            'worker': worker_id, 'terminal_id': f"terminal{n % 4}", 'command': f"ls -la /tmp/{n}",
+            'output': output, 'created_at': int(time.time() * 1000),
+        }
+        started = time.perf_counter()
+        if batcher:
+            batcher.add(command_log, row)
+        else:
+            try:
+                with engine.begin() as connection:
+                    connection.execute(command_log.insert(), row)
+                written += 1
+            except Exception as e:
+                if 'locked' not in str(e):
+                    raise
+                locked += 1
+        latencies.append(time.perf_counter() - started)
+        n += 1
+
+    if batcher:
+        batcher.close()
+        written = batcher.stats['rows']
+        locked = n - written
+    finished = time.time()
+    engine.dispose()
+    results.put((worker_id, written, locked, finished - start_at, latencies))
+
+
+def run_mode(mode, workers, duration, row_bytes):
+    db_dir = tempfile.mkdtemp(prefix='tubby-local-store-bench-')
+    db_path = os.path.join(db_dir, 'app.db')
+    engine = make_engine(mode, db_path)
+    metadata.create_all(engine)
+    engine.dispose()
+
+    context = multiprocessing.get_context('fork' if hasattr(os, 'fork') else 'spawn')
+    results = context.Queue()
+    start_at = time.time() + 1.0
+    processes = [
+        context.Process(target=worker, args=(mode, db_path, i, start_at, duration, row_bytes, results))
+        for i in range(workers)
+    ]
+    for process in processes:
+        process.start()
+    collected = [results.get() for _ in processes]
+    for process in processes:
+        process.join()
+
+    engine = make_engine(mode, db_path)
+    with engine.connect() as connection:
+        stored = connection.execute(select(func.count()).select_from(command_log)).scalar()
+    engine.dispose()
+
+    wall = max(result[3] for result in collected)
+    latencies = sorted(latency for result in collected for latency in result[4])
+    return {
+        'written': sum(result[1] for result in collected),
+        'stored': stored,
+        'locked': sum(result[2] for result in collected),
+        'wall': wall,
+        'p50_ms': statistics.median(latencies) * 1000 if latencies else 0,
+        'p99_ms': latencies[int(len(latencies) * 0.99) - 1] * 1000 if latencies else 0,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--workers', type=int, default=multiprocessing.cpu_count() * 2 + 1)
+    parser.add_argument('--duration', type=float, default=5.0, help="Seconds each worker keeps inserting")
+    parser.add_argument('--row-bytes', type=int, default=512, help="Size of the output column per row")
+    parser.add_argument('--modes', default=','.join(MODES), help="Comma-separated subset of: " + ', '.join(MODES))
+    args = parser.parse_args()
+
+    modes = [mode.strip() for mode in args.modes.split(',') if mode.strip()]
+    unknown = set(modes) - set(MODES)
+    if unknown:
+        parser.error(f"unknown modes: {', '.join(sorted(unknown))}")
+
+    print(f"🗄️  {args.workers} worker processes, {args.duration:.0f}s per mode, {args.row_bytes}-byte rows")
+    print("=" * 78)
+    print(f"{'mode':<13} {'inserts/sec':>12} {'committed':>10} {'locked':>8} {'p50 write':>10} {'p99 write':>10}")
+    for mode in modes:
+        result = run_mode(mode, args.workers, args.duration, args.row_bytes)
+        if result['stored'] != result['written']:
+            print(f"⚠️  {mode}: {result['written']} writes reported, {result['stored']} rows stored")
+        print(
+            f"{mode:<13} {result['stored'] / result['wall']:>12,.0f} {result['stored']:>10,} {result['locked']:>8,} "
+            f"{result['p50_ms']:>8.3f}ms {result['p99_ms']:>8.3f}ms"
+        )
+    print("=" * 78)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,594 @@
+#!/usr/bin/env python3
+"""
+Benchmark Stripe webhook throughput through the Flask app
+
+Generates realistic, correctly signed Stripe events (checkout.session.completed,
+customer.subscription.*, invoice.*) with a test webhook secret and POSTs them
+through the Flask test client, so signature verification, routing and the
+handlers all run. Supabase and the Stripe API are replaced by in-memory
+stand-ins with optional simulated latency; nothing leaves the process.
+
+The run fails (exit status 1) as soon as a phase has a handler error, a
+rejected delivery or a query the stand-in does not support, even where
+the services catch and log it, so a benchmark of broken handlers never
+reports numbers.
+
+Two paths are measured:
+    sync    StripeService.handle_webhook inside the request
+    queued  the /stripe/webhook route: ack latency, then time to drain the
+            queue through the consumer pool
+
+For each event type (and a mixed workload) it reports events/sec and
+p50/p99 request latency.
+
+    cd backend
+    python benchmarks/bench_webhooks.py
+    python benchmarks/bench_webhooks.py --events 2000 --concurrency 8 --db-latency-ms 3
+"""
+
+import argparse
+import contextlib
+import hashlib
+import hmac
+import json
+import operator
+import os
+import random
+import statistics
+import sys
+import tempfile
+import threading
+import time
+import uuid
+
+BENCH_DIR = tempfile.mkdtemp(prefix='tubby-webhook-bench-')
+WEBHOOK_SECRET = 'whsec_bench_secret'
+PRICE_IDS = {'basic': 'price_bench_basic', 'pro': 'price_bench_pro', 'enterprise': 'price_bench_enterprise'}
+
+# Read at import time by the services, so set them first
+os.environ['STRIPE_SECRET_KEY'] = 'sk_test_bench'
+os.environ['STRIPE_WEBHOOK_SECRET'] = WEBHOOK_SECRET
+os.environ['USER_SERVICE_BACKEND'] = 'postgrest'
+os.environ['STRIPE_WEBHOOK_QUEUE_PATH'] = os.path.join(BENCH_DIR, 'stripe_webhooks.db')
+os.environ['STRIPE_PRICE_CATALOG_PATH'] = os.path.join(BENCH_DIR, 'stripe_prices.json')
+os.environ['SUBSCRIPTION_EVENT_SPILL_PATH'] = os.path.join(BENCH_DIR, 'subscription_events.jsonl')
+for plan, price_id in PRICE_IDS.items():
+    os.environ[f"STRIPE_{plan.upper()}_PRICE_ID"] = price_id
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import stripe
+from flask import Flask, jsonify, request
+
+from routes.stripe_webhooks import stripe_webhooks_bp
+from services import stripe_service as stripe_service_module
+
+EVENT_TYPES = (
+    'checkout.session.completed',
+    'customer.subscription.created',
+    'customer.subscription.updated',
+    'customer.subscription.deleted',
+    'invoice.payment_succeeded',
+    'invoice.payment_failed',
+)
+# Rough shape of a renewal-day burst
+MIXED_WEIGHTS = {
+    'invoice.payment_succeeded': 40,
+    'customer.subscription.updated': 35,
+    'invoice.payment_failed': 8,
+    'checkout.session.completed': 7,
+    'customer.subscription.created': 7,
+    'customer.subscription.deleted': 3,
+}
+
+
+# Errors seen by the stand-ins and handlers; any of them fails the run
+ERRORS = []
+
+
+class _Result:
+    def __init__(self, data):
+        self.data = data
+
+
+_COMPARISONS = {'eq': operator.eq, 'lt': operator.lt, 'lte': operator.le, 'gt': operator.gt, 'gte': operator.ge}
+
+
+def _compare(op, value):
+    """Predicate for `column <op> value`, numeric when both sides are numbers; NULL never matches"""
+    def predicate(v):
+        if v is None:
+            return False
+        try:
+            return op(float(v), float(value))
+        except (TypeError, ValueError):
+            return op(str(v), str(value))
+    return predicate
+
+
+class InMemoryQuery:
+    """The subset of the PostgREST query builder the services use"""
+
+    def __init__(self, db, table):
+        self.db = db
+        self.table = table
+        self.filters = []
+        self.equals = []
+        self.op = 'select'
+        self.payload = None
+        self.on_conflict = None
+        self.ignore_duplicates = False
+        self.max_rows = None
+        self.order_by = None
+        self._negate = False
+
+    def __getattr__(self, name):
+        if name.startswith('__'):
+            raise AttributeError(name)
+        # The services catch and log query errors, so record them here too
+        ERRORS.append(f"{self.table}: query builder method {name}() is not supported")
+        raise AttributeError(name)
+
+    def select(self, *columns, **kwargs):
+        self.op = 'select'
+        return self
+
+    def _filter(self, column, predicate):
+        if self._negate:
+            self._negate = False
+            self.filters.append((column, lambda value: not predicate(value)))
+        else:
+            self.filters.append((column, predicate))
+        return self
+
+    @property
+    def not_(self):
+        self._negate = True
+        return self
+
+    def eq(self, column, value):
+        if not self._negate:
+            self.equals.append((column, value))
+        return self._filter(column, lambda v: v is not None and str(v) == str(value))
+
+    def in_(self, column, values):
+        wanted = {str(v) for v in values}
+        return self._filter(column, lambda v: str(v) in wanted)
+
+    def gt(self, column, value):
+        return self._filter(column, lambda v: v is not None and str(v) > str(value))
+
+    def lte(self, column, value):
+        return self._filter(column, _compare(operator.le, value))
+
+    def is_(self, column, value):
+        return self._filter(column, lambda v: v is None)
+
+    def or_(self, filters):
+        """PostgREST or=(...) with column.is.null and column.eq/lt/lte/gt/gte.value clauses"""
+        clauses = []
+        for clause in filters.split(','):
+            column, op, value = clause.strip().split('.', 2)
+            if op == 'is' and value == 'null':
+                clauses.append((column, lambda v: v is None))
+            elif op in _COMPARISONS:
+                clauses.append((column, _compare(_COMPARISONS[op], value)))
+            else:
+                ERRORS.append(f"{self.table}: or_ clause {clause!r} is not supported")
+                raise ValueError(f"Unsupported or_ clause: {clause}")
+        self.filters.append((None, lambda row: any(predicate(row.get(column)) for column, predicate in clauses)))
+        return self
+
+    def order(self, column, desc=False):
+        self.order_by = (column, desc)
+        return self
+
+    def limit(self, count):
+        self.max_rows = count
+        return self
+
+    def insert(self, rows):
+        self.op, self.payload = 'insert', rows
+        return self
+
+    def upsert(self, rows, on_conflict='id', ignore_duplicates=False, **kwargs):
+        self.op, self.payload = 'upsert', rows
+        self.on_conflict = [c.strip() for c in on_conflict.split(',')]
+        self.ignore_duplicates = ignore_duplicates
+        return self
+
+    def update(self, values):
+        self.op, self.payload = 'update', values
+        return self
+
+    def delete(self):
+        self.op = 'delete'
+        return self
+
+    def _candidates(self):
+        # Equality filters go through a hash index, like an indexed column would
+        if self.equals:
+            column, value = self.equals[0]
+            return self.db.index(self.table, column).get(str(value), [])
+        return self.db.tables.setdefault(self.table, [])
+
+    def _matches(self, row):
+        # A filter without a column (or_) tests the whole row
+        return all(predicate(row) if column is None else predicate(row.get(column))
+                   for column, predicate in self.filters)
+
+    def execute(self):
+        if self.db.latency:
+            time.sleep(self.db.latency)
+        with self.db.lock:
+            if self.op == 'select':
+                found = [dict(row) for row in self._candidates() if self._matches(row)]
+                if self.order_by:
+                    column, desc = self.order_by
+                    found.sort(key=lambda row: str(row.get(column)), reverse=desc)
+                return _Result(found[:self.max_rows] if self.max_rows is not None else found)
+            if self.op == 'update':
+                changed = [row for row in self._candidates() if self._matches(row)]
+                for row in changed:
+                    row.update(self.payload)
+                self.db.drop_indexes(self.table, self.payload)
+                return _Result([dict(row) for row in changed])
+            if self.op == 'delete':
+                rows = self.db.tables.setdefault(self.table, [])
+                removed = [row for row in rows if self._matches(row)]
+                self.db.tables[self.table] = [row for row in rows if not self._matches(row)]
+                self.db.drop_indexes(self.table)
+                return _Result(removed)
+
+            written = []
+            for new in self.payload if isinstance(self.payload, list) else [self.payload]:
+                existing = None
+                if self.op == 'upsert':
+                    first, rest = self.on_conflict[0], self.on_conflict[1:]
+                    existing = next((row for row in self.db.index(self.table, first).get(str(new.get(first)), [])
+                                     if all(str(row.get(c)) == str(new.get(c)) for c in rest)), None)
+                if existing is not None:
+                    if not self.ignore_duplicates:
+                        existing.update(new)
+                        self.db.drop_indexes(self.table, new)
+                        written.append(dict(existing))
+                    continue
+                row = {'id': str(uuid.uuid4()), **new}
+                self.db.add_row(self.table, row)
+                written.append(dict(row))
+            return _Result(written)
+
+
+class InMemorySupabase:
+    """Stand-in for the Supabase client: tables are lists of dicts with lazy hash indexes"""
+
+    def __init__(self, latency_ms=0):
+        self.tables = {}
+        self.indexes = {}
+        self.lock = threading.Lock()
+        self.latency = latency_ms / 1000
+
+    def table(self, name):
+        return InMemoryQuery(self, name)
+
+    def index(self, table, column):
+        index = self.indexes.get((table, column))
+        if index is None:
+            index = {}
+            for row in self.tables.setdefault(table, []):
+                index.setdefault(str(row.get(column)), []).append(row)
+            self.indexes[(table, column)] = index
+        return index
+
+    def add_row(self, table, row):
+        self.tables.setdefault(table, []).append(row)
+        for (indexed_table, column), index in self.indexes.items():
+            if indexed_table == table:
+                index.setdefault(str(row.get(column)), []).append(row)
+
+    def drop_indexes(self, table, changed=None):
+        """Forget indexes on `table` whose column was rewritten (all if changed is None)"""
+        for key in [k for k in self.indexes if k[0] == table and (changed is None or k[1] in changed)]:
+            del self.indexes[key]
+
+
+class InMemoryStripeAPI(stripe.HTTPClient):
+    """Stripe HTTP client answering from memory; only prices are served"""
+
+    name = 'in-memory'
+
+    def __init__(self, latency_ms=0):
+        super().__init__()
+        self.latency = latency_ms / 1000
+        self.calls = 0
+
+    def request(self, method, url, headers, post_data=None):
+        self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+        if method == 'get' and '/v1/prices' in url:
+            prices = [{'id': price_id, 'object': 'price', 'active': True, 'lookup_key': plan,
+                       'metadata': {'plan': plan}, 'product': f"prod_bench_{plan}",
+                       'unit_amount': 1000, 'currency': 'usd', 'recurring': {'interval': 'month'}}
+                      for plan, price_id in PRICE_IDS.items()]
+            body = {'object': 'list', 'url': '/v1/prices', 'has_more': False, 'data': prices}
+            return json.dumps(body), 200, {}
+        body = {'error': {'type': 'invalid_request_error', 'message': f"Not stubbed: {method} {url}"}}
+        return json.dumps(body), 404, {}
+
+    def close(self):
+        pass
+
+
+def seed_users(db, count):
+    """Users with Stripe customers; returns [(user_id, customer_id)]"""
+    users = []
+    rows = db.tables.setdefault('users', [])
+    for i in range(count):
+        user_id = str(uuid.uuid4())
+        customer_id = f"cus_bench{i:06d}"
+        rows.append({
+            'id': user_id, 'supabase_id': str(uuid.uuid4()), 'email': f"user{i}@bench.local",
+            'name': f"User {i}", 'stripe_customer_id': customer_id,
+            'subscription_status': 'active', 'subscription_plan': 'basic'
+        })
+        users.append((user_id, customer_id))
+    return users
+
+
+class EventFactory:
+    """Realistic Stripe event payloads for the seeded users"""
+
+    def __init__(self, users):
+        self.users = users
+        # Monotonic `created` so subscription.updated is never seen as stale
+        self._clock = int(time.time())
+        self._lock = threading.Lock()
+
+    def _created(self):
+        with self._lock:
+            self._clock += 1
+            return self._clock
+
+    def _subscription(self, customer_id, status='active', plan='pro'):
+        now = int(time.time())
+        price_id = PRICE_IDS[plan]
+        return {
+            'id': f"sub_bench{customer_id[9:]}",
+            'object': 'subscription',
+            'customer': customer_id,
+            'status': status,
+            'cancel_at_period_end': False,
+            'canceled_at': now if status == 'canceled' else None,
+            'current_period_start': now,
+            'current_period_end': now + 30 * 86400,
+            'trial_end': None,
+            'items': {'object': 'list', 'data': [{
+                'id': f"si_{uuid.uuid4().hex[:14]}",
+                'object': 'subscription_item',
+                'price': {'id': price_id, 'object': 'price', 'unit_amount': 2000,
+                          'currency': 'usd', 'recurring': {'interval': 'month'}},
+                'quantity': 1
+            }]},
+            'metadata': {}
+        }
+
+    def _invoice(self, customer_id, paid):
+        return {
+            'id': f"in_{uuid.uuid4().hex[:14]}",
+            'object': 'invoice',
+            'customer': customer_id,
+            'subscription': f"sub_bench{customer_id[9:]}",
+            'amount_due': 2000,
+            'amount_paid': 2000 if paid else 0,
+            'currency': 'usd',
+            'status': 'paid' if paid else 'open',
+            'billing_reason': 'subscription_cycle'
+        }
+
+    def event(self, event_type):
+        user_id, customer_id = random.choice(self.users)
+        if event_type == 'checkout.session.completed':
+            obj = {
+                'id': f"cs_test_{uuid.uuid4().hex}",
+                'object': 'checkout.session',
+                'customer': customer_id,
+                'subscription': f"sub_bench{customer_id[9:]}",
+                'mode': 'subscription',
+                'payment_status': 'paid',
+                'metadata': {'user_id': user_id, 'plan_type': random.choice(list(PRICE_IDS))}
+            }
+        elif event_type == 'customer.subscription.deleted':
+            obj = self._subscription(customer_id, status='canceled')
+        elif event_type.startswith('customer.subscription.'):
+            obj = self._subscription(customer_id, plan=random.choice(list(PRICE_IDS)))
+        else:
+            obj = self._invoice(customer_id, paid=event_type == 'invoice.payment_succeeded')
+
+        return {
+            'id': f"evt_{uuid.uuid4().hex[:24]}",
+            'object': 'event',
+            'api_version': '2023-10-16',
+            'created': self._created(),
+            'livemode': False,
+            'pending_webhooks': 1,
+            'request': {'id': None, 'idempotency_key': None},
+            'type': event_type,
+            'data': {'object': obj}
+        }
+
+
+def sign(payload, secret=WEBHOOK_SECRET):
+    """Stripe-Signature header for payload, as Stripe computes it"""
+    timestamp = int(time.time())
+    signed = f"{timestamp}.{payload}".encode('utf-8')
+    signature = hmac.new(secret.encode('utf-8'), signed, hashlib.sha256).hexdigest()
+    return f"t={timestamp},v1={signature}"
+
+
+def build_app(service):
+    app = Flask(__name__)
+    app.register_blueprint(stripe_webhooks_bp)
+
+    @app.route('/bench/webhook/sync', methods=['POST'])
+    def webhook_sync():
+        if service.handle_webhook(request.get_data(), request.headers.get('Stripe-Signature')):
+            return jsonify({'received': True}), 200
+        return jsonify({'error': 'Invalid webhook'}), 400
+
+    return app
+
+
+def run_phase(app, path, events, concurrency):
+    """POST pre-signed events from `concurrency` threads; returns (wall seconds, {type: [ms]}, rejected)"""
+    work = list(events)
+    work_lock = threading.Lock()
+    samples = {}
+    failures = []
+
+    def worker():
+        client = app.test_client()
+        while True:
+            with work_lock:
+                if not work:
+                    return
+                event_type, payload, signature = work.pop()
+            start = time.perf_counter()
+            response = client.post(path, data=payload, headers={
+                'Stripe-Signature': signature, 'Content-Type': 'application/json'
+            })
+            elapsed = (time.perf_counter() - start) * 1000
+            with work_lock:
+                samples.setdefault(event_type, []).append(elapsed)
+                if response.status_code != 200:
+                    failures.append(event_type)
+
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return time.perf_counter() - start, samples, len(failures)
+
+
+def wait_for_drain(service, timeout):
+    """Seconds until the webhook queue has nothing pending or in flight; None if no queue was created"""
+    if service.webhook_queue is None:
+        # Created by the first accepted event: every delivery was rejected
+        return None
+    start = time.perf_counter()
+    while time.perf_counter() - start < timeout:
+        if ERRORS:
+            # Failed events are retried with backoff; there is nothing to wait for
+            return time.perf_counter() - start
+        stats = service.webhook_queue.stats()
+        if not stats.get('pending') and not stats.get('processing'):
+            return time.perf_counter() - start
+        time.sleep(0.01)
+    print("⚠️  Queue did not drain before the timeout")
+    return time.perf_counter() - start
+
+
+def record_handler_errors(process_event):
+    """Wrap StripeService.process_event so handler exceptions are recorded, then re-raised"""
+    def run(event):
+        try:
+            return process_event(event)
+        except Exception as e:
+            ERRORS.append(f"{event['type']} {event['id']}: {e!r}")
+            raise
+    return run
+
+
+def fail_on_errors(label, rejected=0):
+    """Exit with status 1 if the phase had errors or rejected deliveries"""
+    if not ERRORS and not rejected:
+        return
+    print(f"❌ {label}: {len(ERRORS)} errors, {rejected} rejected deliveries")
+    for error in ERRORS[:10]:
+        print(f"   {error}")
+    sys.exit(1)
+
+
+def report(label, count, seconds, samples=None):
+    line = f"{label:<34} {count / seconds:9.1f} ev/s"
+    if samples:
+        all_samples = [s for values in samples.values() for s in values]
+        cuts = statistics.quantiles(all_samples, n=100) if len(all_samples) > 1 else all_samples * 99
+        line += f"   p50 {cuts[49]:8.3f} ms   p99 {cuts[98]:8.3f} ms"
+    print(line)
+
+
+def signed_events(factory, event_types, count):
+    events = []
+    for _ in range(count):
+        event_type = random.choice(event_types)
+        payload = json.dumps(factory.event(event_type))
+        events.append((event_type, payload, sign(payload)))
+    return events
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--events', type=int, default=1000, help="Events per phase")
+    parser.add_argument('--concurrency', type=int, default=4, help="Concurrent webhook deliveries")
+    parser.add_argument('--users', type=int, default=5000)
+    parser.add_argument('--db-latency-ms', type=float, default=0, help="Simulated Supabase round trip")
+    parser.add_argument('--stripe-latency-ms', type=float, default=0, help="Simulated Stripe API round trip")
+    parser.add_argument('--mode', choices=('sync', 'queued', 'both'), default='both')
+    parser.add_argument('--verbose', action='store_true', help="Keep the handlers' log output")
+    args = parser.parse_args()
+
+    db = InMemorySupabase(args.db_latency_ms)
+    users = seed_users(db, args.users)
+    factory = EventFactory(users)
+
+    quiet = open(os.devnull, 'w')
+    with contextlib.redirect_stdout(sys.stdout if args.verbose else quiet):
+        service = stripe_service_module.StripeService()
+        service.user_service.supabase = db
+        service.process_event = record_handler_errors(service.process_event)
+        stripe.default_http_client = InMemoryStripeAPI(args.stripe_latency_ms)
+        stripe_service_module._stripe_service = service
+    app = build_app(service)
+
+    mixed_types = [t for t, weight in MIXED_WEIGHTS.items() for _ in range(weight)]
+    phases = [(event_type, [event_type]) for event_type in EVENT_TYPES] + [('mixed', mixed_types)]
+
+    print(f"🔧 {args.users} users, {args.events} events per phase, concurrency {args.concurrency}, "
+          f"db latency {args.db_latency_ms} ms, stripe latency {args.stripe_latency_ms} ms")
+
+    if args.mode in ('sync', 'both'):
+        print("=" * 80)
+        print("sync: handle_webhook in the request")
+        for label, event_types in phases:
+            events = signed_events(factory, event_types, args.events)
+            with contextlib.redirect_stdout(sys.stdout if args.verbose else quiet):
+                wall, samples, rejected = run_phase(app, '/bench/webhook/sync', events, args.concurrency)
+            fail_on_errors(label, rejected)
+            report(label, len(events), wall, samples)
+
+    if args.mode in ('queued', 'both'):
+        print("=" * 80)
+        print("queued: /stripe/webhook ack, then consumer drain (end-to-end ev/s)")
+        for label, event_types in phases:
+            events = signed_events(factory, event_types, args.events)
+            with contextlib.redirect_stdout(sys.stdout if args.verbose else quiet):
+                wall, samples, rejected = run_phase(app, '/stripe/webhook', events, args.concurrency)
+                drain = wait_for_drain(service, timeout=300)
+            fail_on_errors(label, rejected)
+            report(f"{label} (ack)", len(events), wall, samples)
+            report(f"{label} (end-to-end)", len(events), wall + drain)
+        with contextlib.redirect_stdout(quiet):
+            service.stop_webhook_consumers()
+
+    service.event_log.flush()
+    print("=" * 80)
+    print(f"Stripe API calls: {stripe.default_http_client.calls}   "
+          f"subscription_events rows: {len(db.tables.get('subscription_events', []))}   "
+          f"stripe_subscriptions rows: {len(db.tables.get('stripe_subscriptions', []))}")
+
+
+if __name__ == '__main__':
+    main()
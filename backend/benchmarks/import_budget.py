@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+"""
+Import-time report for backend entry modules, checked against a budget
+
+Imports each module in a fresh interpreter with `python -X importtime`,
+reports the median cumulative import time and its heaviest direct
+dependencies, and fails if a module is over its budget or pulls in a
+heavy SDK that must only load on first use (stripe, supabase, docker,
+the Google auth libraries, cryptography, psycopg).
+
+    cd backend
+    python benchmarks/import_budget.py
+    python benchmarks/import_budget.py --runs 7 --top 10
+    python benchmarks/import_budget.py --module services.user_service --budget-ms 50
+
+Exit status is 1 if any check fails, so it can gate CI.
+"""
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Entry modules and their cumulative import budget in milliseconds
+BUDGETS_MS = {
+    'config': 40,
+    'services.cache': 10,
+    'services.user_service': 40,
+    'services.oauth_service': 120,
+    'supabase_client': 60,
+    'routes.stripe_webhooks': 250,
+}
+
+# Top-level packages that must not be imported as a side effect of importing
+# an entry module; they are imported where the client is first constructed
+LAZY_PACKAGES = {
+    'stripe', 'supabase', 'postgrest', 'gotrue', 'storage3', 'realtime',
+    'docker', 'google_auth_oauthlib', 'googleapiclient', 'cryptography',
+    'psycopg', 'psycopg_pool',
+}
+
+
+def import_profile(module):
+    """[(depth, name, self_us, cumulative_us)] for `import module`, or raises with stderr"""
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f"import {module}"],
+        cwd=BACKEND_DIR, capture_output=True, text=True,
+        env={**os.environ, 'PYTHONDONTWRITEBYTECODE': '1'}
+    )
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1] if result.stderr.strip() else 'import failed')
+
+    entries = []
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|', 2)
+        name = name[1:]
+        depth = (len(name) - len(name.lstrip(' '))) // 2
+        entries.append((depth, name.strip(), int(self_us), int(cumulative_us)))
+    return entries
+
+
+def module_subtree(entries, module):
+    """Entries imported on behalf of `module` (children print before their parent)"""
+    group = []
+    for entry in entries:
+        group.append(entry)
+        if entry[0] == 0:
+            if entry[1] == module:
+                return group
+            group = []
+    return []
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--module', action='append', help="Entry module to check (repeatable; default: all)")
+    parser.add_argument('--budget-ms', type=float, help="Override the budget for every checked module")
+    parser.add_argument('--runs', type=int, default=5, help="Fresh interpreters per module; the median is used")
+    parser.add_argument('--top', type=int, default=5, help="Heaviest direct dependencies to list")
+    args = parser.parse_args()
+
+    modules = args.module or list(BUDGETS_MS)
+    failures = 0
+    print(f"{'module':<28} {'median':>9} {'budget':>9}")
+    print("=" * 60)
+
+    for module in modules:
+        budget = args.budget_ms if args.budget_ms is not None else BUDGETS_MS.get(module, 100)
+        try:
+            runs = [module_subtree(import_profile(module), module) for _ in range(args.runs)]
+        except RuntimeError as e:
+            print(f"{module:<28} ❌ import failed: {e}")
+            failures += 1
+            continue
+
+        median_ms = statistics.median(run[-1][3] for run in runs if run) / 1000
+        ok = median_ms <= budget
+        print(f"{module:<28} {median_ms:7.1f}ms {budget:7.0f}ms  {'✅' if ok else '❌ over budget'}")
+
+        subtree = runs[-1]
+        children = sorted((e for e in subtree if e[0] == 1), key=lambda e: e[3], reverse=True)
+        for _, name, _, cumulative_us in children[:args.top]:
+            print(f"    {name:<36} {cumulative_us / 1000:7.1f}ms")
+
+        eager = sorted({e[1].split('.')[0] for e in subtree} & LAZY_PACKAGES)
+        if eager:
+            print(f"    ❌ imports {', '.join(eager)} eagerly; import it where it is first used")
+        if not ok or eager:
+            failures += 1
+
+    print("=" * 60)
+    print("✅ Import budget met" if not failures else f"❌ {failures} module(s) failed the import budget")
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
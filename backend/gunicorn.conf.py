@@ -63,6 +63,12 @@ def pre_fork(server, worker):
 
 def post_fork(server, worker):
     server.log.info("Worker spawned (pid: %s)", worker.pid)
+    # Never reuse Supabase clients (and their connection pools) built in the master
+    try:
+        from services.supabase_clients import reset_clients
+        reset_clients()
+    except ImportError:
+        pass
 
 def post_worker_init(worker):
     worker.log.info("Worker initialized (pid: %s)", worker.pid)
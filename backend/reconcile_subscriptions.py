@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+"""
+Reconcile users.subscription_* columns with Stripe
+
+Streams every subscription from Stripe (auto-pagination), compares the
+effective subscription of each customer with a bulk-loaded snapshot of
+users keyed by stripe_customer_id, and writes only the differences back
+in batched upserts. Dry run by default; pass --apply to write.
+
+    cd backend
+    python reconcile_subscriptions.py              # report only
+    python reconcile_subscriptions.py --apply
+"""
+
+import argparse
+import sys
+import time
+from collections import Counter
+from datetime import datetime, timezone
+
+import stripe
+
+from services.stripe_service import StripeService
+from services.subscription_state import ACTIVE_STATUSES, status_from_subscription
+
+SNAPSHOT_COLUMNS = (
+    'id, supabase_id, email, stripe_customer_id, subscription_status, subscription_plan, '
+    'subscription_id, subscription_period_end, subscription_cancel_at_period_end'
+)
+
+
+def load_users_snapshot(user_service, page_size):
+    """stripe_customer_id -> [user rows], holding only the compared columns"""
+    users = {}
+    for user in user_service.iter_users_with_customer_ids(SNAPSHOT_COLUMNS, page_size):
+        users.setdefault(user['stripe_customer_id'], []).append(user)
+    return users
+
+
+def effective_subscriptions(plan_for_price):
+    """customer id -> status dict of the subscription get_subscription_status would pick.
+
+    Stripe lists newest first, so the first subscription seen for a customer
+    wins unless a later (older) one is active and the current pick is not.
+    Only the small status dict is kept per customer.
+    """
+    picked = {}
+    scanned = 0
+    for subscription in stripe.Subscription.list(status='all', limit=100).auto_paging_iter():
+        scanned += 1
+        customer_id = subscription.get('customer')
+        current = picked.get(customer_id)
+        if current is None or (current['status'] not in ACTIVE_STATUSES
+                               and subscription.get('status') in ACTIVE_STATUSES):
+            picked[customer_id] = status_from_subscription(subscription, plan_for_price)
+        if scanned % 10000 == 0:
+            print(f"  ... {scanned} subscriptions streamed")
+    return picked, scanned
+
+
+def desired_columns(status):
+    """users.subscription_* values for a status dict, matching the webhook handlers"""
+    if status['status'] in ACTIVE_STATUSES:
+        period_end = status.get('current_period_end')
+        return {
+            'subscription_status': status['status'],
+            'subscription_plan': status['plan'],
+            'subscription_id': status['subscription_id'],
+            'subscription_period_end': (
+                datetime.fromtimestamp(period_end, tz=timezone.utc).isoformat() if period_end else None
+            ),
+            'subscription_cancel_at_period_end': bool(status.get('cancel_at_period_end'))
+        }
+    return {
+        'subscription_status': 'cancelled' if status['status'] == 'canceled' else status['status'],
+        'subscription_plan': 'free',
+        'subscription_id': None,
+        'subscription_period_end': None,
+        'subscription_cancel_at_period_end': False
+    }
+
+
+def _same(field, current, desired):
+    if field == 'subscription_period_end':
+        # Compare instants; the column may come back in another offset/format
+        if not current or not desired:
+            return not current and not desired
+        return datetime.fromisoformat(current).timestamp() == datetime.fromisoformat(desired).timestamp()
+    if field == 'subscription_cancel_at_period_end':
+        return bool(current) == bool(desired)
+    return current == desired
+
+
+def no_subscription_columns(user):
+    """users.subscription_* values for a customer with no subscription in Stripe at all"""
+    desired = desired_columns({'status': 'canceled'})
+    if user.get('subscription_status') not in ACTIVE_STATUSES:
+        # Never subscribed (e.g. an abandoned checkout) or already ended: keep its status
+        desired.pop('subscription_status')
+    return desired
+
+
+def diff_users(users, picked):
+    """Yield (user, changes) for users whose columns differ from Stripe.
+
+    Users whose customer has no subscription in Stripe are included, so a
+    subscription deleted without its webhook still moves them to free.
+    """
+    for customer_id, customer_users in users.items():
+        status = picked.get(customer_id)
+        for user in customer_users:
+            desired = desired_columns(status) if status else no_subscription_columns(user)
+            changes = {
+                field: value for field, value in desired.items()
+                if not _same(field, user.get(field), value)
+            }
+            if changes:
+                yield user, changes
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--apply', action='store_true', help="Write the differences (default: dry run)")
+    parser.add_argument('--batch-size', type=int, default=500)
+    parser.add_argument('--sample', type=int, default=20, help="Differences to print in the report")
+    args = parser.parse_args()
+
+    started = time.time()
+    stripe_service = StripeService()
+    user_service = stripe_service.user_service
+
+    print("📥 Loading users snapshot...")
+    users = load_users_snapshot(user_service, args.batch_size)
+    print(f"✅ {sum(len(v) for v in users.values())} users across {len(users)} Stripe customers")
+
+    print("📡 Streaming subscriptions from Stripe...")
+    picked, scanned = effective_subscriptions(stripe_service._get_plan_name_from_price_id)
+    print(f"✅ {scanned} subscriptions across {len(picked)} customers")
+
+    updates = []
+    field_counts = Counter()
+    for user, changes in diff_users(users, picked):
+        field_counts.update(changes.keys())
+        if len(updates) < args.sample:
+            print(f"  {user['email']} ({user['stripe_customer_id']}): "
+                  + ", ".join(f"{k}: {user.get(k)!r} -> {v!r}" for k, v in changes.items()))
+        # supabase_id and email satisfy NOT NULL on the insert half of the upsert
+        updates.append({'id': user['id'], 'supabase_id': user['supabase_id'],
+                        'email': user['email'], **changes})
+
+    orphaned = sum(1 for customer_id in picked if customer_id not in users)
+    unsubscribed = sum(len(v) for customer_id, v in users.items() if customer_id not in picked)
+
+    print("=" * 60)
+    print("📊 RECONCILIATION REPORT")
+    print(f"Users to update:              {len(updates)}")
+    for field, count in field_counts.most_common():
+        print(f"  {field:<34} {count}")
+    print(f"Stripe customers without user: {orphaned}")
+    print(f"Users without a subscription:  {unsubscribed}")
+
+    if not args.apply:
+        print("\n🔍 Dry run – nothing written. Re-run with --apply to update.")
+    elif updates:
+        print(f"\n✍️  Applying {len(updates)} updates in batches of {args.batch_size}...")
+        written = user_service.bulk_upsert_users(updates, on_conflict='id', batch_size=args.batch_size)
+        print(f"✅ Updated {len(written)} users")
+
+    for endpoint, stats in stripe_service.get_api_metrics().items():
+        print(f"  {endpoint}: {stats}")
+    print(f"⏱️  Finished in {time.time() - started:.1f}s")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+"""
+Re-encrypt every api_keys row under the primary ENCRYPTION_KEY
+
+Key rotation:
+    1. Prepend a new Fernet key: ENCRYPTION_KEY=<new>,<old> and deploy.
+       Old and new tokens both decrypt, new saves use the new key.
+    2. Run this job. It streams api_keys in keyset-paginated pages,
+       re-encrypts them in worker processes and writes each page back
+       with one call to the rotate_api_key_batch SQL function
+       (database/schema.sql). Where that function is not installed, the
+       rows are written by a bounded pool of threads instead.
+    3. When it reports no rows left under old keys, drop the old key.
+
+Online reads are never blocked: every token stays decryptable throughout,
+and a row saved by a user while the job runs is left alone (each write
+only applies if the row still holds the ciphertext that was read).
+
+    cd backend
+    python rotate_api_keys.py --dry-run
+    python rotate_api_keys.py --workers 4
+"""
+
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+
+from cryptography.fernet import Fernet, InvalidToken, MultiFernet
+
+from services.supabase_clients import get_service_client
+from supabase_client import encryption_keys_from_env
+
+ROTATE_BATCH_FUNCTION = 'rotate_api_key_batch'
+
+# Set per worker process by _init_worker
+_primary = None
+_cipher = None
+# Cleared when the batch function is missing; rows are then updated one by one
+_batch_function_available = True
+
+
+def _init_worker(keys):
+    global _primary, _cipher
+    _primary = Fernet(keys[0])
+    _cipher = MultiFernet([Fernet(key) for key in keys])
+
+
+def reencrypt_page(rows):
+    """Returns ([(row, rotated_token)], already_current, [undecryptable ids])"""
+    rotated, current, failed = [], 0, []
+    for row in rows:
+        token = row['encrypted_key'].encode()
+        try:
+            _primary.decrypt(token)
+            current += 1
+            continue
+        except InvalidToken:
+            pass
+        try:
+            rotated.append((row, _cipher.rotate(token).decode()))
+        except InvalidToken:
+            failed.append(row['id'])
+    return rotated, current, failed
+
+
+def iter_pages(client, page_size):
+    """api_keys rows in pages ordered by id; one page in memory at a time"""
+    last_id = None
+    while True:
+        query = client.table('api_keys').select('id, user_id, service, encrypted_key')
+        if last_id is not None:
+            query = query.gt('id', last_id)
+        rows = query.order('id').limit(page_size).execute().data
+        if not rows:
+            return
+        yield rows
+        if len(rows) < page_size:
+            return
+        last_id = rows[-1]['id']
+
+
+def write_back(client, rotated, threads=8):
+    """Write rotated tokens for rows nobody changed since they were read; returns (written, skipped)
+
+    Each update is conditioned on the ciphertext that was read, so a row a
+    user saves between the read and the write keeps their new key. The
+    page goes in a single rotate_api_key_batch call; without that function
+    the rows are updated by up to `threads` concurrent requests.
+    """
+    global _batch_function_available
+    if not rotated:
+        return 0, 0
+    if _batch_function_available:
+        rotations = [{'id': row['id'], 'old_key': row['encrypted_key'], 'new_key': token}
+                     for row, token in rotated]
+        try:
+            result = client.rpc(ROTATE_BATCH_FUNCTION, {'rotations': rotations}).execute()
+            written = len(result.data or [])
+            return written, len(rotated) - written
+        except Exception as e:
+            # PGRST202: PostgREST knows no such function (schema not applied)
+            if getattr(e, 'code', None) != 'PGRST202':
+                raise
+            print(f"⚠️  {ROTATE_BATCH_FUNCTION} is not installed, updating rows individually")
+            _batch_function_available = False
+
+    def update(item):
+        row, token = item
+        result = client.table('api_keys').update({'encrypted_key': token}).eq(
+            'id', row['id']
+        ).eq('encrypted_key', row['encrypted_key']).execute()
+        return bool(result.data)
+
+    with ThreadPoolExecutor(max_workers=max(1, threads)) as pool:
+        written = sum(pool.map(update, rotated))
+    return written, len(rotated) - written
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 2)
+    parser.add_argument('--page-size', type=int, default=500)
+    parser.add_argument('--write-threads', type=int, default=8,
+                        help="Concurrent row updates when rotate_api_key_batch is not installed")
+    parser.add_argument('--dry-run', action='store_true', help="Count rows to rotate without writing")
+    args = parser.parse_args()
+
+    keys = encryption_keys_from_env()
+    if not keys:
+        print("❌ ENCRYPTION_KEY is not set")
+        return 1
+    if len(keys) == 1:
+        print("ℹ️  Only one key configured – rows not under it cannot be decrypted, only counted")
+
+    client = get_service_client()
+    if not client:
+        print("❌ Supabase service client unavailable")
+        return 1
+
+    started = time.time()
+    totals = {'scanned': 0, 'current': 0, 'rotated': 0, 'skipped': 0, 'failed': 0}
+    # Pages submitted but not yet written; bounds memory to a few pages
+    max_in_flight = args.workers * 2
+
+    def collect(future, page_len):
+        rotated, current, failed = future.result()
+        totals['scanned'] += page_len
+        totals['current'] += current
+        totals['failed'] += len(failed)
+        if failed:
+            print(f"⚠️  {len(failed)} rows undecryptable with any configured key, e.g. {failed[0]}")
+        if args.dry_run:
+            totals['rotated'] += len(rotated)
+        else:
+            written, skipped = write_back(client, rotated, args.write_threads)
+            totals['rotated'] += written
+            totals['skipped'] += skipped
+
+    print(f"🔐 Re-encrypting api_keys with {args.workers} workers ({len(keys)} keys configured)")
+    with ProcessPoolExecutor(max_workers=args.workers, initializer=_init_worker, initargs=(keys,)) as pool:
+        pending = {}
+        for page in iter_pages(client, args.page_size):
+            pending[pool.submit(reencrypt_page, page)] = len(page)
+            if len(pending) >= max_in_flight:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    collect(future, pending.pop(future))
+                print(f"  ... {totals['scanned']} rows scanned, {totals['rotated']} rotated")
+        for future in list(pending):
+            collect(future, pending.pop(future))
+
+    print("=" * 60)
+    print("📊 ROTATION REPORT" + (" (dry run)" if args.dry_run else ""))
+    rows = [
+        ('Rows scanned:', totals['scanned']),
+        ('Already under the primary key:', totals['current']),
+        ('To rotate:' if args.dry_run else 'Rotated:', totals['rotated']),
+        ('Changed concurrently (skipped):', totals['skipped']),
+        ('Undecryptable:', totals['failed']),
+    ]
+    for label, count in rows:
+        print(f"{label:<33}{count}")
+    print(f"⏱️  Finished in {time.time() - started:.1f}s")
+    return 0 if not totals['failed'] else 2
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,15 @@
+def register_blueprints(app, url_prefix='/api'):
+    """Mount the backend blueprints on the Flask app that serves /api.
+
+    Blueprints are imported here rather than at package import, so
+    `import routes.stripe_webhooks` stays cheap.
+    """
+    from routes.preferences import preferences_bp
+    from routes.stripe_webhooks import stripe_webhooks_bp
+    from routes.uploads import uploads_bp
+
+    # Stripe is configured to post to /stripe/webhook, outside the API prefix
+    app.register_blueprint(stripe_webhooks_bp)
+    app.register_blueprint(uploads_bp, url_prefix=url_prefix)
+    app.register_blueprint(preferences_bp, url_prefix=url_prefix)
+    return app
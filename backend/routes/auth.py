@@ -0,0 +1,56 @@
+from functools import wraps
+
+from flask import jsonify, request
+
+from services.oauth_service import get_oauth_service
+
+
+def current_user_id():
+    """Supabase auth uid (users.supabase_id) of the request's verified Bearer token, or None.
+
+    Accepts the app's own signed JWT or a Supabase access token that
+    Supabase Auth verifies; anything else is unauthenticated. Every token
+    maps to the auth uid, the id the `auth.uid() = user_id` RLS policies use.
+    """
+    auth_header = request.headers.get('Authorization', '')
+    if not auth_header.startswith('Bearer '):
+        return None
+    token = auth_header[len('Bearer '):].strip()
+    if not token:
+        return None
+
+    oauth_service = get_oauth_service()
+    # Without JWT_SECRET_KEY the app issues no tokens of its own
+    payload = oauth_service.verify_jwt_token(token) if oauth_service.jwt_secret else None
+    if payload and payload.get('user_id'):
+        return _auth_uid_for_app_user(payload['user_id'])
+    user = oauth_service.verify_supabase_access_token(token)
+    return str(user['id']) if user and user.get('id') else None
+
+
+def _auth_uid_for_app_user(user_id):
+    # App JWTs carry users.id; translate it to the auth uid
+    user = _get_user_service().get_user_by_id(user_id)
+    return str(user['supabase_id']) if user and user.get('supabase_id') else None
+
+
+# Global instance - lazy loaded
+_user_service = None
+
+def _get_user_service():
+    global _user_service
+    if _user_service is None:
+        from services.user_service import UserService
+        _user_service = UserService()
+    return _user_service
+
+
+def require_user(view):
+    """Route decorator: 401 unless current_user_id() resolves; passes it as the first argument"""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        user_id = current_user_id()
+        if not user_id:
+            return jsonify({'error': 'Not authenticated'}), 401
+        return view(user_id, *args, **kwargs)
+    return wrapper
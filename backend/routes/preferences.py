@@ -0,0 +1,96 @@
+import hashlib
+
+from flask import Blueprint, Response, jsonify, request
+
+from routes.auth import require_user
+from services.preferences_service import (
+    PreferencesConflict, PreferencesError, get_preferences_service
+)
+
+preferences_bp = Blueprint('preferences', __name__)
+
+
+def _user_tag(user_id):
+    # Keeps a browser from revalidating one account's copy for another
+    return hashlib.sha256(str(user_id).encode()).hexdigest()[:16]
+
+
+def preferences_etag(user_id, version):
+    """Strong ETag for one version of one user's preferences"""
+    return f"{_user_tag(user_id)}.{version}"
+
+
+def _version_from_etag(user_id, etag):
+    user_tag, _, version = etag.partition('.')
+    if user_tag != _user_tag(user_id) or not version.isdigit():
+        return None
+    return int(version)
+
+
+def _preferences_response(preferences, user_id, version, status=200):
+    response = jsonify({'preferences': preferences, 'version': version})
+    response.status_code = status
+    response.set_etag(preferences_etag(user_id, version))
+    # Browsers keep the copy but revalidate each load, which costs one 304
+    response.headers['Cache-Control'] = 'private, no-cache'
+    response.vary.add('Authorization')
+    return response
+
+
+def _not_modified(user_id, version):
+    response = Response(status=304)
+    response.set_etag(preferences_etag(user_id, version))
+    response.headers['Cache-Control'] = 'private, no-cache'
+    response.vary.add('Authorization')
+    return response
+
+
+@preferences_bp.route('/preferences', methods=['GET'])
+@require_user
+def get_preferences(user_id):
+    """Current user's preferences; 304 if If-None-Match has the current version"""
+    service = get_preferences_service()
+    # Revalidation from the cache alone, no database query
+    version = service.cached_version(user_id)
+    if version is not None and request.if_none_match.contains(preferences_etag(user_id, version)):
+        return _not_modified(user_id, version)
+
+    try:
+        preferences, version = service.get_preferences(user_id)
+    except Exception as e:
+        print(f"❌ Error loading preferences for {user_id}: {e}")
+        return jsonify({'error': 'Could not load preferences'}), 500
+    if request.if_none_match.contains(preferences_etag(user_id, version)):
+        return _not_modified(user_id, version)
+    return _preferences_response(preferences, user_id, version)
+
+
+@preferences_bp.route('/preferences', methods=['PUT', 'PATCH'])
+@require_user
+def update_preferences(user_id):
+    """Update some or all preferences; If-Match makes the write conditional"""
+    changes = request.get_json(silent=True)
+    if not isinstance(changes, dict) or not changes:
+        return jsonify({'error': 'Expected a JSON object of preferences'}), 400
+
+    expected_version = None
+    if request.if_match:
+        tags = list(request.if_match.as_set())
+        expected_version = _version_from_etag(user_id, tags[0]) if len(tags) == 1 else None
+        if expected_version is None:
+            return jsonify({'error': 'If-Match does not match these preferences'}), 412
+
+    service = get_preferences_service()
+    try:
+        preferences, version = service.update_preferences(user_id, changes, expected_version)
+    except PreferencesError as e:
+        return jsonify({'error': str(e)}), 400
+    except PreferencesConflict as e:
+        response = jsonify({'error': str(e), 'version': e.current_version})
+        response.status_code = 412
+        response.set_etag(preferences_etag(user_id, e.current_version))
+        return response
+    except Exception as e:
+        print(f"❌ Error saving preferences for {user_id}: {e}")
+        return jsonify({'error': 'Could not save preferences'}), 500
+    return _preferences_response(preferences, user_id, version)
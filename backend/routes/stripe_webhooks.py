@@ -0,0 +1,16 @@
+from flask import Blueprint, jsonify, request
+
+stripe_webhooks_bp = Blueprint('stripe_webhooks', __name__)
+
+@stripe_webhooks_bp.route('/stripe/webhook', methods=['POST'])
+def stripe_webhook():
+    """Verify, persist and acknowledge a Stripe webhook; handlers run in the background"""
+    # Stripe SDK and the service stack load on the first webhook, not at boot
+    from services.stripe_service import get_stripe_service
+    
+    payload = request.get_data()
+    sig_header = request.headers.get('Stripe-Signature')
+
+    if get_stripe_service().enqueue_webhook(payload, sig_header):
+        return jsonify({'received': True}), 200
+    return jsonify({'error': 'Invalid webhook'}), 400
@@ -0,0 +1,87 @@
+from flask import Blueprint, jsonify, request
+
+from routes.auth import require_user
+from services.upload_service import UploadError, get_upload_service
+from services.upload_storage import PartTooLarge, StorageError
+
+uploads_bp = Blueprint('uploads', __name__)
+
+# Resumable upload protocol:
+#   POST   /uploads                          {file_name, file_type?, file_size?} -> {upload_id, chunk_size, ...}
+#   PUT    /uploads/<upload_id>/parts/<n>    raw part bytes (n = 1, 2, ...; re-send to retry)
+#   GET    /uploads/<upload_id>              received parts, to resume after an interruption
+#   POST   /uploads/<upload_id>/complete     {sha256?} -> the uploaded_files row
+#   DELETE /uploads/<upload_id>              abort
+
+
+@uploads_bp.route('/uploads', methods=['POST'])
+@require_user
+def start_upload(user_id):
+    """Start a resumable upload"""
+    data = request.get_json(silent=True) or {}
+    try:
+        upload = get_upload_service().start_upload(
+            user_id, data.get('file_name'), data.get('file_type'), data.get('file_size')
+        )
+    except UploadError as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify(upload), 201
+
+
+@uploads_bp.route('/uploads/<upload_id>', methods=['GET'])
+@require_user
+def get_upload(user_id, upload_id):
+    """Upload status with the parts received so far"""
+    try:
+        upload = get_upload_service().get_upload(user_id, upload_id)
+    except StorageError as e:
+        return jsonify({'error': str(e)}), 400
+    if not upload:
+        return jsonify({'error': 'Upload not found'}), 404
+    return jsonify(upload)
+
+
+@uploads_bp.route('/uploads/<upload_id>/parts/<int:part_number>', methods=['PUT'])
+@require_user
+def upload_part(user_id, upload_id, part_number):
+    """Stream one part of the file to storage"""
+    # request.stream reads the body incrementally; request.data would buffer it whole
+    try:
+        part = get_upload_service().upload_part(user_id, upload_id, part_number, request.stream)
+    except PartTooLarge as e:
+        return jsonify({'error': str(e)}), 413
+    except (UploadError, StorageError) as e:
+        return jsonify({'error': str(e)}), 400
+    if not part:
+        return jsonify({'error': 'Upload not found'}), 404
+    return jsonify(part)
+
+
+@uploads_bp.route('/uploads/<upload_id>/complete', methods=['POST'])
+@require_user
+def complete_upload(user_id, upload_id):
+    """Assemble the parts and record the file"""
+    data = request.get_json(silent=True) or {}
+    try:
+        row = get_upload_service().complete_upload(user_id, upload_id, data.get('sha256'))
+    except (UploadError, StorageError) as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        print(f"❌ Error completing upload {upload_id}: {e}")
+        return jsonify({'error': 'Could not record upload'}), 500
+    if not row:
+        return jsonify({'error': 'Upload not found'}), 404
+    return jsonify(row), 201
+
+
+@uploads_bp.route('/uploads/<upload_id>', methods=['DELETE'])
+@require_user
+def abort_upload(user_id, upload_id):
+    """Abort an unfinished upload"""
+    try:
+        aborted = get_upload_service().abort_upload(user_id, upload_id)
+    except StorageError as e:
+        return jsonify({'error': str(e)}), 400
+    if not aborted:
+        return jsonify({'error': 'Upload not found'}), 404
+    return '', 204
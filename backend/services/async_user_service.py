@@ -0,0 +1,176 @@
+import asyncio
+from services.supabase_clients import get_async_service_client
+from services.batching import DEFAULT_BATCH_SIZE, id_batches
+from services.user_service import (
+    google_user_row,
+    oauth_user_row,
+    subscription_update_row,
+    supabase_user_row,
+    upsert_batches,
+)
+
+# Bulk methods keep at most this many PostgREST requests in flight
+BULK_CONCURRENCY = 4
+
+class AsyncUserService:
+    """Non-blocking counterpart of UserService for asyncio front ends.
+
+    Same method surface as UserService, but every method is a coroutine
+    running on a shared async PostgREST client, so independent lookups can
+    be awaited concurrently with asyncio.gather.
+    """
+
+    def __init__(self, client=None):
+        # The client comes from the shared registry (one per event loop) unless injected
+        self._supabase = client
+
+    @property
+    def supabase(self):
+        """Async PostgREST client for database operations (service role to bypass RLS)"""
+        if self._supabase is not None:
+            return self._supabase
+        return get_async_service_client()
+
+    @supabase.setter
+    def supabase(self, client):
+        self._supabase = client
+
+    async def create_or_update_user(self, google_user_data):
+        """Create or update user in Supabase"""
+        try:
+            result = await self.supabase.table('users').upsert(
+                google_user_row(google_user_data), on_conflict='google_id'
+            ).execute()
+            return result.data[0] if result.data else None
+        except Exception as e:
+            print(f"Error managing user: {e}")
+            return None
+
+    async def get_user_by_id(self, user_id):
+        """Get user by ID"""
+        return await self._get_user('id', user_id)
+
+    async def get_user_by_google_id(self, google_id):
+        """Get user by Google ID"""
+        return await self._get_user('google_id', google_id)
+
+    async def get_user_by_supabase_id(self, supabase_id):
+        """Get user by Supabase ID"""
+        return await self._get_user('supabase_id', supabase_id)
+
+    async def get_user_by_customer_id(self, customer_id):
+        """Get user by Stripe customer ID"""
+        return await self._get_user('stripe_customer_id', customer_id)
+
+    async def create_user_from_oauth(self, user_data):
+        """Create user from OAuth data if not exists"""
+        user = oauth_user_row(user_data)
+        if not user.get('supabase_id') or not user.get('email'):
+            print("Error: Missing supabase_id or email for user creation")
+            return None
+
+        try:
+            result = await self.supabase.table('users').insert(user).execute()
+            return result.data[0] if result.data else None
+        except Exception as e:
+            print(f"Error creating user from OAuth: {e}")
+            return None
+
+    async def update_user_subscription(self, user_id, subscription_data):
+        """Update user subscription information"""
+        try:
+            result = await self.supabase.table('users').update(
+                subscription_update_row(subscription_data)
+            ).eq('id', user_id).execute()
+            return result.data[0] if result.data else None
+        except Exception as e:
+            print(f"Error updating user subscription: {e}")
+            return None
+
+    async def create_or_update_user_from_supabase(self, supabase_user_data):
+        """Create or update user from Supabase auth data"""
+        try:
+            user_data = supabase_user_row(supabase_user_data)
+            if not user_data.get('supabase_id') or not user_data.get('email'):
+                print("Error: Missing supabase_id or email")
+                return None
+
+            result = await self.supabase.table('users').upsert(
+                user_data, on_conflict='supabase_id'
+            ).execute()
+            return result.data[0] if result.data else None
+        except Exception as e:
+            print(f"Error managing user from Supabase: {e}")
+            return None
+
+    async def bulk_upsert_users(self, users, on_conflict='supabase_id', batch_size=None):
+        """Upsert many users, running up to BULK_CONCURRENCY batches at once"""
+        if not users:
+            return []
+
+        batches = upsert_batches(users, on_conflict, batch_size or DEFAULT_BATCH_SIZE)
+        semaphore = asyncio.Semaphore(BULK_CONCURRENCY)
+
+        async def upsert(batch):
+            async with semaphore:
+                try:
+                    result = await self.supabase.table('users').upsert(
+                        batch, on_conflict=on_conflict
+                    ).execute()
+                    return result.data or []
+                except Exception as e:
+                    print(f"Error bulk upserting {len(batch)} users: {e}")
+                    return []
+
+        results = await asyncio.gather(*(upsert(batch) for batch in batches))
+        return [user for rows in results for user in rows]
+
+    async def get_users_by_supabase_ids(self, supabase_ids, batch_size=None):
+        """Get users by Supabase ID in concurrent chunked queries, keyed by supabase_id"""
+        return await self._get_users_by_column('supabase_id', supabase_ids, batch_size)
+
+    async def get_users_by_customer_ids(self, customer_ids, batch_size=None):
+        """Get users by Stripe customer ID in concurrent chunked queries, keyed by stripe_customer_id"""
+        return await self._get_users_by_column('stripe_customer_id', customer_ids, batch_size)
+
+    async def get_user_context(self, supabase_id):
+        """Fetch a user, their API key metadata and preferences concurrently"""
+        user, api_keys, preferences = await asyncio.gather(
+            self.get_user_by_supabase_id(supabase_id),
+            self._select('api_keys', 'service, updated_at', 'user_id', supabase_id),
+            self._select('user_preferences', '*', 'user_id', supabase_id),
+        )
+        return {
+            'user': user,
+            'api_keys': api_keys or [],
+            'preferences': preferences[0] if preferences else None
+        }
+
+    async def _get_user(self, column, value):
+        rows = await self._select('users', '*', column, value)
+        return rows[0] if rows else None
+
+    async def _select(self, table, columns, column, value):
+        try:
+            result = await self.supabase.table(table).select(columns).eq(column, value).execute()
+            return result.data
+        except Exception as e:
+            print(f"Error querying {table} by {column}: {e}")
+            return None
+
+    async def _get_users_by_column(self, column, values, batch_size=None):
+        semaphore = asyncio.Semaphore(BULK_CONCURRENCY)
+
+        async def select(batch):
+            async with semaphore:
+                try:
+                    result = await self.supabase.table('users').select('*').in_(column, batch).execute()
+                    return result.data or []
+                except Exception as e:
+                    print(f"Error getting users by {column}: {e}")
+                    return []
+
+        results = await asyncio.gather(
+            *(select(batch) for batch in id_batches(values, batch_size or DEFAULT_BATCH_SIZE))
+        )
+        return {str(user[column]): user for rows in results for user in rows}
@@ -0,0 +1,12 @@
+import os
+
+# Rows per request for bulk selects/upserts; keeps `in_` URLs and request
+# bodies well under PostgREST limits
+DEFAULT_BATCH_SIZE = int(os.getenv('USER_SERVICE_BATCH_SIZE', 500))
+
+
+def id_batches(values, batch_size):
+    """De-duplicate ids and split them into `in_` filter batches"""
+    values = list(dict.fromkeys(str(v) for v in values if v))
+    for start in range(0, len(values), batch_size):
+        yield values[start:start + batch_size]
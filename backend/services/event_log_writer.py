@@ -0,0 +1,155 @@
+import atexit
+import json
+import os
+import threading
+import time
+
+EVENT_LOG_BATCH_SIZE = int(os.getenv('SUBSCRIPTION_EVENT_BATCH_SIZE', 100))
+EVENT_LOG_FLUSH_SECONDS = float(os.getenv('SUBSCRIPTION_EVENT_FLUSH_SECONDS', 2))
+# Rows held in memory at most; beyond this new rows go straight to the spill file
+EVENT_LOG_MAX_BUFFER = int(os.getenv('SUBSCRIPTION_EVENT_MAX_BUFFER', 10000))
+EVENT_LOG_SPILL_PATH = os.getenv(
+    'SUBSCRIPTION_EVENT_SPILL_PATH',
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data', 'subscription_events.jsonl')
+)
+
+
+class BufferedEventWriter:
+    """Write-behind multi-row inserter for an append-only Supabase table.
+
+    add() only appends to an in-memory buffer; a background thread flushes
+    it by size or time. Rows that cannot be inserted (database down, buffer
+    full) are appended to a local JSONL spill file and replayed after the
+    next successful flush. The buffer is flushed at interpreter exit.
+    """
+
+    def __init__(self, user_service, table='subscription_events', batch_size=EVENT_LOG_BATCH_SIZE,
+                 flush_seconds=EVENT_LOG_FLUSH_SECONDS, max_buffer=EVENT_LOG_MAX_BUFFER,
+                 spill_path=EVENT_LOG_SPILL_PATH):
+        self.user_service = user_service
+        self.table = table
+        self.batch_size = batch_size
+        self.flush_seconds = flush_seconds
+        self.max_buffer = max_buffer
+        self.spill_path = spill_path
+        self._buffer = []
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopped = False
+        self._thread = None
+        self._thread_pid = None
+
+    def add(self, row):
+        """Queue one row; never blocks on the database"""
+        self._ensure_thread()
+        with self._lock:
+            if len(self._buffer) < self.max_buffer:
+                self._buffer.append(row)
+                full = len(self._buffer) >= self.batch_size
+                row = None
+            else:
+                full = True
+        if row is not None:
+            # Buffer is at its bound: keep memory flat and spill instead
+            self._spill([row])
+        if full:
+            self._wakeup.set()
+
+    def flush(self):
+        """Insert everything buffered; rows that fail are spilled"""
+        with self._flush_lock:
+            inserted = False
+            while True:
+                with self._lock:
+                    batch = self._buffer[:self.batch_size]
+                    del self._buffer[:self.batch_size]
+                if not batch:
+                    break
+                if self._insert(batch):
+                    inserted = True
+                else:
+                    self._spill(batch)
+            if inserted:
+                self._replay_spill()
+
+    def close(self):
+        self._stopped = True
+        self._wakeup.set()
+        self.flush()
+
+    def _ensure_thread(self):
+        if self._thread is not None and self._thread_pid == os.getpid():
+            return
+        with self._lock:
+            if self._thread is None or self._thread_pid != os.getpid():
+                self._thread = threading.Thread(
+                    target=self._run, name=f"{self.table}-writer", daemon=True
+                )
+                self._thread_pid = os.getpid()
+                self._thread.start()
+                atexit.register(self.close)
+
+    def _run(self):
+        while not self._stopped:
+            self._wakeup.wait(self.flush_seconds)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"Error flushing {self.table}: {e}")
+
+    def _insert(self, rows):
+        supabase = self.user_service.supabase
+        if not supabase:
+            return False
+        try:
+            supabase.table(self.table).insert(rows).execute()
+            return True
+        except Exception as e:
+            print(f"Error inserting {len(rows)} rows into {self.table}: {e}")
+            return False
+
+    def _spill(self, rows):
+        try:
+            os.makedirs(os.path.dirname(self.spill_path) or '.', exist_ok=True)
+            with open(self.spill_path, 'a') as f:
+                for row in rows:
+                    f.write(json.dumps(row, default=str) + '\n')
+        except Exception as e:
+            print(f"Error spilling {len(rows)} {self.table} rows: {e}")
+
+    def _replay_spill(self):
+        """Re-insert spilled rows once the database is reachable again"""
+        if not os.path.exists(self.spill_path):
+            return
+        replay_path = f"{self.spill_path}.{os.getpid()}.{int(time.time())}.replay"
+        try:
+            os.replace(self.spill_path, replay_path)
+        except FileNotFoundError:
+            return  # another worker took it
+
+        # Stream the file in batches; after the first failure the rest is
+        # copied back to the spill file without being held in memory
+        failed = 0
+        batch = []
+        with open(replay_path) as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                if failed:
+                    self._spill([json.loads(line)])
+                    failed += 1
+                    continue
+                batch.append(json.loads(line))
+                if len(batch) >= self.batch_size:
+                    if not self._insert(batch):
+                        self._spill(batch)
+                        failed += len(batch)
+                    batch = []
+        if batch and not self._insert(batch):
+            self._spill(batch)
+            failed += len(batch)
+
+        os.remove(replay_path)
+        print(f"Replayed spilled {self.table} rows ({failed} still pending)")
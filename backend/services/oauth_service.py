@@ -1,17 +1,14 @@
 import os
-import jwt
-import requests
+import importlib.util
 from datetime import datetime, timedelta
-from supabase import create_client, Client
+from services.supabase_clients import get_anon_client
 
-# Optional Google imports - will be imported only if available
+# Optional Google dependencies: only probed here, imported on first Google login
 try:
-    from google.auth.transport import requests as google_requests
-    from google.oauth2 import id_token
-    from google_auth_oauthlib.flow import Flow
-    GOOGLE_AVAILABLE = True
-except ImportError:
+    GOOGLE_AVAILABLE = importlib.util.find_spec('google_auth_oauthlib') is not None
+except (ImportError, ValueError):
     GOOGLE_AVAILABLE = False
+if not GOOGLE_AVAILABLE:
     print("Google OAuth dependencies not available. Google OAuth will be disabled.")
 
 class OAuthService:
@@ -23,25 +20,30 @@ class OAuthService:
         self.jwt_algorithm = os.getenv('JWT_ALGORITHM', 'HS256')
         self.jwt_expiration_hours = int(os.getenv('JWT_EXPIRATION_HOURS', 24))
         
-        # Initialize Supabase client
-        supabase_url = os.getenv("SUPABASE_URL")
-        if not supabase_url:
+        # Supabase client comes from the shared registry on first use
+        if not os.getenv("SUPABASE_URL"):
             raise RuntimeError(
                 "SUPABASE_URL is not set – cannot start OAuth service.\n"
                 "See LOCAL_DEV_SETUP.md > Environment Variables."
             )
-        supabase_key = os.getenv('SUPABASE_ANON_KEY', 'placeholder_key')
-        
-        try:
-            self.supabase: Client = create_client(supabase_url, supabase_key)
-        except Exception as e:
-            print(f"Warning: Could not initialize Supabase client: {e}")
-            self.supabase = None
+        self._supabase = None
+    
+    @property
+    def supabase(self):
+        """Supabase client for auth calls (anon key)"""
+        if self._supabase is not None:
+            return self._supabase
+        return get_anon_client()
+    
+    @supabase.setter
+    def supabase(self, client):
+        self._supabase = client
         
     def create_google_flow(self):
         """Create Google OAuth flow"""
         if not GOOGLE_AVAILABLE:
             raise Exception("Google OAuth dependencies not available")
+        from google_auth_oauthlib.flow import Flow
         
         flow = Flow.from_client_config(
             {
@@ -83,6 +85,7 @@ class OAuthService:
             
             # Get user info from Google
             credentials = flow.credentials
+            import requests
             user_info_response = requests.get(
                 'https://www.googleapis.com/oauth2/v2/userinfo',
                 headers={'Authorization': f'Bearer {credentials.token}'}
@@ -108,11 +111,14 @@ class OAuthService:
             'iat': datetime.utcnow()
         }
         
+        # PyJWT imports cryptography; only pay for it when a token is handled
+        import jwt
         token = jwt.encode(payload, self.jwt_secret, algorithm=self.jwt_algorithm)
         return token
     
     def verify_jwt_token(self, token):
         """Verify JWT token and return user data"""
+        import jwt
         try:
             payload = jwt.decode(token, self.jwt_secret, algorithms=[self.jwt_algorithm])
             return payload
@@ -191,6 +197,23 @@ class OAuthService:
             print(f"Token verification failed (fallback): {e}")
             return None
     
+    def verify_supabase_access_token(self, access_token):
+        """Supabase user for an access token that Supabase Auth itself accepts, else None.
+
+        Unlike verify_supabase_token there is no unverified-decode or Google
+        fallback, so this is safe for deciding whose data a request may touch.
+        """
+        if not access_token or not self.supabase:
+            return None
+        try:
+            user_response = self.supabase.auth.get_user(access_token)
+        except Exception as e:
+            print(f"Supabase token rejected: {e}")
+            return None
+        if not user_response or not user_response.user:
+            return None
+        return self._format_supabase_user(user_response.user)
+    
     def _verify_google_access_token(self, access_token):
         """Verify Google access token by calling Google's userinfo endpoint"""
         try:
@@ -226,4 +249,14 @@ class OAuthService:
             'picture': supabase_user.user_metadata.get('avatar_url'),
             'provider': supabase_user.app_metadata.get('provider', 'oauth'),
             'verified_email': supabase_user.email_confirmed_at is not None
-        } 
\ No newline at end of file
+        }
+
+
+# Global instance - lazy loaded
+_oauth_service = None
+
+def get_oauth_service():
+    global _oauth_service
+    if _oauth_service is None:
+        _oauth_service = OAuthService()
+    return _oauth_service
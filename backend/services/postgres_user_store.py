@@ -0,0 +1,118 @@
+import os
+import threading
+import time
+from datetime import date, datetime
+from uuid import UUID
+
+# Direct Postgres path for the hottest `users` lookups, bypassing PostgREST.
+# Point SUPABASE_DB_URL at the direct connection (port 5432) or the session
+# pooler: the transaction pooler on 6543 does not support prepared statements.
+SUPABASE_DB_URL = os.getenv('SUPABASE_DB_URL')
+DB_POOL_MIN_SIZE = int(os.getenv('SUPABASE_DB_POOL_MIN', 1))
+DB_POOL_MAX_SIZE = int(os.getenv('SUPABASE_DB_POOL_MAX', 5))
+DB_POOL_TIMEOUT = float(os.getenv('SUPABASE_DB_POOL_TIMEOUT', 5))
+# After a failed connect, lookups fail fast for this long instead of each
+# waiting DB_POOL_TIMEOUT, so callers fall back to PostgREST immediately
+DB_CIRCUIT_SECONDS = float(os.getenv('SUPABASE_DB_CIRCUIT_SECONDS', 30))
+
+USER_BY_SUPABASE_ID_SQL = "SELECT * FROM users WHERE supabase_id = %s"
+USER_BY_CUSTOMER_ID_SQL = "SELECT * FROM users WHERE stripe_customer_id = %s LIMIT 1"
+
+
+def _json_value(value):
+    """Render driver types the way PostgREST returns them in JSON"""
+    if isinstance(value, UUID):
+        return str(value)
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return value
+
+
+class StoreUnavailable(Exception):
+    """Raised without touching the pool while the circuit is open"""
+
+
+class PostgresUserStore:
+    """Bounded psycopg connection pool with prepared `users` lookups.
+
+    A connection failure opens a circuit for circuit_seconds: lookups raise
+    StoreUnavailable at once instead of each blocking for the pool timeout.
+    The first lookup after that period tries the database again.
+    """
+
+    def __init__(self, conninfo, min_size=DB_POOL_MIN_SIZE, max_size=DB_POOL_MAX_SIZE,
+                 timeout=DB_POOL_TIMEOUT, circuit_seconds=DB_CIRCUIT_SECONDS):
+        from psycopg import OperationalError
+        from psycopg.rows import dict_row
+        from psycopg_pool import ConnectionPool
+
+        # Connection errors, including psycopg_pool.PoolTimeout
+        self._connection_error = OperationalError
+        self.circuit_seconds = circuit_seconds
+        self._open_until = 0
+
+        # prepare_threshold=0 prepares every statement on first use per connection
+        self.pool = ConnectionPool(
+            conninfo,
+            min_size=min_size,
+            max_size=max_size,
+            timeout=timeout,
+            kwargs={'row_factory': dict_row, 'prepare_threshold': 0, 'autocommit': True},
+            open=True,
+        )
+
+    def get_user_by_supabase_id(self, supabase_id):
+        return self._fetch_one(USER_BY_SUPABASE_ID_SQL, str(supabase_id))
+
+    def get_user_by_customer_id(self, customer_id):
+        return self._fetch_one(USER_BY_CUSTOMER_ID_SQL, customer_id)
+
+    def close(self):
+        self.pool.close()
+
+    def _fetch_one(self, sql, value):
+        if time.monotonic() < self._open_until:
+            raise StoreUnavailable("Postgres user store unavailable, circuit open")
+        try:
+            with self.pool.connection() as conn:
+                row = conn.execute(sql, (value,), prepare=True).fetchone()
+        except self._connection_error:
+            self._open_until = time.monotonic() + self.circuit_seconds
+            raise
+        self._open_until = 0
+        if row is None:
+            return None
+        return {key: _json_value(val) for key, val in row.items()}
+
+
+_store = None
+_store_pid = None
+_store_failed_at = None
+_store_lock = threading.Lock()
+
+
+def get_postgres_user_store():
+    """Process-wide PostgresUserStore, opened lazily and reopened after fork"""
+    global _store, _store_pid, _store_failed_at
+    if not SUPABASE_DB_URL:
+        return None
+
+    pid = os.getpid()
+    store = _store
+    if store is not None and _store_pid == pid:
+        return store
+
+    with _store_lock:
+        if _store is None or _store_pid != pid:
+            if _store_failed_at is not None and time.monotonic() - _store_failed_at < DB_CIRCUIT_SECONDS:
+                return None
+            try:
+                _store = PostgresUserStore(SUPABASE_DB_URL)
+                _store_pid = pid
+                _store_failed_at = None
+                print(f"✅ Postgres user store pool opened (pid: {pid}, max: {DB_POOL_MAX_SIZE})")
+            except Exception as e:
+                print(f"Warning: Could not open Postgres user store: {e}")
+                _store = None
+                _store_failed_at = time.monotonic()
+        return _store
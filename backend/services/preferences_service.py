@@ -0,0 +1,160 @@
+import os
+
+from services.cache import LRUCache
+from services.supabase_clients import get_service_client
+
+# Per-process cache of user_id -> (preferences, version). Writes through this
+# process update it immediately; a write made by another worker is picked up
+# once the entry expires.
+PREFERENCES_CACHE_TTL = float(os.getenv('PREFERENCES_CACHE_TTL', 60))
+PREFERENCES_CACHE_SIZE = int(os.getenv('PREFERENCES_CACHE_SIZE', 10000))
+
+DEFAULT_PREFERENCES = {
+    'theme': 'dark',
+    'terminal_font_size': 14,
+    'terminal_font_family': 'monospace',
+}
+_COLUMNS = ', '.join([*DEFAULT_PREFERENCES, 'version'])
+# Compare-and-set attempts for a write without an expected version
+_MAX_WRITE_ATTEMPTS = 3
+
+
+class PreferencesError(Exception):
+    """Raised for invalid preference values"""
+
+
+class PreferencesConflict(Exception):
+    """Raised when the stored version is not the one the write expected"""
+
+    def __init__(self, current_version):
+        super().__init__(f"Preferences changed (now at version {current_version})")
+        self.current_version = current_version
+
+
+def validate_preferences(changes):
+    """Return the recognised, validated fields of changes or raise PreferencesError"""
+    unknown = set(changes) - set(DEFAULT_PREFERENCES)
+    if unknown:
+        raise PreferencesError(f"Unknown preferences: {', '.join(sorted(unknown))}")
+    if 'theme' in changes and changes['theme'] not in ('light', 'dark'):
+        raise PreferencesError("theme must be 'light' or 'dark'")
+    if 'terminal_font_size' in changes:
+        size = changes['terminal_font_size']
+        if not isinstance(size, int) or isinstance(size, bool) or not 6 <= size <= 72:
+            raise PreferencesError("terminal_font_size must be an integer between 6 and 72")
+    if 'terminal_font_family' in changes:
+        family = changes['terminal_font_family']
+        if not isinstance(family, str) or not family.strip() or len(family) > 200:
+            raise PreferencesError("terminal_font_family must be a non-empty string")
+    return dict(changes)
+
+
+class PreferencesService:
+    """Read-mostly user_preferences with a per-user version for ETags.
+
+    Every write increments user_preferences.version with a compare-and-set
+    on the previous version, so the version identifies one exact state of a
+    user's preferences across all workers. The in-process cache answers
+    reads and conditional requests without touching the database.
+    """
+
+    def __init__(self, cache_ttl=PREFERENCES_CACHE_TTL, cache_size=PREFERENCES_CACHE_SIZE):
+        self._cache = LRUCache(cache_size, ttl=cache_ttl)
+
+    @property
+    def supabase(self):
+        return get_service_client()
+
+    def cached_version(self, user_id):
+        """Version of the cached preferences, or None; never queries the database"""
+        entry = self._cache.get(user_id)
+        return entry[1] if entry else None
+
+    def get_preferences(self, user_id):
+        """(preferences, version) for the user; defaults at version 0 if never saved"""
+        entry = self._cache.get(user_id)
+        if entry:
+            return dict(entry[0]), entry[1]
+        preferences, version = self._load(user_id)
+        self._cache.put(user_id, (preferences, version))
+        return dict(preferences), version
+
+    def update_preferences(self, user_id, changes, expected_version=None):
+        """Apply changes and bump the version; returns (preferences, version).
+
+        With expected_version the write only succeeds if the stored version
+        still matches, otherwise PreferencesConflict is raised. Without it
+        the write is retried on top of concurrent writes.
+        """
+        changes = validate_preferences(changes)
+        supabase = self.supabase
+        if not supabase:
+            raise RuntimeError("Supabase service client unavailable")
+
+        if expected_version is not None:
+            preferences, version = self.get_preferences(user_id)
+        else:
+            preferences, version = self._load(user_id)
+
+        for _ in range(_MAX_WRITE_ATTEMPTS):
+            if expected_version is not None and version != expected_version:
+                # The cache may be behind another worker's write; confirm first
+                preferences, version = self._load(user_id)
+                if version != expected_version:
+                    self._cache.put(user_id, (preferences, version))
+                    raise PreferencesConflict(version)
+
+            updated = {**preferences, **changes}
+            if self._compare_and_set(supabase, user_id, updated, version):
+                self._cache.put(user_id, (updated, version + 1))
+                return dict(updated), version + 1
+
+            self._cache.pop(user_id)
+            preferences, version = self._load(user_id)
+            if expected_version is not None:
+                raise PreferencesConflict(version)
+
+        raise PreferencesConflict(version)
+
+    def invalidate(self, user_id):
+        self._cache.pop(user_id)
+
+    def _load(self, user_id):
+        supabase = self.supabase
+        if not supabase:
+            raise RuntimeError("Supabase service client unavailable")
+        result = supabase.table('user_preferences').select(_COLUMNS).eq('user_id', user_id).limit(1).execute()
+        if not result.data:
+            return dict(DEFAULT_PREFERENCES), 0
+        row = result.data[0]
+        preferences = {
+            field: row.get(field) if row.get(field) is not None else default
+            for field, default in DEFAULT_PREFERENCES.items()
+        }
+        return preferences, row.get('version') or 1
+
+    def _compare_and_set(self, supabase, user_id, preferences, version):
+        """Write preferences at version + 1 if the stored version is still version"""
+        row = {**preferences, 'version': version + 1, 'updated_at': 'now()'}
+        if version == 0:
+            try:
+                result = supabase.table('user_preferences').insert({'user_id': user_id, **row}).execute()
+            except Exception as e:
+                # user_id is unique: someone else created the row first
+                print(f"Preferences insert for {user_id} lost a race: {e}")
+                return False
+        else:
+            result = supabase.table('user_preferences').update(row).eq(
+                'user_id', user_id
+            ).eq('version', version).execute()
+        return bool(result.data)
+
+
+# Global instance - lazy loaded
+_preferences_service = None
+
+def get_preferences_service():
+    global _preferences_service
+    if _preferences_service is None:
+        _preferences_service = PreferencesService()
+    return _preferences_service
@@ -0,0 +1,173 @@
+import json
+import os
+import threading
+import time
+import stripe
+
+PRICE_CATALOG_PATH = os.getenv(
+    'STRIPE_PRICE_CATALOG_PATH',
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data', 'stripe_prices.json')
+)
+# Catalog older than this is refreshed in the background while still being served
+PRICE_CATALOG_REFRESH_SECONDS = int(os.getenv('STRIPE_PRICE_CATALOG_REFRESH_SECONDS', 3600))
+# An unknown price id triggers a refresh, but not more often than this
+MISS_REFRESH_INTERVAL = 60
+# After a failed refresh (Stripe unreachable), wait this long before the next one
+FAILED_REFRESH_BACKOFF = 60
+
+
+class PriceCatalog:
+    """All Stripe prices with an O(1) price id -> plan name index.
+
+    Plan names come from, in order: the STRIPE_*_PRICE_ID env mapping, the
+    price's `plan` metadata, its product's `plan` metadata, its lookup_key
+    when that names one of our plans (e.g. pro or pro_monthly). A price none
+    of these map stays unmapped and plan_for_price returns 'unknown' for it,
+    never a plan the customer may not be on.
+    The catalog is persisted to a JSON snapshot so a fresh worker can resolve
+    plans without calling Stripe.
+    """
+
+    def __init__(self, configured_price_ids, path=PRICE_CATALOG_PATH,
+                 refresh_seconds=PRICE_CATALOG_REFRESH_SECONDS):
+        # plan name -> price id from the environment; these always win
+        self.configured = {price_id: plan for plan, price_id in configured_price_ids.items() if price_id}
+        self.known_plans = set(configured_price_ids) | {'free'}
+        self.path = path
+        self.refresh_seconds = refresh_seconds
+        self.prices = {}
+        self.plan_by_price = dict(self.configured)
+        self.loaded_at = 0
+        self._loaded = False
+        self._lock = threading.Lock()
+        self._refreshing = False
+        self._last_miss_refresh = 0
+        self._failed_at = 0
+
+    def plan_for_price(self, price_id):
+        """Plan name for a price id, or 'unknown'"""
+        if not price_id:
+            return 'unknown'
+        plan = self.configured.get(price_id)
+        if plan:
+            return plan
+
+        self._ensure_loaded()
+        plan = self.plan_by_price.get(price_id)
+        if plan:
+            return plan
+
+        # A price created after the last refresh; pick it up for next time
+        now = time.time()
+        if (now - self._last_miss_refresh > MISS_REFRESH_INTERVAL
+                and now - self._failed_at > FAILED_REFRESH_BACKOFF):
+            self._last_miss_refresh = now
+            self.refresh_in_background()
+        return 'unknown'
+
+    def get_price(self, price_id):
+        self._ensure_loaded()
+        return self.prices.get(price_id)
+
+    def _ensure_loaded(self):
+        if not self._loaded:
+            with self._lock:
+                if not self._loaded:
+                    if not self._load_snapshot():
+                        self.refresh()
+                    self._loaded = True
+
+        now = time.time()
+        if (now - self.loaded_at > self.refresh_seconds
+                and now - self._failed_at > FAILED_REFRESH_BACKOFF):
+            self.refresh_in_background()
+
+    def refresh(self):
+        """Reload every price from Stripe (auto-paginated) and rewrite the snapshot"""
+        try:
+            prices = {}
+            listing = stripe.Price.list(limit=100, expand=['data.product'])
+            for price in listing.auto_paging_iter():
+                prices[price['id']] = self._price_entry(price)
+        except Exception as e:
+            print(f"Error loading Stripe price catalog: {e}")
+            self._failed_at = time.time()
+            return False
+
+        self._failed_at = 0
+        self._install(prices, time.time())
+        self._write_snapshot()
+        print(f"✅ Loaded {len(prices)} Stripe prices into the catalog")
+        return True
+
+    def refresh_in_background(self):
+        with self._lock:
+            if self._refreshing:
+                return
+            self._refreshing = True
+
+        def run():
+            try:
+                self.refresh()
+            finally:
+                self._refreshing = False
+
+        threading.Thread(target=run, name='stripe-price-catalog-refresh', daemon=True).start()
+
+    def _price_entry(self, price):
+        product = price.get('product')
+        product_metadata = product.get('metadata', {}) if isinstance(product, dict) else {}
+        plan = ((price.get('metadata') or {}).get('plan')
+                or (product_metadata or {}).get('plan')
+                or self._plan_from_lookup_key(price.get('lookup_key')))
+        if not plan:
+            print(f"⚠️  Stripe price {price['id']} maps to no plan (set its plan metadata or a STRIPE_*_PRICE_ID)")
+        return {
+            'id': price['id'],
+            'plan': plan,
+            'active': price.get('active'),
+            'nickname': price.get('nickname'),
+            'product': product.get('id') if isinstance(product, dict) else product,
+            'unit_amount': price.get('unit_amount'),
+            'currency': price.get('currency'),
+            'interval': (price.get('recurring') or {}).get('interval')
+        }
+
+    def _plan_from_lookup_key(self, lookup_key):
+        """Known plan named by a lookup_key such as 'pro' or 'pro_monthly', else None"""
+        if lookup_key:
+            for plan in self.known_plans:
+                if lookup_key == plan or lookup_key.startswith(f"{plan}_"):
+                    return plan
+        return None
+
+    def _install(self, prices, loaded_at):
+        # Build the new index fully, then swap references; readers never lock
+        plan_by_price = {price_id: entry['plan'] for price_id, entry in prices.items() if entry.get('plan')}
+        plan_by_price.update(self.configured)
+        self.prices = prices
+        self.plan_by_price = plan_by_price
+        self.loaded_at = loaded_at
+
+    def _load_snapshot(self):
+        try:
+            with open(self.path) as f:
+                snapshot = json.load(f)
+        except FileNotFoundError:
+            return False
+        except Exception as e:
+            print(f"Ignoring unreadable price catalog snapshot: {e}")
+            return False
+
+        self._install(snapshot.get('prices', {}), snapshot.get('loaded_at', 0))
+        return True
+
+    def _write_snapshot(self):
+        try:
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            tmp_path = f"{self.path}.{os.getpid()}.tmp"
+            with open(tmp_path, 'w') as f:
+                json.dump({'loaded_at': self.loaded_at, 'prices': self.prices}, f)
+            os.replace(tmp_path, self.path)
+        except Exception as e:
+            print(f"Error writing price catalog snapshot: {e}")
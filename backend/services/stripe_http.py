@@ -0,0 +1,183 @@
+import os
+import random
+import re
+import threading
+import time
+from collections import deque
+from urllib.parse import urlsplit
+
+import requests
+import stripe
+from requests.adapters import HTTPAdapter
+
+# Stripe allows ~100 requests/s in live mode (25 in test mode) per account.
+# This caps in-flight requests per process; size it to the account limit
+# divided by the number of worker processes.
+STRIPE_MAX_CONCURRENCY = int(os.getenv('STRIPE_MAX_CONCURRENCY', 8))
+STRIPE_MAX_RETRIES = int(os.getenv('STRIPE_MAX_RETRIES', 4))
+STRIPE_TIMEOUT = float(os.getenv('STRIPE_TIMEOUT', 30))
+# Retry n waits min(cap, base * 2**(n-1)), jittered down by up to half
+STRIPE_RETRY_BASE_DELAY = 0.5
+STRIPE_RETRY_MAX_DELAY = 8
+# Latency samples kept per endpoint for percentiles
+LATENCY_SAMPLES = 1000
+
+# Path segments that are object ids (cus_..., sub_..., evt_...) collapse to
+# one endpoint name, so /v1/customers/cus_123 is reported as /v1/customers/:id.
+# An id is a known object prefix (plus test_/live_ for some objects) followed
+# by a token with an uppercase letter or digit, so resource names like
+# billing_portal or payment_intents stay.
+_ID_PREFIXES = (
+    'acct', 'ba', 'bpc', 'bps', 'card', 'ch', 'cn', 'cs', 'cus', 'evt', 'file', 'ii', 'il',
+    'in', 'pi', 'pm', 'po', 'price', 'prod', 'promo', 'py', 're', 'seti', 'si', 'src',
+    'sub', 'sub_sched', 'tok', 'tr', 'txn', 'we',
+)
+_ID_SEGMENT = re.compile(
+    rf"^(?:{'|'.join(sorted(_ID_PREFIXES, key=len, reverse=True))})_(?:test_|live_)?(?=[a-z]*[A-Z0-9])[A-Za-z0-9]+$"
+)
+
+
+def endpoint_name(method, url):
+    path = urlsplit(url).path
+    segments = [':id' if _ID_SEGMENT.match(segment) else segment for segment in path.split('/')]
+    return f"{method.upper()} {'/'.join(segments)}"
+
+
+class EndpointLatency:
+    """Request count, error count and recent latencies for one Stripe endpoint"""
+
+    def __init__(self):
+        self.count = 0
+        self.errors = 0
+        self.retries = 0
+        self.total_seconds = 0.0
+        self.samples = deque(maxlen=LATENCY_SAMPLES)
+
+    def snapshot(self):
+        ordered = sorted(self.samples)
+
+        def percentile(p):
+            if not ordered:
+                return None
+            return round(ordered[min(len(ordered) - 1, int(p * len(ordered)))] * 1000, 1)
+
+        return {
+            'count': self.count,
+            'errors': self.errors,
+            'retries': self.retries,
+            'avg_ms': round(self.total_seconds / self.count * 1000, 1) if self.count else None,
+            'p50_ms': percentile(0.50),
+            'p99_ms': percentile(0.99)
+        }
+
+
+class PooledStripeClient(stripe.RequestsClient):
+    """Stripe HTTP client with a keep-alive pool, 429/5xx retries and a concurrency cap.
+
+    Each attempt holds a slot of a process-wide semaphore; backoff sleeps do
+    not. The session and semaphore are rebuilt after a fork so gunicorn
+    workers never share sockets with the master.
+    """
+
+    def __init__(self, max_concurrency=STRIPE_MAX_CONCURRENCY, timeout=STRIPE_TIMEOUT):
+        super().__init__(timeout=timeout)
+        self.max_concurrency = max_concurrency
+        self._metrics = {}
+        self._metrics_lock = threading.Lock()
+        self._pid = None
+        self._ensure_process()
+
+    def _ensure_process(self):
+        if self._pid == os.getpid():
+            return
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.max_concurrency, max_retries=0)
+        session.mount('https://', adapter)
+        self._session = session
+        self._thread_local = threading.local()
+        self._slots = threading.BoundedSemaphore(self.max_concurrency)
+        with self._metrics_lock:
+            self._metrics = {}
+        self._pid = os.getpid()
+
+    def request(self, method, url, headers, post_data=None):
+        self._ensure_process()
+        stats = self._stats(endpoint_name(method, url))
+        self._thread_local.last_stats = stats
+        with self._slots:
+            started = time.perf_counter()
+            try:
+                response = super().request(method, url, headers, post_data)
+            except Exception:
+                self._record(stats, time.perf_counter() - started, error=True)
+                raise
+        self._record(stats, time.perf_counter() - started, error=response[1] >= 400)
+        return response
+
+    def _should_retry(self, response, api_connection_error, num_retries):
+        if num_retries >= self._max_network_retries():
+            return False
+        if response is not None:
+            _, status_code, rheaders = response
+            if status_code == 429 and (rheaders or {}).get('stripe-should-retry') != 'false':
+                self._count_retry()
+                return True
+        if super()._should_retry(response, api_connection_error, num_retries):
+            self._count_retry()
+            return True
+        return False
+
+    def _sleep_time_seconds(self, num_retries, response=None):
+        delay = min(STRIPE_RETRY_MAX_DELAY, STRIPE_RETRY_BASE_DELAY * (2 ** (num_retries - 1)))
+        delay = random.uniform(delay / 2, delay)
+        # Honour Retry-After when Stripe sends a reasonable one
+        retry_after = self._retry_after_header(response) or 0
+        if retry_after <= self.MAX_RETRY_AFTER:
+            delay = max(delay, retry_after)
+        return delay
+
+    def _count_retry(self):
+        stats = getattr(self._thread_local, 'last_stats', None)
+        if stats is not None:
+            with self._metrics_lock:
+                stats.retries += 1
+
+    def _stats(self, endpoint):
+        stats = self._metrics.get(endpoint)
+        if stats is None:
+            with self._metrics_lock:
+                stats = self._metrics.setdefault(endpoint, EndpointLatency())
+        return stats
+
+    def _record(self, stats, seconds, error):
+        with self._metrics_lock:
+            stats.count += 1
+            stats.total_seconds += seconds
+            stats.samples.append(seconds)
+            if error:
+                stats.errors += 1
+
+    def metrics(self):
+        """endpoint -> {count, errors, retries, avg_ms, p50_ms, p99_ms} for this process"""
+        with self._metrics_lock:
+            return {endpoint: stats.snapshot() for endpoint, stats in self._metrics.items()}
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def configure_stripe_client():
+    """Install the pooled client as the stripe module's HTTP client (idempotent)"""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = PooledStripeClient()
+                stripe.default_http_client = _client
+                stripe.max_network_retries = STRIPE_MAX_RETRIES
+    return _client
+
+
+def get_stripe_http_metrics():
+    return _client.metrics() if _client else {}
@@ -1,7 +1,15 @@
 import os
+import threading
 import stripe
 from datetime import datetime
 from services.user_service import UserService
+from services.webhook_queue import WebhookQueue, WebhookConsumerPool
+from services.webhook_ledger import WebhookEventLedger, SUBSCRIPTION_SNAPSHOT_EVENTS
+from services.cache import LRUCache, SingleFlight
+from services.stripe_http import configure_stripe_client, get_stripe_http_metrics
+from services.price_catalog import PriceCatalog
+from services.event_log_writer import BufferedEventWriter
+from services.subscription_state import SubscriptionStateStore, status_from_subscription, ACTIVE_STATUSES
 from dotenv import load_dotenv
 
 # Load environment variables from the correct path
@@ -10,13 +18,47 @@ try:
 except Exception:
     pass  # Use defaults if .env file doesn't exist or can't be loaded
 
+WEBHOOK_CONSUMERS = int(os.getenv('STRIPE_WEBHOOK_CONSUMERS', 2))
+CUSTOMER_INDEX_SIZE = int(os.getenv('STRIPE_CUSTOMER_INDEX_SIZE', 10000))
+CUSTOMER_INDEX_TTL = int(os.getenv('STRIPE_CUSTOMER_INDEX_TTL', 3600))
+# users.id -> resolved Stripe customer, so repeat checkouts skip the Stripe round trips
+RESOLVED_CUSTOMER_TTL = int(os.getenv('STRIPE_RESOLVED_CUSTOMER_TTL', 300))
+
 class StripeService:
     def __init__(self):
         # Initialize Stripe with secret key from env
         stripe.api_key = os.getenv("STRIPE_SECRET_KEY")
         if not stripe.api_key:
             raise ValueError("Stripe secret key not configured")
+        # Keep-alive pool, 429/5xx retries and a per-process concurrency cap
+        configure_stripe_client()
         self.webhook_secret = os.getenv("STRIPE_WEBHOOK_SECRET")
+        
+        # Shares the process-wide Supabase client with the other services
+        self.user_service = UserService()
+        
+        # stripe_customer_id -> users.id, so a webhook burst for one customer
+        # costs a single users lookup
+        self._customer_users = LRUCache(CUSTOMER_INDEX_SIZE, ttl=CUSTOMER_INDEX_TTL)
+        
+        # Concurrent get_or_create_customer calls for one user share a single
+        # resolution (double-clicks, two tabs) and its result is kept briefly
+        self._customer_flights = SingleFlight()
+        self._resolved_customers = LRUCache(CUSTOMER_INDEX_SIZE, ttl=RESOLVED_CUSTOMER_TTL)
+        
+        # Subscription status materialized from webhooks, served without calling Stripe
+        self.subscription_state = SubscriptionStateStore(self.user_service)
+        
+        # subscription_events rows, written in batches off the request path
+        self.event_log = BufferedEventWriter(self.user_service, table='subscription_events')
+        
+        # Processed event ids, so Stripe redeliveries are skipped
+        self.event_ledger = WebhookEventLedger(self.user_service)
+        
+        # Fast-ack webhook pipeline; consumers start on first enqueue (after fork)
+        self.webhook_queue = None
+        self._webhook_consumers = None
+        self._webhook_lock = threading.Lock()
 
         # Map plan names to price IDs from environment variables
         self.price_ids = {
@@ -28,6 +70,9 @@ class StripeService:
         # Validate that at least basic price exists to avoid silent None later
         if not any(self.price_ids.values()):
             print("⚠️  Stripe price IDs are not set in environment – checkout will fail.")
+        
+        # Every Stripe price, indexed by id; loaded on first plan lookup
+        self.price_catalog = PriceCatalog(self.price_ids)
 
     def create_checkout_session(self, user_id: str, plan_type: str, success_url: str, cancel_url: str):
         """Create a Stripe Checkout Session for one of our subscription plans.
@@ -94,6 +139,11 @@ class StripeService:
     def create_customer(self, user_data):
         """Create a Stripe customer with comprehensive metadata"""
         try:
+            # Idempotent per user and per customer being replaced: racing workers
+            # get the same customer back instead of creating duplicates. The
+            # parameters must be identical across retries, so no timestamps
+            # (Stripe records the customer's `created` itself).
+            idempotency_key = f"create-customer:{user_data.get('id')}:{user_data.get('stripe_customer_id') or 'none'}"
             customer = stripe.Customer.create(
                 email=user_data.get('email'),
                 name=user_data.get('name'),
@@ -102,15 +152,16 @@ class StripeService:
                     'provider': user_data.get('provider', 'unknown'),
                     'google_id': user_data.get('google_id', ''),
                     'github_id': user_data.get('github_id', ''),
-                    'github_username': user_data.get('github_username', ''),
-                    'created_at': datetime.utcnow().isoformat()
-                }
+                    'github_username': user_data.get('github_username', '')
+                },
+                idempotency_key=idempotency_key
             )
             
             # Update user record with Stripe customer ID
             self.user_service.supabase.table('users').update({
                 'stripe_customer_id': customer.id
             }).eq('id', user_data.get('id')).execute()
+            self._remember_customer(customer.id, user_data.get('id'))
             
             return customer
         except stripe.error.StripeError as e:
@@ -121,7 +172,28 @@ class StripeService:
             return None
     
     def get_or_create_customer(self, user_data):
-        """Get existing Stripe customer or create new one with intelligent matching"""
+        """Get existing Stripe customer or create new one with intelligent matching.
+        
+        Concurrent calls for the same user are coalesced into one resolution,
+        and the resolved customer is cached for RESOLVED_CUSTOMER_TTL seconds.
+        """
+        user_id = user_data.get('id')
+        if not user_id:
+            return self._resolve_customer(user_data)
+        
+        customer = self._resolved_customers.get(str(user_id))
+        if customer is not None:
+            return customer
+        return self._customer_flights.do(str(user_id), self._resolve_and_cache_customer, user_data)
+    
+    def _resolve_and_cache_customer(self, user_data):
+        customer = self._resolve_customer(user_data)
+        if customer is not None:
+            self._resolved_customers.put(str(user_data.get('id')), customer)
+        return customer
+    
+    def _resolve_customer(self, user_data):
+        """Retrieve the user's customer, else find one by email, else create one"""
         try:
             # Validate Stripe API key is set
             if not stripe.api_key:
@@ -147,6 +219,7 @@ class StripeService:
                     
                     if not is_deleted:
                         print(f"✅ Found existing customer and it is active: {user_data['stripe_customer_id']}")
+                        self._remember_customer(customer.id, user_data.get('id'))
                         return customer
                     else:
                         print("⚠️  Customer record is marked deleted – will create a brand-new customer")
@@ -168,6 +241,7 @@ class StripeService:
                 self.user_service.supabase.table('users').update({
                     'stripe_customer_id': customer.id
                 }).eq('id', user_data.get('id')).execute()
+                self._remember_customer(customer.id, user_data.get('id'))
                 return customer
             else:
                 # Create new customer
@@ -183,8 +257,43 @@ class StripeService:
             traceback.print_exc()
             return None
     
+    def _remember_customer(self, customer_id, user_id):
+        """Record a known stripe_customer_id -> user id mapping"""
+        if customer_id and user_id:
+            self._customer_users.put(customer_id, str(user_id))
+    
+    def _get_user_id_for_customer(self, customer_id):
+        """Resolve a Stripe customer to our user id, hitting the database only on a cache miss"""
+        if not customer_id:
+            return None
+        user_id = self._customer_users.get(customer_id)
+        if user_id:
+            return user_id
+        
+        # strict: a failed lookup must fail the webhook so it is retried, not
+        # look like a customer we don't know
+        user = self.user_service.get_user_by_customer_id(customer_id, strict=True)
+        if not user:
+            return None
+        self._remember_customer(customer_id, user['id'])
+        return user['id']
+    
     def get_subscription_status(self, customer_id):
-        """Get comprehensive subscription status for a customer"""
+        """Get comprehensive subscription status for a customer.
+        
+        Served from the webhook-maintained subscription state; Stripe is only
+        asked when the stored state is missing or older than its freshness bound.
+        """
+        status = self.subscription_state.get_fresh(customer_id)
+        if status is not None:
+            return status
+        
+        status = self.fetch_subscription_status(customer_id)
+        self.subscription_state.save(customer_id, status)
+        return status
+    
+    def fetch_subscription_status(self, customer_id):
+        """Get subscription status for a customer live from Stripe"""
         try:
             # Get active subscriptions
             subscriptions = stripe.Subscription.list(
@@ -196,40 +305,17 @@ class StripeService:
             if not subscriptions.data:
                 return {'status': 'inactive', 'plan': 'free'}
             
-            # Find the most recent active subscription
+            # Find the most recent active subscription, falling back to the
+            # most recent canceled or incomplete one
             active_subscription = None
             for subscription in subscriptions.data:
-                if subscription.status in ['active', 'trialing', 'past_due']:
+                if subscription.status in ACTIVE_STATUSES:
                     active_subscription = subscription
                     break
             
-            if active_subscription:
-                # Get plan information
-                plan_item = active_subscription.items.data[0]
-                price = plan_item.price
-                
-                return {
-                    'status': active_subscription.status,
-                    'subscription_id': active_subscription.id,
-                    'plan': self._get_plan_name_from_price_id(price.id),
-                    'current_period_start': active_subscription.current_period_start,
-                    'current_period_end': active_subscription.current_period_end,
-                    'cancel_at_period_end': active_subscription.cancel_at_period_end,
-                    'canceled_at': active_subscription.canceled_at,
-                    'trial_end': active_subscription.trial_end,
-                    'amount': price.unit_amount,
-                    'currency': price.currency,
-                    'interval': price.recurring.interval
-                }
-            else:
-                # Check for canceled or incomplete subscriptions
-                recent_subscription = subscriptions.data[0]
-                return {
-                    'status': recent_subscription.status,
-                    'subscription_id': recent_subscription.id,
-                    'plan': 'free',
-                    'canceled_at': recent_subscription.canceled_at
-                }
+            return status_from_subscription(
+                active_subscription or subscriptions.data[0], self._get_plan_name_from_price_id
+            )
                 
         except stripe.error.StripeError as e:
             print(f"Stripe error getting subscription status: {e}")
@@ -240,10 +326,7 @@ class StripeService:
     
     def _get_plan_name_from_price_id(self, price_id):
         """Map Stripe price ID to plan name"""
-        for plan_name, plan_price_id in self.price_ids.items():
-            if plan_price_id == price_id:
-                return plan_name
-        return 'unknown'
+        return self.price_catalog.plan_for_price(price_id)
     
     def cancel_subscription(self, subscription_id, immediate=False):
         """Cancel a subscription with options for immediate or end-of-period cancellation"""
@@ -258,6 +341,7 @@ class StripeService:
                     cancel_at_period_end=True
                 )
             
+            self.subscription_state.apply_subscription(subscription, self._get_plan_name_from_price_id)
             return subscription
         except stripe.error.StripeError as e:
             print(f"Stripe error canceling subscription: {e}")
@@ -273,6 +357,7 @@ class StripeService:
                 subscription_id,
                 cancel_at_period_end=False
             )
+            self.subscription_state.apply_subscription(subscription, self._get_plan_name_from_price_id)
             return subscription
         except stripe.error.StripeError as e:
             print(f"Stripe error reactivating subscription: {e}")
@@ -282,33 +367,13 @@ class StripeService:
             return None
     
     def handle_webhook(self, payload, sig_header):
-        """Handle Stripe webhook events with comprehensive processing"""
+        """Verify and process a Stripe webhook synchronously, in the request"""
         try:
             # Verify webhook signature
             event = stripe.Webhook.construct_event(
                 payload, sig_header, self.webhook_secret
             )
-            
-            print(f"Processing Stripe webhook event: {event['type']}")
-            
-            # Handle different event types
-            if event['type'] == 'checkout.session.completed':
-                self.handle_checkout_completed(event['data']['object'])
-            elif event['type'] == 'customer.subscription.created':
-                self.handle_subscription_created(event['data']['object'])
-            elif event['type'] == 'customer.subscription.updated':
-                self.handle_subscription_updated(event['data']['object'])
-            elif event['type'] == 'customer.subscription.deleted':
-                self.handle_subscription_deleted(event['data']['object'])
-            elif event['type'] == 'invoice.payment_succeeded':
-                self.handle_payment_succeeded(event['data']['object'])
-            elif event['type'] == 'invoice.payment_failed':
-                self.handle_payment_failed(event['data']['object'])
-            elif event['type'] == 'customer.subscription.trial_will_end':
-                self.handle_trial_will_end(event['data']['object'])
-            else:
-                print(f"Unhandled webhook event type: {event['type']}")
-            
+            self.process_event(event)
             return True
             
         except ValueError as e:
@@ -321,12 +386,104 @@ class StripeService:
             print(f"Error handling webhook: {e}")
             return False
     
+    def enqueue_webhook(self, payload, sig_header):
+        """Verify a Stripe webhook and persist it for background processing.
+        
+        Returns True as soon as the event is durable, so the route can answer
+        200 immediately; the consumer pool runs the handlers afterwards with
+        per-customer ordering.
+        """
+        try:
+            event = stripe.Webhook.construct_event(
+                payload, sig_header, self.webhook_secret
+            )
+            if self.event_ledger.seen_recently(event['id']):
+                print(f"Skipping redelivered webhook event: {event['id']}")
+                return True
+            self._ensure_webhook_consumers()
+            self.webhook_queue.enqueue(event, payload)
+            return True
+            
+        except ValueError as e:
+            print(f"Invalid webhook payload: {e}")
+            return False
+        except stripe.error.SignatureVerificationError as e:
+            print(f"Invalid webhook signature: {e}")
+            return False
+        except Exception as e:
+            print(f"Error queueing webhook: {e}")
+            return False
+    
+    def _ensure_webhook_consumers(self):
+        """Open the queue and start this process's consumer pool once"""
+        if self._webhook_consumers is not None:
+            return
+        with self._webhook_lock:
+            if self._webhook_consumers is None:
+                self.webhook_queue = self.webhook_queue or WebhookQueue()
+                consumers = WebhookConsumerPool(
+                    self.webhook_queue, self.process_event, workers=WEBHOOK_CONSUMERS
+                )
+                consumers.start()
+                self._webhook_consumers = consumers
+    
+    def stop_webhook_consumers(self):
+        """Stop the consumer pool; queued events stay on disk for the next start"""
+        with self._webhook_lock:
+            if self._webhook_consumers is not None:
+                self._webhook_consumers.stop()
+                self._webhook_consumers = None
+    
+    def get_api_metrics(self):
+        """Per-endpoint Stripe API latency, error and retry counts for this process"""
+        return get_stripe_http_metrics()
+    
+    def process_event(self, event):
+        """Dispatch a verified webhook event to its handler"""
+        if self.event_ledger.is_duplicate(event):
+            print(f"Skipping already processed webhook event: {event['id']}")
+            return
+        if self.event_ledger.is_stale(event):
+            print(f"Skipping out-of-order webhook event: {event['id']} ({event['type']})")
+            self.event_ledger.record(event)
+            return
+        
+        print(f"Processing Stripe webhook event: {event['type']}")
+        
+        # Handle different event types
+        if event['type'] == 'checkout.session.completed':
+            self.handle_checkout_completed(event['data']['object'])
+        elif event['type'] == 'customer.subscription.created':
+            self.handle_subscription_created(event['data']['object'])
+        elif event['type'] == 'customer.subscription.updated':
+            self.handle_subscription_updated(event['data']['object'])
+        elif event['type'] == 'customer.subscription.deleted':
+            self.handle_subscription_deleted(event['data']['object'])
+        elif event['type'] == 'invoice.payment_succeeded':
+            self.handle_payment_succeeded(event['data']['object'])
+        elif event['type'] == 'invoice.payment_failed':
+            self.handle_payment_failed(event['data']['object'])
+        elif event['type'] == 'customer.subscription.trial_will_end':
+            self.handle_trial_will_end(event['data']['object'])
+        else:
+            print(f"Unhandled webhook event type: {event['type']}")
+        
+        if event['type'] in SUBSCRIPTION_SNAPSHOT_EVENTS:
+            self.subscription_state.apply_subscription(
+                event['data']['object'], self._get_plan_name_from_price_id, event.get('created')
+            )
+        
+        # Only reached once the handlers succeeded: an event whose handler
+        # raised stays unrecorded, so its redelivery or retry is not skipped
+        self.event_ledger.record(event)
+    
     def handle_checkout_completed(self, session):
         """Handle successful checkout completion"""
         try:
             user_id = session.get('metadata', {}).get('user_id')
             plan_type = session.get('metadata', {}).get('plan_type')
             subscription_id = session.get('subscription')
+            self._remember_customer(session.get('customer'), user_id)
             
             if user_id and plan_type:
                 # Update user subscription status
@@ -354,6 +511,7 @@ class StripeService:
                     
         except Exception as e:
             print(f"Error handling checkout completion: {e}")
+            raise
     
     def handle_subscription_updated(self, subscription):
         """Handle subscription updates including plan changes and status changes"""
@@ -363,14 +521,9 @@ class StripeService:
             status = subscription.get('status')
             
             # Find user by customer ID
-            user_result = self.user_service.supabase.table('users').select('*').eq(
-                'stripe_customer_id', customer_id
-            ).execute()
+            user_id = self._get_user_id_for_customer(customer_id)
             
-            if user_result.data:
-                user = user_result.data[0]
-                user_id = user['id']
-                
+            if user_id:
                 # Get plan information
                 plan_type = 'free'
                 if subscription.get('items', {}).get('data'):
@@ -409,6 +562,7 @@ class StripeService:
                     
         except Exception as e:
             print(f"Error handling subscription update: {e}")
+            raise
     
     def handle_subscription_deleted(self, subscription):
         """Handle subscription cancellation"""
@@ -417,14 +571,9 @@ class StripeService:
             subscription_id = subscription.get('id')
             
             # Find user by customer ID
-            user_result = self.user_service.supabase.table('users').select('*').eq(
-                'stripe_customer_id', customer_id
-            ).execute()
+            user_id = self._get_user_id_for_customer(customer_id)
             
-            if user_result.data:
-                user = user_result.data[0]
-                user_id = user['id']
-                
+            if user_id:
                 # Update user to free plan
                 update_data = {
                     'subscription_status': 'cancelled',
@@ -450,6 +599,7 @@ class StripeService:
                     
         except Exception as e:
             print(f"Error handling subscription deletion: {e}")
+            raise
     
     def handle_payment_failed(self, invoice):
         """Handle failed payment attempts"""
@@ -459,14 +609,9 @@ class StripeService:
             amount_due = invoice.get('amount_due', 0)
             
             # Find user by customer ID
-            user_result = self.user_service.supabase.table('users').select('*').eq(
-                'stripe_customer_id', customer_id
-            ).execute()
+            user_id = self._get_user_id_for_customer(customer_id)
             
-            if user_result.data:
-                user = user_result.data[0]
-                user_id = user['id']
-                
+            if user_id:
                 print(f"Payment failed for user {user_id}, amount: {amount_due}")
                 
                 # Log payment failure
@@ -486,6 +631,7 @@ class StripeService:
                 
         except Exception as e:
             print(f"Error handling payment failure: {e}")
+            raise
     
     def handle_payment_succeeded(self, invoice):
         """Handle successful payment"""
@@ -495,14 +641,9 @@ class StripeService:
             amount_paid = invoice.get('amount_paid', 0)
             
             # Find user by customer ID
-            user_result = self.user_service.supabase.table('users').select('*').eq(
-                'stripe_customer_id', customer_id
-            ).execute()
+            user_id = self._get_user_id_for_customer(customer_id)
             
-            if user_result.data:
-                user = user_result.data[0]
-                user_id = user['id']
-                
+            if user_id:
                 print(f"Payment succeeded for user {user_id}, amount: {amount_paid}")
                 
                 # Log successful payment
@@ -517,6 +658,7 @@ class StripeService:
                 
         except Exception as e:
             print(f"Error handling payment success: {e}")
+            raise
     
     def handle_subscription_created(self, subscription):
         """Handle new subscription creation"""
@@ -525,14 +667,9 @@ class StripeService:
             subscription_id = subscription.get('id')
             
             # Find user by customer ID
-            user_result = self.user_service.supabase.table('users').select('*').eq(
-                'stripe_customer_id', customer_id
-            ).execute()
+            user_id = self._get_user_id_for_customer(customer_id)
             
-            if user_result.data:
-                user = user_result.data[0]
-                user_id = user['id']
-                
+            if user_id:
                 print(f"New subscription created for user {user_id}")
                 
                 # Log subscription creation
@@ -543,6 +680,7 @@ class StripeService:
                 
         except Exception as e:
             print(f"Error handling subscription creation: {e}")
+            raise
     
     def handle_trial_will_end(self, subscription):
         """Handle trial ending soon"""
@@ -551,14 +689,9 @@ class StripeService:
             subscription_id = subscription.get('id')
             
             # Find user by customer ID
-            user_result = self.user_service.supabase.table('users').select('*').eq(
-                'stripe_customer_id', customer_id
-            ).execute()
+            user_id = self._get_user_id_for_customer(customer_id)
             
-            if user_result.data:
-                user = user_result.data[0]
-                user_id = user['id']
-                
+            if user_id:
                 print(f"Trial ending soon for user {user_id}")
                 
                 # Log trial ending
@@ -573,6 +706,7 @@ class StripeService:
                 
         except Exception as e:
             print(f"Error handling trial ending: {e}")
+            raise
     
     def _log_subscription_event(self, user_id, event_type, metadata):
         """Log subscription events for audit and analytics"""
@@ -584,9 +718,17 @@ class StripeService:
                 'created_at': datetime.utcnow().isoformat()
             }
             
-            # This could be logged to a separate subscription_events table
-            # or integrated with the existing activity logging system
+            self.event_log.add(log_data)
             print(f"Subscription event logged: {event_type} for user {user_id}")
             
         except Exception as e:
-            print(f"Error logging subscription event: {e}") 
\ No newline at end of file
+            print(f"Error logging subscription event: {e}")
+
+# Global instance - lazy loaded
+_stripe_service = None
+
+def get_stripe_service():
+    global _stripe_service
+    if _stripe_service is None:
+        _stripe_service = StripeService()
+    return _stripe_service
@@ -0,0 +1,164 @@
+import os
+import time
+from services.cache import LRUCache
+
+# How old a stored status may be before get_subscription_status asks Stripe again.
+# Webhooks keep rows current, so this only bounds drift from missed events.
+SUBSCRIPTION_STATE_MAX_AGE = int(os.getenv('SUBSCRIPTION_STATE_MAX_AGE', 3600))
+# Per-process cache in front of the table; short so workers converge quickly
+SUBSCRIPTION_STATE_CACHE_TTL = int(os.getenv('SUBSCRIPTION_STATE_CACHE_TTL', 30))
+
+ACTIVE_STATUSES = ('active', 'trialing', 'past_due')
+
+# Keys of the status dict returned by StripeService.get_subscription_status
+STATUS_FIELDS = (
+    'status', 'subscription_id', 'plan', 'current_period_start', 'current_period_end',
+    'cancel_at_period_end', 'canceled_at', 'trial_end', 'amount', 'currency', 'interval'
+)
+
+
+def status_from_subscription(subscription, plan_for_price):
+    """Build the get_subscription_status dict from a Stripe subscription.
+
+    Uses mapping access only, so it works for StripeObjects and for the plain
+    dicts webhook consumers get from the queue.
+    """
+    status = subscription.get('status')
+    if status not in ACTIVE_STATUSES:
+        return {
+            'status': status,
+            'subscription_id': subscription.get('id'),
+            'plan': 'free',
+            'canceled_at': subscription.get('canceled_at')
+        }
+
+    items = (subscription.get('items') or {}).get('data') or []
+    price = (items[0].get('price') or {}) if items else {}
+    return {
+        'status': status,
+        'subscription_id': subscription.get('id'),
+        'plan': plan_for_price(price.get('id')) if price else 'free',
+        'current_period_start': subscription.get('current_period_start'),
+        'current_period_end': subscription.get('current_period_end'),
+        'cancel_at_period_end': subscription.get('cancel_at_period_end'),
+        'canceled_at': subscription.get('canceled_at'),
+        'trial_end': subscription.get('trial_end'),
+        'amount': price.get('unit_amount'),
+        'currency': price.get('currency'),
+        'interval': (price.get('recurring') or {}).get('interval')
+    }
+
+
+class SubscriptionStateStore:
+    """Materialized per-customer subscription status in the stripe_subscriptions table"""
+
+    def __init__(self, user_service, max_age=SUBSCRIPTION_STATE_MAX_AGE):
+        self.user_service = user_service
+        self.max_age = max_age
+        self._cache = LRUCache(10000, ttl=SUBSCRIPTION_STATE_CACHE_TTL)
+
+    def get_fresh(self, customer_id):
+        """Stored status dict if synced within max_age, else None"""
+        row = self._cache.get(customer_id)
+        if row is None:
+            row = self._load(customer_id)
+            if row is None:
+                return None
+            self._cache.put(customer_id, row)
+
+        if time.time() - (row.get('synced_at') or 0) > self.max_age:
+            return None
+        return {field: row.get(field) for field in STATUS_FIELDS}
+
+    def save(self, customer_id, status):
+        """Store a status dict (from Stripe or a webhook) as the customer's current state"""
+        if not customer_id or status.get('status') == 'error':
+            return
+        row = {field: status.get(field) for field in STATUS_FIELDS}
+        row['customer_id'] = customer_id
+        row['synced_at'] = int(time.time())
+        self._cache.put(customer_id, row)
+
+        supabase = self.user_service.supabase
+        if not supabase:
+            return
+        try:
+            supabase.table('stripe_subscriptions').upsert(row, on_conflict='customer_id').execute()
+        except Exception as e:
+            print(f"Error saving subscription state for {customer_id}: {e}")
+
+    def apply_subscription(self, subscription, plan_for_price, event_created=None):
+        """Fold a customer.subscription.* webhook object into the stored state.
+
+        event_created is the event's `created` (now, for an object just
+        returned by the API). A snapshot older than the stored one is
+        skipped, so a delayed webhook cannot roll the state back.
+        """
+        customer_id = subscription.get('customer')
+        if not customer_id:
+            return
+        status = status_from_subscription(subscription, plan_for_price)
+        if event_created is None:
+            event_created = int(time.time())
+
+        # A customer can have several subscriptions; an inactive one must not
+        # replace the state of a different, active subscription
+        current = self._cache.get(customer_id) or self._load(customer_id)
+        if (current and current.get('subscription_id') != status['subscription_id']
+                and current.get('status') in ACTIVE_STATUSES
+                and status['status'] not in ACTIVE_STATUSES):
+            return
+        if current and (current.get('event_created') or 0) > event_created:
+            return
+
+        row = {field: status.get(field) for field in STATUS_FIELDS}
+        row['customer_id'] = customer_id
+        row['synced_at'] = int(time.time())
+        row['event_created'] = event_created
+
+        supabase = self.user_service.supabase
+        if not supabase:
+            self._cache.put(customer_id, row)
+            return
+        try:
+            applied = self._write_if_newer(supabase, row)
+        except Exception as e:
+            print(f"Error applying subscription state for {customer_id}: {e}")
+            self._cache.pop(customer_id)
+            return
+        if applied:
+            self._cache.put(customer_id, row)
+        else:
+            # Another worker stored a newer snapshot first
+            self._cache.pop(customer_id)
+
+    def _write_if_newer(self, supabase, row):
+        """Store row unless the stored state comes from a later event; returns whether it was written"""
+        result = supabase.table('stripe_subscriptions').update(row).eq(
+            'customer_id', row['customer_id']
+        ).or_(f"event_created.is.null,event_created.lte.{int(row['event_created'])}").execute()
+        if result.data:
+            return True
+        try:
+            result = supabase.table('stripe_subscriptions').insert(row).execute()
+        except Exception as e:
+            # customer_id is the primary key: a row exists, and is newer
+            print(f"Subscription state for {row['customer_id']} is newer, skipping: {e}")
+            return False
+        return bool(result.data)
+
+    def invalidate(self, customer_id):
+        self._cache.pop(customer_id)
+
+    def _load(self, customer_id):
+        supabase = self.user_service.supabase
+        if not supabase:
+            return None
+        try:
+            result = supabase.table('stripe_subscriptions').select('*').eq(
+                'customer_id', customer_id
+            ).limit(1).execute()
+            return result.data[0] if result.data else None
+        except Exception as e:
+            print(f"Error loading subscription state for {customer_id}: {e}")
+            return None
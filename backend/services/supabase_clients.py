@@ -0,0 +1,122 @@
+import os
+import threading
+import weakref
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from supabase import Client
+
+# Process-wide client registry: at most one anon and one service-role client
+# per process. Clients are built on first use and rebuilt after a fork, so a
+# gunicorn master with preload_app=True never hands its connection pool to
+# the workers.
+_clients = {}
+_clients_pid = None
+_lock = threading.Lock()
+
+# Async PostgREST clients hold an httpx connection pool bound to the event
+# loop that created them, so there is one per (process, loop)
+_async_clients = weakref.WeakKeyDictionary()
+_async_clients_pid = None
+
+
+def _client_settings(role):
+    """Return (url, key) for the given client role"""
+    # Same settings (and .env) as the rest of the backend
+    from config import Config
+
+    supabase_url = Config.SUPABASE_URL
+    anon_key = Config.SUPABASE_ANON_KEY
+    if role == 'service_role':
+        # Service role key bypasses RLS; fall back to anon like UserService always has
+        return supabase_url, os.getenv('SUPABASE_SERVICE_ROLE_KEY', anon_key)
+    return supabase_url, anon_key
+
+
+def _get_client(role):
+    global _clients_pid
+
+    pid = os.getpid()
+    client = _clients.get(role) if _clients_pid == pid else None
+    if client is not None:
+        return client
+
+    with _lock:
+        if _clients_pid != pid:
+            # First use in this process (or first use after fork)
+            _clients.clear()
+            _clients_pid = pid
+
+        client = _clients.get(role)
+        if client is None:
+            # Imported on first use: the supabase SDK is heavy and most
+            # processes (workers recycling, scripts, tests) may never need it
+            from supabase import create_client
+            supabase_url, supabase_key = _client_settings(role)
+            try:
+                client = create_client(supabase_url, supabase_key)
+                _clients[role] = client
+                print(f"✅ Supabase {role} client created (pid: {pid})")
+            except Exception as e:
+                print(f"Warning: Could not initialize Supabase {role} client: {e}")
+                return None
+        return client
+
+
+def get_anon_client() -> 'Client':
+    """Shared Supabase client using the anon key"""
+    return _get_client('anon')
+
+
+def get_service_client() -> 'Client':
+    """Shared Supabase client using the service role key (anon if unset)"""
+    return _get_client('service_role')
+
+
+def get_async_service_client():
+    """Shared async PostgREST client (service role) for the running event loop"""
+    global _async_clients_pid
+    import asyncio
+    from postgrest import AsyncPostgrestClient
+    from postgrest.constants import DEFAULT_POSTGREST_CLIENT_HEADERS
+
+    loop = asyncio.get_running_loop()
+    pid = os.getpid()
+    with _lock:
+        if _async_clients_pid != pid:
+            _async_clients.clear()
+            _async_clients_pid = pid
+
+        client = _async_clients.get(loop)
+        if client is None:
+            supabase_url, supabase_key = _client_settings('service_role')
+            client = AsyncPostgrestClient(
+                f"{supabase_url.rstrip('/')}/rest/v1",
+                headers={
+                    **DEFAULT_POSTGREST_CLIENT_HEADERS,
+                    'apikey': supabase_key,
+                    'Authorization': f'Bearer {supabase_key}'
+                }
+            )
+            _async_clients[loop] = client
+            print(f"✅ Async Supabase service_role client created (pid: {pid})")
+        return client
+
+
+async def close_async_clients():
+    """Close the async client for the running event loop, if any"""
+    import asyncio
+    with _lock:
+        client = _async_clients.pop(asyncio.get_running_loop(), None)
+    if client is not None:
+        await client.aclose()
+
+
+def reset_clients():
+    """Drop all cached clients; the next call builds fresh ones"""
+    global _clients_pid, _async_clients_pid
+    with _lock:
+        _clients.clear()
+        _clients_pid = None
+        _async_clients.clear()
+        _async_clients_pid = None
@@ -0,0 +1,176 @@
+import os
+import time
+import uuid
+
+from services.supabase_clients import get_service_client
+from services.upload_storage import UPLOAD_CHUNK_SIZE, get_upload_storage
+
+UPLOAD_BUCKET = os.getenv('UPLOAD_BUCKET', 'user-files')
+UPLOAD_MAX_PART_SIZE = int(os.getenv('UPLOAD_MAX_PART_SIZE', 64 * 1024 * 1024))
+UPLOAD_MAX_FILE_SIZE = int(os.getenv('UPLOAD_MAX_FILE_SIZE', 5 * 1024 * 1024 * 1024))
+UPLOAD_MAX_PARTS = 10000
+# Unfinished uploads with no activity for this long are discarded
+UPLOAD_EXPIRY_SECONDS = int(os.getenv('UPLOAD_EXPIRY_SECONDS', 24 * 3600))
+# How often a process looks for expired uploads
+_EXPIRY_SWEEP_INTERVAL = 3600
+
+
+class UploadError(Exception):
+    """Raised for upload requests that can never succeed as sent"""
+
+
+class UploadService:
+    """Resumable multipart uploads recorded in the uploaded_files table.
+
+    A client starts an upload, PUTs the file as numbered parts (in any
+    order, retrying any part as often as needed) and then completes it.
+    Part bodies are streamed to storage chunk by chunk and hashed on the
+    way, so memory use does not depend on the file size. The
+    uploaded_files row is written only once the file is assembled, and
+    the parts are kept until then. Uploads left unfinished for
+    expiry_seconds are discarded.
+    """
+
+    def __init__(self, storage=None, bucket=UPLOAD_BUCKET, max_part_size=UPLOAD_MAX_PART_SIZE,
+                 max_file_size=UPLOAD_MAX_FILE_SIZE, expiry_seconds=UPLOAD_EXPIRY_SECONDS):
+        self.storage = storage or get_upload_storage()
+        self.bucket = bucket
+        self.max_part_size = max_part_size
+        self.max_file_size = max_file_size
+        self.expiry_seconds = expiry_seconds
+        self._last_sweep = 0
+
+    def start_upload(self, user_id, file_name, file_type=None, file_size=None):
+        """Create an upload for the user; returns its id and the part limits"""
+        file_name = os.path.basename((file_name or '').replace('\\', '/')).strip()
+        if not file_name or file_name in ('.', '..'):
+            raise UploadError("file_name is required")
+        if file_size is not None:
+            if not isinstance(file_size, int) or file_size < 0:
+                raise UploadError("file_size must be a non-negative integer")
+            if file_size > self.max_file_size:
+                raise UploadError(f"file_size exceeds the {self.max_file_size} byte limit")
+
+        self.expire_uploads()
+        upload_id = uuid.uuid4().hex
+        metadata = {
+            'upload_id': upload_id,
+            'user_id': user_id,
+            'file_name': file_name,
+            'file_type': file_type,
+            'file_size': file_size,
+            'storage_bucket': self.bucket,
+            'storage_path': f"{user_id}/{upload_id}/{file_name}",
+            'started_at': int(time.time()),
+        }
+        self.storage.create_multipart(upload_id, metadata)
+        return {
+            'upload_id': upload_id,
+            'chunk_size': UPLOAD_CHUNK_SIZE,
+            'max_part_size': self.max_part_size,
+            'max_parts': UPLOAD_MAX_PARTS,
+        }
+
+    def get_upload(self, user_id, upload_id):
+        """Upload metadata and received parts, or None if unknown or not the user's"""
+        upload = self.storage.get_multipart(upload_id)
+        if not upload or upload['user_id'] != user_id:
+            return None
+        upload['received_bytes'] = sum(part['size'] for part in upload['parts'])
+        return upload
+
+    def upload_part(self, user_id, upload_id, part_number, stream):
+        """Stream one part from a file-like body; returns its size and sha256, or None if unknown"""
+        if not 1 <= part_number <= UPLOAD_MAX_PARTS:
+            raise UploadError(f"part_number must be between 1 and {UPLOAD_MAX_PARTS}")
+        upload = self.get_upload(user_id, upload_id)
+        if not upload:
+            return None
+
+        # Bytes the upload may still take, not counting an earlier copy of this part
+        limit = upload['file_size'] if upload['file_size'] is not None else self.max_file_size
+        other_parts = sum(part['size'] for part in upload['parts'] if part['part_number'] != part_number)
+        remaining = limit - other_parts
+        if remaining <= 0:
+            raise UploadError(f"Upload already holds {other_parts} of at most {limit} bytes")
+        return self.storage.write_part(
+            upload_id, part_number, stream, max_bytes=min(self.max_part_size, remaining)
+        )
+
+    def complete_upload(self, user_id, upload_id, expected_sha256=None):
+        """Assemble parts 1..N into the final file and record it; returns the uploaded_files row"""
+        upload = self.get_upload(user_id, upload_id)
+        if not upload:
+            return None
+
+        part_numbers = [part['part_number'] for part in upload['parts']]
+        if not part_numbers:
+            raise UploadError("No parts uploaded")
+        missing = sorted(set(range(1, max(part_numbers) + 1)) - set(part_numbers))
+        if missing:
+            raise UploadError(f"Missing parts: {missing[:20]}")
+        total = upload['received_bytes']
+        if total > self.max_file_size:
+            raise UploadError(f"Upload exceeds the {self.max_file_size} byte limit")
+        if upload['file_size'] is not None and total != upload['file_size']:
+            raise UploadError(f"Received {total} bytes, expected {upload['file_size']}")
+
+        supabase = get_service_client()
+        if not supabase:
+            raise RuntimeError("Supabase service client unavailable")
+
+        # Until the row is inserted the parts are kept, so every failure below
+        # only removes the assembled object and complete can be retried
+        size, sha256 = self.storage.complete_multipart(
+            upload_id, upload['storage_bucket'], upload['storage_path'], part_numbers
+        )
+        if expected_sha256 and expected_sha256.lower() != sha256:
+            self.storage.delete(upload['storage_bucket'], upload['storage_path'])
+            raise UploadError(f"sha256 mismatch: received {sha256}")
+
+        row = {
+            'user_id': user_id,
+            'file_name': upload['file_name'],
+            'file_path': upload['storage_path'],
+            'file_size': size,
+            'file_type': upload['file_type'],
+            'storage_bucket': upload['storage_bucket'],
+            'storage_path': upload['storage_path'],
+            'content_sha256': sha256,
+        }
+        try:
+            result = supabase.table('uploaded_files').insert(row).execute()
+        except Exception:
+            # Don't leave an object behind that no row points to
+            self.storage.delete(upload['storage_bucket'], upload['storage_path'])
+            raise
+        self.storage.abort_multipart(upload_id)
+        return result.data[0] if result.data else row
+
+    def abort_upload(self, user_id, upload_id):
+        """Discard an unfinished upload; returns False if unknown or not the user's"""
+        if not self.get_upload(user_id, upload_id):
+            return False
+        self.storage.abort_multipart(upload_id)
+        return True
+
+    def expire_uploads(self, force=False):
+        """Discard abandoned uploads, at most once per sweep interval unless forced; returns how many"""
+        now = time.time()
+        if not force and now - self._last_sweep < _EXPIRY_SWEEP_INTERVAL:
+            return 0
+        self._last_sweep = now
+        expired = self.storage.expire_multipart(self.expiry_seconds)
+        if expired:
+            print(f"🧹 Discarded {expired} abandoned uploads")
+        return expired
+
+
+# Global instance - lazy loaded
+_upload_service = None
+
+def get_upload_service():
+    global _upload_service
+    if _upload_service is None:
+        _upload_service = UploadService()
+    return _upload_service
@@ -0,0 +1,201 @@
+import hashlib
+import json
+import os
+import re
+import shutil
+import threading
+import time
+
+# Bytes read from the request body or a part file per iteration
+UPLOAD_CHUNK_SIZE = int(os.getenv('UPLOAD_CHUNK_SIZE', 1024 * 1024))
+UPLOAD_STORAGE_DIR = os.getenv(
+    'UPLOAD_STORAGE_DIR',
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data', 'uploads')
+)
+
+_UPLOAD_ID_RE = re.compile(r'^[0-9a-f]{32}$')
+
+
+class StorageError(Exception):
+    """Raised for invalid or unknown uploads, parts and object paths"""
+
+
+class PartTooLarge(StorageError):
+    """Raised when a part body is larger than the allowed part size"""
+
+
+def copy_stream(source, destination, chunk_size=UPLOAD_CHUNK_SIZE, max_bytes=None, digest=None):
+    """Copy source to destination in fixed-size chunks; returns (bytes copied, sha256 hex).
+
+    Only one chunk is in memory at a time. Raises PartTooLarge as soon as
+    more than max_bytes have been read.
+    """
+    digest = digest or hashlib.sha256()
+    size = 0
+    while True:
+        chunk = source.read(chunk_size)
+        if not chunk:
+            break
+        size += len(chunk)
+        if max_bytes is not None and size > max_bytes:
+            raise PartTooLarge(f"Part exceeds {max_bytes} bytes")
+        digest.update(chunk)
+        destination.write(chunk)
+    return size, digest.hexdigest()
+
+
+class LocalFileStorage:
+    """Filesystem storage backend for uploaded files.
+
+    Objects live at <root>/<bucket>/<path>. A multipart upload keeps its
+    metadata and one file per received part under <root>/.multipart/<upload_id>/,
+    so an interrupted upload can be resumed by any worker on the host and
+    a re-sent part simply replaces the earlier copy. Parts and objects are
+    written to a temporary name and renamed into place, so readers never
+    see a partial file.
+    """
+
+    def __init__(self, root=UPLOAD_STORAGE_DIR, chunk_size=UPLOAD_CHUNK_SIZE):
+        self.root = os.path.abspath(root)
+        self.chunk_size = chunk_size
+        self._multipart_root = os.path.join(self.root, '.multipart')
+
+    # ---- multipart uploads ----
+
+    def create_multipart(self, upload_id, metadata):
+        """Start a multipart upload with the given metadata"""
+        upload_dir = self._upload_dir(upload_id)
+        os.makedirs(upload_dir)
+        self._write_json(os.path.join(upload_dir, 'upload.json'), metadata)
+
+    def get_multipart(self, upload_id):
+        """Upload metadata plus the parts received so far, or None if unknown"""
+        upload_dir = self._upload_dir(upload_id)
+        try:
+            with open(os.path.join(upload_dir, 'upload.json')) as f:
+                metadata = json.load(f)
+        except FileNotFoundError:
+            return None
+
+        parts = []
+        for name in sorted(os.listdir(upload_dir)):
+            if name.startswith('part-') and name.endswith('.json'):
+                with open(os.path.join(upload_dir, name)) as f:
+                    parts.append(json.load(f))
+        return {**metadata, 'parts': parts}
+
+    def write_part(self, upload_id, part_number, stream, max_bytes=None):
+        """Stream one part to disk while hashing it; returns {'part_number', 'size', 'sha256'}"""
+        upload_dir = self._upload_dir(upload_id)
+        if not os.path.isdir(upload_dir):
+            raise StorageError(f"Unknown upload {upload_id}")
+
+        part_path = os.path.join(upload_dir, f"part-{part_number:05d}")
+        tmp_path = f"{part_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, 'wb') as f:
+                size, sha256 = copy_stream(stream, f, self.chunk_size, max_bytes)
+            os.replace(tmp_path, part_path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+        part = {'part_number': part_number, 'size': size, 'sha256': sha256}
+        self._write_json(f"{part_path}.json", part)
+        return part
+
+    def complete_multipart(self, upload_id, bucket, path, part_numbers):
+        """Concatenate the given parts into bucket/path; returns (size, sha256 hex of the whole file)"""
+        upload_dir = self._upload_dir(upload_id)
+        destination = self._object_path(bucket, path)
+        os.makedirs(os.path.dirname(destination), exist_ok=True)
+
+        tmp_path = f"{destination}.{upload_id}.tmp"
+        digest = hashlib.sha256()
+        size = 0
+        try:
+            with open(tmp_path, 'wb') as out:
+                for part_number in part_numbers:
+                    with open(os.path.join(upload_dir, f"part-{part_number:05d}"), 'rb') as part:
+                        part_size, _ = copy_stream(part, out, self.chunk_size, digest=digest)
+                        size += part_size
+            os.replace(tmp_path, destination)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+        # The parts stay until abort_multipart, so a failure after this point
+        # (checksum mismatch, database error) leaves the upload resumable
+        return size, digest.hexdigest()
+
+    def abort_multipart(self, upload_id):
+        """Discard an upload and all of its parts"""
+        shutil.rmtree(self._upload_dir(upload_id), ignore_errors=True)
+
+    def expire_multipart(self, max_age):
+        """Discard uploads with no activity for max_age seconds; returns how many"""
+        try:
+            upload_ids = os.listdir(self._multipart_root)
+        except FileNotFoundError:
+            return 0
+
+        cutoff = time.time() - max_age
+        expired = 0
+        for upload_id in upload_ids:
+            if not _UPLOAD_ID_RE.match(upload_id):
+                continue
+            upload_dir = os.path.join(self._multipart_root, upload_id)
+            try:
+                # Every part write touches the directory, so its mtime is the last activity
+                last_activity = max(
+                    [os.path.getmtime(upload_dir)]
+                    + [entry.stat().st_mtime for entry in os.scandir(upload_dir)]
+                )
+            except FileNotFoundError:
+                continue
+            if last_activity < cutoff:
+                shutil.rmtree(upload_dir, ignore_errors=True)
+                expired += 1
+        return expired
+
+    # ---- stored objects ----
+
+    def open(self, bucket, path):
+        """Binary file object for a stored object"""
+        return open(self._object_path(bucket, path), 'rb')
+
+    def delete(self, bucket, path):
+        try:
+            os.remove(self._object_path(bucket, path))
+        except FileNotFoundError:
+            pass
+
+    # ---- helpers ----
+
+    def _upload_dir(self, upload_id):
+        if not _UPLOAD_ID_RE.match(upload_id or ''):
+            raise StorageError(f"Invalid upload id {upload_id!r}")
+        return os.path.join(self._multipart_root, upload_id)
+
+    def _object_path(self, bucket, path):
+        bucket_root = os.path.join(self.root, bucket)
+        full_path = os.path.abspath(os.path.join(bucket_root, path))
+        if bucket.startswith('.') or not full_path.startswith(bucket_root + os.sep):
+            raise StorageError(f"Invalid storage path {bucket}/{path}")
+        return full_path
+
+    def _write_json(self, path, data):
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(data, f)
+        os.replace(tmp_path, path)
+
+
+# Global instance - lazy loaded
+_upload_storage = None
+
+def get_upload_storage():
+    global _upload_storage
+    if _upload_storage is None:
+        _upload_storage = LocalFileStorage()
+    return _upload_storage
@@ -1,24 +1,122 @@
 import os
-from supabase import create_client, Client
+from services.supabase_clients import get_service_client
+from services.postgres_user_store import get_postgres_user_store
+from services.batching import DEFAULT_BATCH_SIZE, id_batches
+
+# 'postgrest' (default) or 'postgres' to serve hot lookups over SUPABASE_DB_URL
+USER_SERVICE_BACKEND = os.getenv('USER_SERVICE_BACKEND', 'postgrest')
+
+# Row builders shared by UserService and AsyncUserService
+
+def google_user_row(google_user_data):
+    """Map Google userinfo to a users row"""
+    return {
+        'google_id': google_user_data.get('id'),
+        'email': google_user_data.get('email'),
+        'name': google_user_data.get('name'),
+        'picture': google_user_data.get('picture'),
+        'verified_email': google_user_data.get('verified_email', False)
+    }
+
+def oauth_user_row(user_data):
+    """Map unified OAuth user data to a new free-plan users row"""
+    return {
+        'supabase_id': user_data.get('id'),
+        'email': user_data.get('email'),
+        'name': user_data.get('name'),
+        'provider': user_data.get('provider'),
+        'picture': user_data.get('picture'),
+        'verified_email': user_data.get('verified_email', False),
+        'subscription_plan': 'free',
+        'subscription_status': 'free'
+    }
+
+def subscription_update_row(subscription_data):
+    """Map subscription data to the users.subscription_* columns"""
+    return {
+        'subscription_status': subscription_data.get('status', 'free'),
+        'subscription_id': subscription_data.get('subscription_id'),
+        'stripe_customer_id': subscription_data.get('customer_id'),
+        'subscription_plan': subscription_data.get('plan'),
+        'subscription_period_end': subscription_data.get('period_end'),
+        'subscription_cancel_at_period_end': subscription_data.get('cancel_at_period_end', False)
+    }
+
+def supabase_user_row(supabase_user_data):
+    """Map a Supabase auth User object or dict to a users row"""
+    # Handle both User objects and dictionaries
+    if hasattr(supabase_user_data, 'id'):
+        # It's a Supabase User object
+        print("Processing as Supabase User object")
+        return {
+            'supabase_id': str(supabase_user_data.id),  # Convert to string
+            'email': supabase_user_data.email,
+            'name': (getattr(supabase_user_data.user_metadata, 'full_name', None) or 
+                    getattr(supabase_user_data.user_metadata, 'name', None) or
+                    supabase_user_data.email.split('@')[0]) if supabase_user_data.email else 'Unknown',
+            'picture': getattr(supabase_user_data.user_metadata, 'avatar_url', None),
+            'provider': getattr(supabase_user_data.app_metadata, 'provider', 'unknown'),
+            'verified_email': supabase_user_data.email_confirmed_at is not None
+        }
+    
+    # It's a dictionary
+    print("Processing as dictionary")
+    return {
+        'supabase_id': str(supabase_user_data.get('id')),  # Convert to string
+        'email': supabase_user_data.get('email'),
+        'name': supabase_user_data.get('user_metadata', {}).get('full_name') or 
+               supabase_user_data.get('user_metadata', {}).get('name') or
+               supabase_user_data.get('email', '').split('@')[0],
+        'picture': supabase_user_data.get('user_metadata', {}).get('avatar_url'),
+        'provider': supabase_user_data.get('app_metadata', {}).get('provider', 'unknown'),
+        'verified_email': supabase_user_data.get('email_confirmed_at') is not None
+    }
+
+def upsert_batches(users, on_conflict, batch_size):
+    """Split users into multi-row upsert batches"""
+    # PostgREST fills columns missing from a row with NULL in multi-row
+    # upserts, so rows are grouped by their column set. Within a group the
+    # last row for a conflict key wins; Postgres rejects a statement that
+    # touches the same row twice.
+    groups = {}
+    for user in users:
+        key = user.get(on_conflict)
+        if key is None:
+            print(f"Skipping user without {on_conflict}: {user.get('email', 'Unknown')}")
+            continue
+        groups.setdefault(frozenset(user), {})[str(key)] = user
+    
+    for rows in groups.values():
+        rows = list(rows.values())
+        for start in range(0, len(rows), batch_size):
+            yield rows[start:start + batch_size]
 
 class UserService:
     def __init__(self):
-        supabase_url = os.getenv('SUPABASE_URL', 'https://bemssfbadcfrvsbgjlua.supabase.co')
-        # Use service role key for database operations to bypass RLS
-        supabase_key = os.getenv('SUPABASE_SERVICE_ROLE_KEY', os.getenv('SUPABASE_ANON_KEY', 'placeholder_key'))
-        
         # Check if we're using service role key
         key_type = 'service_role' if 'SUPABASE_SERVICE_ROLE_KEY' in os.environ else 'anon'
-        
         print(f"🔧 UserService: Using key type: {key_type}")
-        print(f"🔧 UserService: Key starts with: {supabase_key[:20]}...")
         
-        try:
-            self.supabase: Client = create_client(supabase_url, supabase_key)
-            print(f"✅ UserService initialized with service role key")
-        except Exception as e:
-            print(f"Warning: Could not initialize Supabase client in UserService: {e}")
-            self.supabase = None
+        # The client comes from the shared registry on first use
+        self._supabase = None
+    
+    @property
+    def supabase(self):
+        """Supabase client for database operations (service role to bypass RLS)"""
+        if self._supabase is not None:
+            return self._supabase
+        return get_service_client()
+    
+    @supabase.setter
+    def supabase(self, client):
+        self._supabase = client
+    
+    @property
+    def db_store(self):
+        """Direct Postgres store for hot lookups, or None to use PostgREST"""
+        if USER_SERVICE_BACKEND != 'postgres':
+            return None
+        return get_postgres_user_store()
     
     def create_or_update_user(self, google_user_data):
         """Create or update user in Supabase"""
@@ -26,25 +124,14 @@ class UserService:
             return None
             
         try:
-            user_data = {
-                'google_id': google_user_data.get('id'),
-                'email': google_user_data.get('email'),
-                'name': google_user_data.get('name'),
-                'picture': google_user_data.get('picture'),
-                'verified_email': google_user_data.get('verified_email', False)
-            }
-            
-            # Check if user exists
-            existing_user = self.supabase.table('users').select('*').eq('google_id', user_data['google_id']).execute()
-            
-            if existing_user.data:
-                # Update existing user
-                result = self.supabase.table('users').update(user_data).eq('google_id', user_data['google_id']).execute()
-                return result.data[0] if result.data else None
-            else:
-                # Create new user
-                result = self.supabase.table('users').insert(user_data).execute()
-                return result.data[0] if result.data else None
+            user_data = google_user_row(google_user_data)
+            
+            # Insert or update in a single round trip; the unique index on
+            # google_id makes concurrent logins for the same user converge
+            result = self.supabase.table('users').upsert(
+                user_data, on_conflict='google_id'
+            ).execute()
+            return result.data[0] if result.data else None
                 
         except Exception as e:
             print(f"Error managing user: {e}")
@@ -76,6 +163,12 @@ class UserService:
     
     def get_user_by_supabase_id(self, supabase_id):
         """Get user by Supabase ID - CRITICAL FIX FOR AUTH BUG"""
+        if self.db_store:
+            try:
+                return self.db_store.get_user_by_supabase_id(supabase_id)
+            except Exception as e:
+                print(f"Postgres lookup failed, falling back to PostgREST: {e}")
+        
         if not self.supabase:
             print(f"Supabase client not initialized for user lookup: {supabase_id}")
             return None
@@ -93,6 +186,32 @@ class UserService:
             print(f"Error getting user by Supabase ID {supabase_id}: {e}")
             return None
     
+    def get_user_by_customer_id(self, customer_id, strict=False):
+        """Get user by Stripe customer ID.
+
+        With strict=True database errors are raised instead of returning None,
+        so callers can tell "no such user" from "could not look".
+        """
+        if self.db_store:
+            try:
+                return self.db_store.get_user_by_customer_id(customer_id)
+            except Exception as e:
+                print(f"Postgres lookup failed, falling back to PostgREST: {e}")
+        
+        if not self.supabase:
+            if strict:
+                raise RuntimeError("Supabase client not initialized")
+            return None
+            
+        try:
+            result = self.supabase.table('users').select('*').eq('stripe_customer_id', customer_id).limit(1).execute()
+            return result.data[0] if result.data else None
+        except Exception as e:
+            print(f"Error getting user by customer ID: {e}")
+            if strict:
+                raise
+            return None
+    
     def create_user_from_oauth(self, user_data):
         """Create user from OAuth data if not exists - CRITICAL FIX FOR AUTH BUG"""
         if not self.supabase:
@@ -101,16 +220,7 @@ class UserService:
             
         try:
             print(f"Creating user from OAuth data: {user_data.get('email', 'Unknown')}")
-            user = {
-                'supabase_id': user_data.get('id'),
-                'email': user_data.get('email'),
-                'name': user_data.get('name'),
-                'provider': user_data.get('provider'),
-                'picture': user_data.get('picture'),
-                'verified_email': user_data.get('verified_email', False),
-                'subscription_plan': 'free',
-                'subscription_status': 'free'
-            }
+            user = oauth_user_row(user_data)
             
             # Validate required fields
             if not user.get('supabase_id'):
@@ -139,14 +249,7 @@ class UserService:
             return None
             
         try:
-            update_data = {
-                'subscription_status': subscription_data.get('status', 'free'),
-                'subscription_id': subscription_data.get('subscription_id'),
-                'stripe_customer_id': subscription_data.get('customer_id'),
-                'subscription_plan': subscription_data.get('plan'),
-                'subscription_period_end': subscription_data.get('period_end'),
-                'subscription_cancel_at_period_end': subscription_data.get('cancel_at_period_end', False)
-            }
+            update_data = subscription_update_row(subscription_data)
             
             result = self.supabase.table('users').update(update_data).eq('id', user_id).execute()
             return result.data[0] if result.data else None
@@ -165,33 +268,7 @@ class UserService:
             print(f"Processing Supabase user data: {type(supabase_user_data)}")
             print(f"User data keys: {supabase_user_data.keys() if hasattr(supabase_user_data, 'keys') else 'Not a dict'}")
             
-            # Handle both User objects and dictionaries
-            if hasattr(supabase_user_data, 'id'):
-                # It's a Supabase User object
-                print("Processing as Supabase User object")
-                user_data = {
-                    'supabase_id': str(supabase_user_data.id),  # Convert to string
-                    'email': supabase_user_data.email,
-                    'name': (getattr(supabase_user_data.user_metadata, 'full_name', None) or 
-                            getattr(supabase_user_data.user_metadata, 'name', None) or
-                            supabase_user_data.email.split('@')[0]) if supabase_user_data.email else 'Unknown',
-                    'picture': getattr(supabase_user_data.user_metadata, 'avatar_url', None),
-                    'provider': getattr(supabase_user_data.app_metadata, 'provider', 'unknown'),
-                    'verified_email': supabase_user_data.email_confirmed_at is not None
-                }
-            else:
-                # It's a dictionary
-                print("Processing as dictionary")
-                user_data = {
-                    'supabase_id': str(supabase_user_data.get('id')),  # Convert to string
-                    'email': supabase_user_data.get('email'),
-                    'name': supabase_user_data.get('user_metadata', {}).get('full_name') or 
-                           supabase_user_data.get('user_metadata', {}).get('name') or
-                           supabase_user_data.get('email', '').split('@')[0],
-                    'picture': supabase_user_data.get('user_metadata', {}).get('avatar_url'),
-                    'provider': supabase_user_data.get('app_metadata', {}).get('provider', 'unknown'),
-                    'verified_email': supabase_user_data.get('email_confirmed_at') is not None
-                }
+            user_data = supabase_user_row(supabase_user_data)
             
             print(f"Processed user data: {user_data}")
             
@@ -203,33 +280,85 @@ class UserService:
                 print("Error: Missing email")
                 return None
             
-            # Check if user exists by Supabase ID
-            print(f"Checking if user exists: {user_data['supabase_id']}")
-            existing_user = self.supabase.table('users').select('*').eq('supabase_id', user_data['supabase_id']).execute()
-            
-            if existing_user.data:
-                print(f"Updating existing user: {user_data['supabase_id']}")
-                # Update existing user
-                result = self.supabase.table('users').update(user_data).eq('supabase_id', user_data['supabase_id']).execute()
-                if result.data:
-                    print(f"User updated successfully: {result.data[0]}")
-                    return result.data[0]
-                else:
-                    print("No data returned from update")
-                    return None
+            # Insert or update in a single round trip keyed on the unique
+            # supabase_id, so two concurrent logins cannot both insert
+            print(f"Upserting user: {user_data['supabase_id']}")
+            result = self.supabase.table('users').upsert(
+                user_data, on_conflict='supabase_id'
+            ).execute()
+            if result.data:
+                print(f"User upserted successfully: {result.data[0]}")
+                return result.data[0]
             else:
-                print(f"Creating new user: {user_data['supabase_id']}")
-                # Create new user
-                result = self.supabase.table('users').insert(user_data).execute()
-                if result.data:
-                    print(f"User created successfully: {result.data[0]}")
-                    return result.data[0]
-                else:
-                    print("No data returned from insert")
-                    return None
+                print("No data returned from upsert")
+                return None
                 
         except Exception as e:
             print(f"Error managing user from Supabase: {e}")
             import traceback
             traceback.print_exc()
-            return None 
\ No newline at end of file
+            return None
+    
+    def bulk_upsert_users(self, users, on_conflict='supabase_id', batch_size=None):
+        """Upsert many users with one multi-row request per batch"""
+        if not self.supabase or not users:
+            return []
+        
+        batch_size = batch_size or DEFAULT_BATCH_SIZE
+        
+        upserted = []
+        for batch in upsert_batches(users, on_conflict, batch_size):
+            try:
+                result = self.supabase.table('users').upsert(
+                    batch, on_conflict=on_conflict
+                ).execute()
+                upserted.extend(result.data or [])
+            except Exception as e:
+                print(f"Error bulk upserting {len(batch)} users: {e}")
+        
+        print(f"✅ Bulk upserted {len(upserted)} users")
+        return upserted
+    
+    def get_users_by_supabase_ids(self, supabase_ids, batch_size=None):
+        """Get users by Supabase ID in chunked queries, keyed by supabase_id"""
+        return self._get_users_by_column('supabase_id', supabase_ids, batch_size)
+    
+    def get_users_by_customer_ids(self, customer_ids, batch_size=None):
+        """Get users by Stripe customer ID in chunked queries, keyed by stripe_customer_id"""
+        return self._get_users_by_column('stripe_customer_id', customer_ids, batch_size)
+    
+    def iter_users_with_customer_ids(self, columns='*', page_size=None):
+        """Yield every user linked to a Stripe customer, keyset-paginated by id"""
+        if not self.supabase:
+            return
+        
+        page_size = page_size or DEFAULT_BATCH_SIZE
+        last_id = None
+        while True:
+            query = self.supabase.table('users').select(columns).not_.is_('stripe_customer_id', 'null')
+            if last_id is not None:
+                query = query.gt('id', last_id)
+            result = query.order('id').limit(page_size).execute()
+            if not result.data:
+                return
+            yield from result.data
+            if len(result.data) < page_size:
+                return
+            last_id = result.data[-1]['id']
+    
+    def _get_users_by_column(self, column, values, batch_size=None):
+        """Look up users whose `column` is in `values` with one `in_` select per batch"""
+        if not self.supabase:
+            return {}
+        
+        batch_size = batch_size or DEFAULT_BATCH_SIZE
+        
+        users = {}
+        for batch in id_batches(values, batch_size):
+            try:
+                result = self.supabase.table('users').select('*').in_(column, batch).execute()
+                for user in result.data or []:
+                    users[str(user[column])] = user
+            except Exception as e:
+                print(f"Error getting users by {column}: {e}")
+        return users
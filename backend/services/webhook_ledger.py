@@ -0,0 +1,116 @@
+import os
+from services.cache import LRUCache
+
+# Event ids kept in memory in front of the stripe_webhook_events table
+LEDGER_CACHE_SIZE = int(os.getenv('STRIPE_WEBHOOK_LEDGER_CACHE_SIZE', 10000))
+
+# Events that carry a full subscription snapshot; applying an older one
+# after a newer one would roll the user's subscription back
+SUBSCRIPTION_SNAPSHOT_EVENTS = (
+    'customer.subscription.created',
+    'customer.subscription.updated',
+    'customer.subscription.deleted',
+)
+
+
+class WebhookEventLedger:
+    """Record of processed Stripe event ids, for skipping redeliveries.
+
+    An in-memory LRU answers repeat deliveries without any I/O; the
+    stripe_webhook_events table makes the ledger survive restarts and
+    shared between workers.
+    """
+
+    def __init__(self, user_service, cache_size=LEDGER_CACHE_SIZE):
+        self.user_service = user_service
+        self._seen = LRUCache(cache_size)
+        # subscription id -> `created` of the newest snapshot event applied
+        self._subscription_versions = LRUCache(cache_size)
+
+    def seen_recently(self, event_id):
+        """O(1) in-memory duplicate check, no database access"""
+        return event_id in self._seen
+
+    def is_duplicate(self, event):
+        """True if this event id was already processed"""
+        event_id = event.get('id')
+        if self.seen_recently(event_id):
+            return True
+
+        supabase = self.user_service.supabase
+        if not supabase:
+            return False
+        try:
+            result = supabase.table('stripe_webhook_events').select('event_id').eq(
+                'event_id', event_id
+            ).limit(1).execute()
+        except Exception as e:
+            # Fail open: reprocessing is safer than dropping an event
+            print(f"Error checking webhook ledger: {e}")
+            return False
+
+        if result.data:
+            self._seen.put(event_id, True)
+            return True
+        return False
+
+    def is_stale(self, event):
+        """True for a subscription snapshot event older than one already applied"""
+        if event.get('type') not in SUBSCRIPTION_SNAPSHOT_EVENTS:
+            return False
+        subscription_id = (event.get('data', {}).get('object') or {}).get('id')
+        created = event.get('created')
+        if not subscription_id or created is None:
+            return False
+
+        latest = self._latest_subscription_version(subscription_id)
+        return latest is not None and created < latest
+
+    def record(self, event):
+        """Mark an event as processed"""
+        event_id = event.get('id')
+        obj = event.get('data', {}).get('object') or {}
+        created = event.get('created') or 0
+        self._seen.put(event_id, True)
+
+        if event.get('type') in SUBSCRIPTION_SNAPSHOT_EVENTS and obj.get('id'):
+            latest = self._subscription_versions.get(obj['id'])
+            if latest is None or created > latest:
+                self._subscription_versions.put(obj['id'], created)
+
+        supabase = self.user_service.supabase
+        if not supabase:
+            return
+        try:
+            supabase.table('stripe_webhook_events').upsert({
+                'event_id': event_id,
+                'event_type': event.get('type'),
+                'object_id': obj.get('id'),
+                'event_created': created
+            }, on_conflict='event_id', ignore_duplicates=True).execute()
+        except Exception as e:
+            print(f"Error recording webhook event {event_id}: {e}")
+
+    def _latest_subscription_version(self, subscription_id):
+        latest = self._subscription_versions.get(subscription_id)
+        if latest is not None:
+            return latest
+
+        supabase = self.user_service.supabase
+        if not supabase:
+            return None
+        try:
+            result = supabase.table('stripe_webhook_events').select('event_created').eq(
+                'object_id', subscription_id
+            ).in_('event_type', list(SUBSCRIPTION_SNAPSHOT_EVENTS)).order(
+                'event_created', desc=True
+            ).limit(1).execute()
+        except Exception as e:
+            print(f"Error reading subscription version: {e}")
+            return None
+
+        if result.data:
+            latest = result.data[0]['event_created']
+            self._subscription_versions.put(subscription_id, latest)
+            return latest
+        return None
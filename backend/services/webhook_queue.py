@@ -0,0 +1,214 @@
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+
+# Durable local queue for verified Stripe webhook events. The request thread
+# only appends the event; a consumer pool processes it afterwards. Events for
+# the same Stripe customer are handed out one at a time, in arrival order.
+WEBHOOK_QUEUE_PATH = os.getenv(
+    'STRIPE_WEBHOOK_QUEUE_PATH',
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data', 'stripe_webhooks.db')
+)
+MAX_ATTEMPTS = int(os.getenv('STRIPE_WEBHOOK_MAX_ATTEMPTS', 8))
+# A 'processing' row older than this is assumed orphaned by a dead worker
+LEASE_SECONDS = 300
+DONE_RETENTION_SECONDS = 24 * 3600
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS webhook_events (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    event_id TEXT NOT NULL,
+    event_type TEXT NOT NULL,
+    ordering_key TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    last_error TEXT,
+    claimed_by TEXT,
+    received_at REAL NOT NULL,
+    available_at REAL NOT NULL,
+    claimed_at REAL
+);
+CREATE INDEX IF NOT EXISTS idx_webhook_events_status ON webhook_events(status, id);
+CREATE INDEX IF NOT EXISTS idx_webhook_events_ordering ON webhook_events(ordering_key, status, id);
+"""
+
+# Oldest ready event whose customer has nothing older still queued or in flight
+CLAIM_SQL = """
+SELECT id FROM webhook_events AS e
+WHERE e.status = 'pending' AND e.available_at <= ?
+  AND NOT EXISTS (
+      SELECT 1 FROM webhook_events AS p
+      WHERE p.ordering_key = e.ordering_key AND p.id < e.id
+        AND p.status IN ('pending', 'processing')
+  )
+ORDER BY e.id
+LIMIT 1
+"""
+
+
+def ordering_key_for(event):
+    """Stripe customer the event belongs to; events without one are unordered"""
+    obj = event.get('data', {}).get('object', {}) or {}
+    customer = obj.get('customer')
+    if isinstance(customer, dict):
+        customer = customer.get('id')
+    return customer or f"event:{event.get('id')}"
+
+
+class WebhookQueue:
+    """SQLite-backed queue shared by all workers on this host"""
+
+    def __init__(self, path=WEBHOOK_QUEUE_PATH):
+        self.path = path
+        self.consumer_id = f"{socket.gethostname()}:{os.getpid()}"
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self._connection().executescript(SCHEMA)
+
+    def _connection(self):
+        # One connection per thread; sqlite3 connections are not thread-safe
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or getattr(self._local, 'pid', None) != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def enqueue(self, event, payload):
+        """Persist a verified event; returns once it is durable"""
+        now = time.time()
+        if isinstance(payload, bytes):
+            payload = payload.decode('utf-8')
+        self._connection().execute(
+            "INSERT INTO webhook_events (event_id, event_type, ordering_key, payload, received_at, available_at) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            (event['id'], event['type'], ordering_key_for(event), payload, now, now)
+        )
+
+    def claim(self):
+        """Lease the next processable event, or return None"""
+        conn = self._connection()
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute(CLAIM_SQL, (now,)).fetchone()
+            if row is None:
+                conn.execute("COMMIT")
+                return None
+            conn.execute(
+                "UPDATE webhook_events SET status = 'processing', claimed_by = ?, claimed_at = ?, "
+                "attempts = attempts + 1 WHERE id = ?",
+                (self.consumer_id, now, row['id'])
+            )
+            claimed = conn.execute("SELECT * FROM webhook_events WHERE id = ?", (row['id'],)).fetchone()
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return {
+            'id': claimed['id'],
+            'attempts': claimed['attempts'],
+            'event': json.loads(claimed['payload'])
+        }
+
+    def complete(self, queue_id):
+        self._connection().execute(
+            "UPDATE webhook_events SET status = 'done', last_error = NULL WHERE id = ?", (queue_id,)
+        )
+
+    def fail(self, queue_id, attempts, error):
+        """Schedule a retry with backoff, or park the event after MAX_ATTEMPTS"""
+        if attempts >= MAX_ATTEMPTS:
+            self._connection().execute(
+                "UPDATE webhook_events SET status = 'failed', last_error = ? WHERE id = ?",
+                (str(error), queue_id)
+            )
+            return
+        delay = min(2 ** attempts, 300)
+        self._connection().execute(
+            "UPDATE webhook_events SET status = 'pending', last_error = ?, available_at = ? WHERE id = ?",
+            (str(error), time.time() + delay, queue_id)
+        )
+
+    def recover_expired_leases(self):
+        """Return events orphaned by a crashed or recycled worker to the queue"""
+        cursor = self._connection().execute(
+            "UPDATE webhook_events SET status = 'pending' WHERE status = 'processing' AND claimed_at < ?",
+            (time.time() - LEASE_SECONDS,)
+        )
+        return cursor.rowcount
+
+    def purge_done(self, retention_seconds=DONE_RETENTION_SECONDS):
+        self._connection().execute(
+            "DELETE FROM webhook_events WHERE status = 'done' AND received_at < ?",
+            (time.time() - retention_seconds,)
+        )
+
+    def stats(self):
+        rows = self._connection().execute(
+            "SELECT status, COUNT(*) AS count FROM webhook_events GROUP BY status"
+        ).fetchall()
+        return {row['status']: row['count'] for row in rows}
+
+
+class WebhookConsumerPool:
+    """Background threads that drain a WebhookQueue through `handler(event)`"""
+
+    def __init__(self, queue, handler, workers=2, poll_interval=0.2):
+        self.queue = queue
+        self.handler = handler
+        self.workers = workers
+        self.poll_interval = poll_interval
+        self._stop = threading.Event()
+        self._threads = []
+
+    def start(self):
+        self.queue.recover_expired_leases()
+        for i in range(self.workers):
+            thread = threading.Thread(
+                target=self._run, args=(i,), name=f"stripe-webhook-consumer-{i}", daemon=True
+            )
+            thread.start()
+            self._threads.append(thread)
+        print(f"✅ Started {self.workers} Stripe webhook consumers (pid: {os.getpid()})")
+
+    def stop(self, timeout=5):
+        self._stop.set()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+
+    def _run(self, index):
+        last_maintenance = 0
+        while not self._stop.is_set():
+            try:
+                item = self.queue.claim()
+            except Exception as e:
+                print(f"Error claiming webhook event: {e}")
+                item = None
+
+            if item is None:
+                # Idle: the first consumer also does periodic queue maintenance
+                if index == 0 and time.time() - last_maintenance > 60:
+                    last_maintenance = time.time()
+                    try:
+                        self.queue.recover_expired_leases()
+                        self.queue.purge_done()
+                    except Exception as e:
+                        print(f"Error maintaining webhook queue: {e}")
+                self._stop.wait(self.poll_interval)
+                continue
+
+            try:
+                self.handler(item['event'])
+                self.queue.complete(item['id'])
+            except Exception as e:
+                print(f"Error processing webhook event {item['event'].get('id')}: {e}")
+                self.queue.fail(item['id'], item['attempts'], e)
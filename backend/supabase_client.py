@@ -1,25 +1,77 @@
-from supabase import create_client, Client
-from cryptography.fernet import Fernet
 import base64
 import os
 from config import Config
+from services.cache import LRUCache
+from services.supabase_clients import get_anon_client
+from services.batching import DEFAULT_BATCH_SIZE, id_batches
+
+# Decrypted keys are reused for this long; other workers see a saved or
+# deleted key after at most this delay
+API_KEY_CACHE_TTL = int(os.getenv('API_KEY_CACHE_TTL', 60))
+API_KEY_CACHE_SIZE = int(os.getenv('API_KEY_CACHE_SIZE', 1024))
+
+# Cached "user has no key for this service"
+_NO_KEY = object()
+
+
+def encryption_keys_from_env():
+    """ENCRYPTION_KEY as a list of Fernet keys (bytes), primary first.
+
+    To rotate, prepend a new key (`new,old`), deploy, run
+    rotate_api_keys.py, then drop the old key.
+    """
+    value = os.getenv('ENCRYPTION_KEY', '')
+    return [key.strip().encode() for key in value.split(',') if key.strip()]
+
+
+class DecryptedKeyCache(LRUCache):
+    """(user_id, service) -> decrypted API key; never pickled or shown in a repr"""
+    
+    def __repr__(self):
+        return f"<DecryptedKeyCache entries={len(self)}>"
+    
+    def __reduce__(self):
+        raise TypeError("DecryptedKeyCache holds plaintext API keys and cannot be pickled")
+
 
 class SupabaseManager:
     def __init__(self):
-        self.supabase: Client = create_client(Config.SUPABASE_URL, Config.SUPABASE_ANON_KEY)
-        self.encryption_key = self._get_or_create_encryption_key()
-        self.cipher = Fernet(self.encryption_key)
+        # Supabase client comes from the shared registry on first use
+        self._supabase = None
+        from cryptography.fernet import Fernet, MultiFernet
+        self.encryption_keys = self._get_or_create_encryption_keys()
+        self.encryption_key = self.encryption_keys[0]
+        # Encrypts with the first key, decrypts with any of them
+        self.cipher = MultiFernet([Fernet(key) for key in self.encryption_keys])
+        # Per-process cache so agent commands don't select + decrypt every time
+        self._key_cache = DecryptedKeyCache(API_KEY_CACHE_SIZE, ttl=API_KEY_CACHE_TTL)
+        # Bumped on every invalidation; a read that raced a write is not cached
+        self._key_generation = 0
     
-    def _get_or_create_encryption_key(self):
-        """Get existing encryption key or create new one"""
-        key = os.getenv('ENCRYPTION_KEY')
-        if not key:
-            # Generate new key (in production, this should be stored securely)
-            key = Fernet.generate_key()
-            print(f"Generated new encryption key: {key.decode()}")
-        else:
-            key = key.encode()
-        return key
+    @property
+    def supabase(self):
+        """Supabase client for api_keys storage (anon key)"""
+        if self._supabase is not None:
+            return self._supabase
+        return get_anon_client()
+    
+    @supabase.setter
+    def supabase(self, client):
+        self._supabase = client
+    
+    def _get_or_create_encryption_keys(self):
+        """Fernet keys from ENCRYPTION_KEY: comma-separated, newest (primary) first"""
+        keys = encryption_keys_from_env()
+        if keys:
+            return keys
+        if os.getenv('ALLOW_EPHEMERAL_ENCRYPTION_KEY', '').lower() != 'true':
+            raise ValueError(
+                "ENCRYPTION_KEY is not set; stored API keys cannot be decrypted without it"
+            )
+        # Local development only: keys saved with this are lost on restart
+        print("⚠️  ENCRYPTION_KEY not set – using a throwaway key (ALLOW_EPHEMERAL_ENCRYPTION_KEY)")
+        from cryptography.fernet import Fernet
+        return [Fernet.generate_key()]
     
     def encrypt_api_key(self, api_key: str) -> str:
         """Encrypt API key before storage"""
@@ -29,6 +81,10 @@ class SupabaseManager:
         """Decrypt API key for use"""
         return self.cipher.decrypt(encrypted_key.encode()).decode()
     
+    def rotate_encrypted_key(self, encrypted_key: str) -> str:
+        """Re-encrypt a stored token under the primary key"""
+        return self.cipher.rotate(encrypted_key.encode()).decode()
+    
     def save_api_key(self, user_id: str, service: str, api_key: str) -> bool:
         """Save encrypted API key to Supabase"""
         try:
@@ -46,20 +102,92 @@ class SupabaseManager:
         except Exception as e:
             print(f"Error saving API key: {e}")
             return False
+        finally:
+            self._invalidate_api_key(user_id, service)
     
     def get_api_key(self, user_id: str, service: str) -> str:
         """Retrieve and decrypt API key from Supabase"""
+        cached = self._key_cache.get((user_id, service))
+        if cached is not None:
+            return None if cached is _NO_KEY else cached
+        
+        generation = self._key_generation
         try:
             result = self.supabase.table('api_keys').select('encrypted_key').eq('user_id', user_id).eq('service', service).execute()
             
+            api_key = None
             if result.data:
                 encrypted_key = result.data[0]['encrypted_key']
-                return self.decrypt_api_key(encrypted_key)
-            return None
+                api_key = self.decrypt_api_key(encrypted_key)
+            if generation == self._key_generation:
+                self._key_cache.put((user_id, service), _NO_KEY if api_key is None else api_key)
+            return api_key
         except Exception as e:
             print(f"Error retrieving API key: {e}")
             return None
     
+    def get_api_keys(self, user_id: str, services: list) -> dict:
+        """Decrypted keys for several services of one user in a single query.
+        
+        Returns {service: api_key or None}; cached services are not fetched.
+        """
+        return self.get_api_keys_for_users([user_id], services).get(user_id, {})
+    
+    def get_api_keys_for_users(self, user_ids: list, services: list, batch_size=None) -> dict:
+        """Bulk get_api_keys: {user_id: {service: api_key or None}} with one query per batch of users"""
+        services = list(dict.fromkeys(services))
+        keys = {user_id: {} for user_id in user_ids}
+        missing = {}
+        for user_id in user_ids:
+            for service in services:
+                cached = self._key_cache.get((user_id, service))
+                if cached is None:
+                    missing[(user_id, service)] = True
+                else:
+                    keys[user_id][service] = None if cached is _NO_KEY else cached
+        if not missing:
+            return keys
+        
+        generation = self._key_generation
+        missing_users = [user_id for user_id in user_ids if any((user_id, s) in missing for s in services)]
+        missing_services = list(dict.fromkeys(service for _, service in missing))
+        try:
+            rows = []
+            for batch in id_batches(missing_users, batch_size or DEFAULT_BATCH_SIZE):
+                result = self.supabase.table('api_keys').select('user_id, service, encrypted_key').in_(
+                    'user_id', batch
+                ).in_('service', missing_services).execute()
+                rows.extend(result.data or [])
+        except Exception as e:
+            print(f"Error retrieving API keys: {e}")
+            return keys
+        
+        # Decrypt the whole batch in one pass, then fill the cache together
+        by_str = {str(user_id): user_id for user_id in missing_users}
+        found = {}
+        undecryptable = set()
+        for row in rows:
+            pair = (by_str.get(str(row['user_id'])), row['service'])
+            if pair not in missing:
+                continue
+            try:
+                found[pair] = self.decrypt_api_key(row['encrypted_key'])
+            except Exception as e:
+                undecryptable.add(pair)
+                print(f"Error decrypting {row['service']} API key for user {row['user_id']}: {e}")
+        
+        cacheable = generation == self._key_generation
+        for pair in missing:
+            api_key = found.get(pair)
+            keys[pair[0]][pair[1]] = api_key
+            if cacheable and pair not in undecryptable:
+                self._key_cache.put(pair, _NO_KEY if api_key is None else api_key)
+        return keys
+    
+    def _invalidate_api_key(self, user_id: str, service: str):
+        self._key_generation += 1
+        self._key_cache.pop((user_id, service))
+    
     def list_user_api_keys(self, user_id: str) -> list:
         """List all API keys for a user (without decryption)"""
         try:
@@ -77,6 +205,8 @@ class SupabaseManager:
         except Exception as e:
             print(f"Error deleting API key: {e}")
             return False
+        finally:
+            self._invalidate_api_key(user_id, service)
 
 # Global instance - lazy loaded
 _supabase_manager = None
@@ -87,5 +217,9 @@ def get_supabase_manager():
         _supabase_manager = SupabaseManager()
     return _supabase_manager
 
-# For backward compatibility
-supabase_manager = get_supabase_manager() 
\ No newline at end of file
+def __getattr__(name):
+    # `from supabase_client import supabase_manager` keeps working, but the
+    # manager (and its Fernet keys) is only built when first asked for
+    if name == 'supabase_manager':
+        return get_supabase_manager()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}") 
\ No newline at end of file
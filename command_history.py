@@ -0,0 +1,273 @@
+import hashlib
+import os
+import re
+import threading
+import time
+
+from sqlalchemy import Column, Float, Integer, MetaData, String, Table, Text, text
+
+# Output is stored as a digest plus an excerpt (head and tail) of this many characters
+COMMAND_HISTORY_EXCERPT_CHARS = int(os.getenv('COMMAND_HISTORY_EXCERPT_CHARS', 4000))
+COMMAND_HISTORY_PAGE_SIZE = 50
+COMMAND_HISTORY_MAX_PAGE_SIZE = 200
+# Rows older than this are purged by a background sweep (0 keeps everything)
+COMMAND_HISTORY_RETENTION_DAYS = float(os.getenv('COMMAND_HISTORY_RETENTION_DAYS', 30))
+COMMAND_HISTORY_SWEEP_SECONDS = int(os.getenv('COMMAND_HISTORY_SWEEP_SECONDS', 3600))
+# Rows deleted per transaction, so a sweep never holds the write lock for long
+COMMAND_HISTORY_PURGE_BATCH = 1000
+
+metadata = MetaData()
+command_history_table = Table(
+    'command_history', metadata,
+    Column('id', Integer, primary_key=True),
+    # Supabase auth uid of the user who ran the command
+    Column('user_id', String(64), nullable=False),
+    Column('terminal_id', String(64), nullable=False),
+    Column('command', Text, nullable=False),
+    Column('kind', String(16), nullable=False),
+    Column('exit_code', Integer),
+    Column('started_at', Float, nullable=False),
+    Column('duration_ms', Integer, nullable=False),
+    Column('output_sha256', String(64), nullable=False),
+    Column('output_bytes', Integer, nullable=False),
+    Column('output_excerpt', Text),
+    # "u<user hash> t<terminal hash>": lets FTS narrow a search to one user's
+    # (and terminal's) rows inside the index instead of filtering matches after
+    Column('search_scope', Text, nullable=False),
+)
+
+_SCHEMA = (
+    """CREATE INDEX IF NOT EXISTS idx_command_history_user
+       ON command_history(user_id, id)""",
+    """CREATE INDEX IF NOT EXISTS idx_command_history_user_terminal
+       ON command_history(user_id, terminal_id, id)""",
+    """CREATE INDEX IF NOT EXISTS idx_command_history_started
+       ON command_history(started_at)""",
+    """CREATE VIRTUAL TABLE IF NOT EXISTS command_history_fts USING fts5(
+           search_scope, command, output_excerpt,
+           content='command_history', content_rowid='id', tokenize='unicode61'
+       )""",
+    """CREATE TRIGGER IF NOT EXISTS command_history_fts_insert AFTER INSERT ON command_history BEGIN
+           INSERT INTO command_history_fts(rowid, search_scope, command, output_excerpt)
+           VALUES (new.id, new.search_scope, new.command, new.output_excerpt);
+       END""",
+    """CREATE TRIGGER IF NOT EXISTS command_history_fts_delete AFTER DELETE ON command_history BEGIN
+           INSERT INTO command_history_fts(command_history_fts, rowid, search_scope, command, output_excerpt)
+           VALUES ('delete', old.id, old.search_scope, old.command, old.output_excerpt);
+       END""",
+)
+
+_RESULT_COLUMNS = (
+    'id', 'terminal_id', 'command', 'kind', 'exit_code', 'started_at', 'duration_ms',
+    'output_sha256', 'output_bytes', 'output_excerpt',
+)
+_COLUMNS = ', '.join(_RESULT_COLUMNS)
+_TERM_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def _scope_token(prefix, value):
+    return prefix + hashlib.sha1(str(value).encode()).hexdigest()[:20]
+
+
+def output_excerpt(output, limit=COMMAND_HISTORY_EXCERPT_CHARS):
+    """output itself if short, else its head and tail"""
+    if len(output) <= limit:
+        return output
+    half = limit // 2
+    return f"{output[:half]}\n…\n{output[-half:]}"
+
+
+def fts_query(query):
+    """FTS5 MATCH expression for free text: every word must match.
+
+    Words are quoted so user input is never parsed as FTS syntax. Prefix
+    queries are not generated: without a prefix index they merge every
+    matching term's doclist and cost tens of milliseconds at a million rows.
+    """
+    terms = _TERM_RE.findall(query or '')
+    if not terms:
+        return None
+    return ' AND '.join(f'"{term}"' for term in terms)
+
+
+class CommandHistory:
+    """Per-user, per-terminal history of executed commands with full-text search.
+
+    Rows are keyed by the authenticated user's auth uid and terminal id, so
+    history follows the user across connections and devices. Rows go through the local store's write-behind batcher, so recording a
+    command never waits on SQLite. Output is kept as its sha256, size and
+    a head/tail excerpt; the command and excerpt are indexed in an FTS5
+    table kept in sync by triggers. Listing and search are keyset
+    paginated on the row id (newest first), so every page costs the same
+    however deep it is. Rows older than retention_days are purged by a
+    background sweep started with the first record.
+    """
+
+    def __init__(self, engine, writer, retention_days=COMMAND_HISTORY_RETENTION_DAYS,
+                 sweep_seconds=COMMAND_HISTORY_SWEEP_SECONDS):
+        self.engine = engine
+        self.writer = writer
+        self.retention_days = retention_days
+        self.sweep_seconds = sweep_seconds
+        self.fts_available = True
+        self._lock = threading.Lock()
+        self._sweeper = None
+        self._sweeper_pid = None
+
+    def init_schema(self):
+        command_history_table.create(self.engine, checkfirst=True)
+        with self.engine.begin() as connection:
+            for statement in _SCHEMA[:3]:
+                connection.execute(text(statement))
+        try:
+            with self.engine.begin() as connection:
+                for statement in _SCHEMA[3:]:
+                    connection.execute(text(statement))
+        except Exception as e:
+            self.fts_available = False
+            print(f"⚠️  SQLite FTS5 unavailable, history search falls back to LIKE: {e}")
+
+    def record(self, user_id, terminal_id, command, output, kind, exit_code=None,
+               started_at=None, duration_ms=0):
+        """Queue one executed command; returns immediately"""
+        self._ensure_sweeper()
+        output = output or ''
+        encoded = output.encode('utf-8', errors='replace')
+        self.writer.add(command_history_table, {
+            'user_id': str(user_id),
+            'terminal_id': str(terminal_id),
+            'command': command,
+            'kind': kind,
+            'exit_code': exit_code,
+            'started_at': started_at if started_at is not None else time.time(),
+            'duration_ms': int(duration_ms),
+            'output_sha256': hashlib.sha256(encoded).hexdigest(),
+            'output_bytes': len(encoded),
+            'output_excerpt': output_excerpt(output),
+            'search_scope': f"{_scope_token('u', user_id)} {_scope_token('t', terminal_id)}",
+        })
+
+    def list(self, user_id, terminal_id=None, before=None, limit=COMMAND_HISTORY_PAGE_SIZE):
+        """(rows newest first, cursor for the next page or None)"""
+        limit = max(1, min(int(limit), COMMAND_HISTORY_MAX_PAGE_SIZE))
+        sql = f"SELECT {_COLUMNS} FROM command_history WHERE user_id = :user_id"
+        params = {'user_id': str(user_id), 'limit': limit + 1}
+        if terminal_id:
+            sql += " AND terminal_id = :terminal_id"
+            params['terminal_id'] = str(terminal_id)
+        if before:
+            sql += " AND id < :before"
+            params['before'] = int(before)
+        sql += " ORDER BY id DESC LIMIT :limit"
+        return self._page(sql, params, limit)
+
+    def search(self, user_id, query, terminal_id=None, before=None, limit=COMMAND_HISTORY_PAGE_SIZE):
+        """(matching rows newest first, cursor for the next page or None)"""
+        match = fts_query(query)
+        if not match:
+            return [], None
+        if not self.fts_available:
+            return self._search_like(user_id, query, terminal_id, before, limit)
+
+        limit = max(1, min(int(limit), COMMAND_HISTORY_MAX_PAGE_SIZE))
+        scope = f"search_scope : {_scope_token('u', user_id)}"
+        if terminal_id:
+            scope += f" AND search_scope : {_scope_token('t', terminal_id)}"
+        sql = (
+            f"SELECT {', '.join('h.' + column for column in _RESULT_COLUMNS)} "
+            "FROM command_history_fts f JOIN command_history h ON h.id = f.rowid "
+            "WHERE command_history_fts MATCH :match"
+        )
+        params = {'match': f"{scope} AND {{command output_excerpt}} : ({match})", 'limit': limit + 1}
+        if before:
+            sql += " AND f.rowid < :before"
+            params['before'] = int(before)
+        sql += " ORDER BY f.rowid DESC LIMIT :limit"
+        return self._page(sql, params, limit)
+
+    def _search_like(self, user_id, query, terminal_id, before, limit):
+        limit = max(1, min(int(limit), COMMAND_HISTORY_MAX_PAGE_SIZE))
+        sql = (
+            f"SELECT {_COLUMNS} FROM command_history WHERE user_id = :user_id "
+            "AND (command LIKE :pattern OR output_excerpt LIKE :pattern)"
+        )
+        params = {'user_id': str(user_id), 'pattern': f"%{query.strip()}%", 'limit': limit + 1}
+        if terminal_id:
+            sql += " AND terminal_id = :terminal_id"
+            params['terminal_id'] = str(terminal_id)
+        if before:
+            sql += " AND id < :before"
+            params['before'] = int(before)
+        sql += " ORDER BY id DESC LIMIT :limit"
+        return self._page(sql, params, limit)
+
+    def purge(self, older_than=None):
+        """Delete rows started before older_than (default: the retention window); returns how many.
+
+        The FTS delete trigger drops their index entries in the same transaction.
+        """
+        if older_than is None:
+            if self.retention_days <= 0:
+                return 0
+            older_than = time.time() - self.retention_days * 86400
+        deleted = 0
+        while True:
+            with self.engine.begin() as connection:
+                result = connection.execute(text(
+                    "DELETE FROM command_history WHERE id IN ("
+                    "SELECT id FROM command_history WHERE started_at < :cutoff LIMIT :batch)"
+                ), {'cutoff': older_than, 'batch': COMMAND_HISTORY_PURGE_BATCH})
+            deleted += result.rowcount
+            if result.rowcount < COMMAND_HISTORY_PURGE_BATCH:
+                return deleted
+
+    def _ensure_sweeper(self):
+        if self.retention_days <= 0:
+            return
+        if self._sweeper is not None and self._sweeper_pid == os.getpid():
+            return
+        with self._lock:
+            if self._sweeper is None or self._sweeper_pid != os.getpid():
+                self._sweeper = threading.Thread(target=self._sweep, name='command-history-sweep', daemon=True)
+                self._sweeper_pid = os.getpid()
+                self._sweeper.start()
+
+    def _sweep(self):
+        while True:
+            try:
+                deleted = self.purge()
+                if deleted:
+                    print(f"Purged {deleted} command history rows older than {self.retention_days:g} days")
+            except Exception as e:
+                print(f"Error purging command history: {e}")
+            time.sleep(self.sweep_seconds)
+
+    def _page(self, sql, params, limit):
+        with self.engine.connect() as connection:
+            rows = [dict(row._mapping) for row in connection.execute(text(sql), params)]
+        next_cursor = rows[limit - 1]['id'] if len(rows) > limit else None
+        return rows[:limit], next_cursor
+
+
+# Global instance - set up by init_command_history() once the app's engine exists
+_command_history = None
+
+def init_command_history(engine, writer):
+    global _command_history
+    _command_history = CommandHistory(engine, writer)
+    _command_history.init_schema()
+    return _command_history
+
+def get_command_history():
+    return _command_history
+
+
+def record_command(user_id, terminal_id, command, output, kind, exit_code=None, started_at=None, duration_ms=0):
+    """Record an executed command if command history is set up; never raises"""
+    history = get_command_history()
+    if history is None:
+        return
+    try:
+        history.record(user_id, terminal_id, command, output, kind, exit_code, started_at, duration_ms)
+    except Exception as e:
+        print(f"Error recording command history: {e}")
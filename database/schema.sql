@@ -65,6 +65,43 @@ CREATE TABLE IF NOT EXISTS collaborative_sessions (
     updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
 );
 
+-- Ledger of processed Stripe webhook events (written with the service role key)
+CREATE TABLE IF NOT EXISTS stripe_webhook_events (
+    event_id TEXT PRIMARY KEY,
+    event_type TEXT NOT NULL,
+    object_id TEXT,
+    event_created BIGINT NOT NULL,
+    processed_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+);
+
+-- Subscription status per Stripe customer, materialized from webhooks so the
+-- status endpoint does not call Stripe (written with the service role key)
+CREATE TABLE IF NOT EXISTS stripe_subscriptions (
+    customer_id TEXT PRIMARY KEY,
+    subscription_id TEXT,
+    status TEXT NOT NULL,
+    plan TEXT DEFAULT 'free',
+    current_period_start BIGINT,
+    current_period_end BIGINT,
+    cancel_at_period_end BOOLEAN,
+    canceled_at BIGINT,
+    trial_end BIGINT,
+    amount BIGINT,
+    currency TEXT,
+    interval TEXT,
+    synced_at BIGINT NOT NULL,
+    event_created BIGINT
+);
+
+-- Audit log of subscription lifecycle events, written in batches by the backend
+CREATE TABLE IF NOT EXISTS subscription_events (
+    id BIGSERIAL PRIMARY KEY,
+    user_id UUID NOT NULL,
+    event_type TEXT NOT NULL,
+    metadata JSONB DEFAULT '{}',
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+);
+
 -- Create indexes for better performance
 CREATE INDEX IF NOT EXISTS idx_users_supabase_id ON users(supabase_id);
 CREATE INDEX IF NOT EXISTS idx_users_email ON users(email);
@@ -72,10 +109,27 @@ CREATE INDEX IF NOT EXISTS idx_users_provider ON users(provider);
 CREATE INDEX IF NOT EXISTS idx_users_subscription_status ON users(subscription_status);
 CREATE INDEX IF NOT EXISTS idx_users_stripe_customer_id ON users(stripe_customer_id);
 CREATE INDEX IF NOT EXISTS idx_users_subscription_plan ON users(subscription_plan);
+
+-- google_id is the upsert conflict target for Google logins
+ALTER TABLE users ADD COLUMN IF NOT EXISTS google_id TEXT;
+CREATE UNIQUE INDEX IF NOT EXISTS idx_users_google_id ON users(google_id);
+
+-- sha256 of the stored object, computed while the upload is streamed
+ALTER TABLE uploaded_files ADD COLUMN IF NOT EXISTS content_sha256 TEXT;
+
+-- Bumped by every preferences write; the preferences API serves it as the ETag
+ALTER TABLE user_preferences ADD COLUMN IF NOT EXISTS version BIGINT NOT NULL DEFAULT 1;
+
+-- `created` of the Stripe event (or API read) a stored subscription state came
+-- from; an older snapshot never overwrites a newer one
+ALTER TABLE stripe_subscriptions ADD COLUMN IF NOT EXISTS event_created BIGINT;
+
 CREATE INDEX IF NOT EXISTS idx_api_keys_user_id ON api_keys(user_id);
 CREATE INDEX IF NOT EXISTS idx_api_keys_service ON api_keys(service);
 CREATE INDEX IF NOT EXISTS idx_uploaded_files_user_id ON uploaded_files(user_id);
 CREATE INDEX IF NOT EXISTS idx_collaborative_sessions_user_id ON collaborative_sessions(user_id);
+CREATE INDEX IF NOT EXISTS idx_stripe_webhook_events_object ON stripe_webhook_events(object_id, event_created DESC);
+CREATE INDEX IF NOT EXISTS idx_subscription_events_user_id ON subscription_events(user_id, created_at);
 
 -- Enable Row Level Security on all tables
 ALTER TABLE users ENABLE ROW LEVEL SECURITY;
@@ -83,6 +137,9 @@ ALTER TABLE api_keys ENABLE ROW LEVEL SECURITY;
 ALTER TABLE user_preferences ENABLE ROW LEVEL SECURITY;
 ALTER TABLE uploaded_files ENABLE ROW LEVEL SECURITY;
 ALTER TABLE collaborative_sessions ENABLE ROW LEVEL SECURITY;
+ALTER TABLE stripe_webhook_events ENABLE ROW LEVEL SECURITY;
+ALTER TABLE stripe_subscriptions ENABLE ROW LEVEL SECURITY;
+ALTER TABLE subscription_events ENABLE ROW LEVEL SECURITY;
 
 -- Create RLS policies for users table
 CREATE POLICY "Users can view their own data" ON users
@@ -152,6 +209,22 @@ BEGIN
 END;
 $$ language 'plpgsql';
 
+-- Apply a batch of re-encrypted api_keys tokens (backend/rotate_api_keys.py).
+-- rotations is a JSON array of {"id", "old_key", "new_key"}; each row is only
+-- updated if it still holds old_key, so keys saved meanwhile are kept.
+-- Returns the ids that were updated.
+CREATE OR REPLACE FUNCTION rotate_api_key_batch(rotations JSONB)
+RETURNS SETOF UUID AS $$
+    UPDATE api_keys AS k
+       SET encrypted_key = r.new_key
+      FROM jsonb_to_recordset(rotations) AS r(id UUID, old_key TEXT, new_key TEXT)
+     WHERE k.id = r.id AND k.encrypted_key = r.old_key
+    RETURNING k.id;
+$$ language 'sql';
+
+-- Only the service role runs key rotation
+REVOKE EXECUTE ON FUNCTION rotate_api_key_batch(JSONB) FROM PUBLIC, anon, authenticated;
+
 -- Create triggers to automatically update updated_at
 CREATE TRIGGER update_users_updated_at BEFORE UPDATE ON users
     FOR EACH ROW EXECUTE FUNCTION update_updated_at_column();
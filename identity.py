@@ -0,0 +1,25 @@
+import os
+
+# JWT secret of the Supabase project (Settings > API > JWT Secret). Access
+# tokens are checked against it locally, so no request goes to Supabase.
+SUPABASE_JWT_SECRET = os.getenv('SUPABASE_JWT_SECRET')
+SUPABASE_JWT_AUDIENCE = os.getenv('SUPABASE_JWT_AUDIENCE', 'authenticated')
+
+
+def verify_access_token(token):
+    """Supabase auth uid (the token's sub) for a valid access token, else None.
+
+    Only tokens signed with SUPABASE_JWT_SECRET, unexpired and issued for
+    SUPABASE_JWT_AUDIENCE are accepted; without the secret nothing is.
+    """
+    if not token or not SUPABASE_JWT_SECRET:
+        return None
+    # Imported on first use so that importing this module stays cheap
+    import jwt
+    try:
+        payload = jwt.decode(token, SUPABASE_JWT_SECRET, algorithms=['HS256'],
+                             audience=SUPABASE_JWT_AUDIENCE)
+    except jwt.PyJWTError as e:
+        print(f"Access token rejected: {e}")
+        return None
+    return str(payload['sub']) if payload.get('sub') else None
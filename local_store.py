@@ -0,0 +1,193 @@
+import atexit
+import os
+import threading
+import time
+from collections import defaultdict
+
+from sqlalchemy import event
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.pool import QueuePool
+
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv('SQLITE_BUSY_TIMEOUT_MS', 5000))
+SQLITE_POOL_SIZE = int(os.getenv('SQLITE_POOL_SIZE', 5))
+SQLITE_MAX_OVERFLOW = int(os.getenv('SQLITE_MAX_OVERFLOW', 10))
+SQLITE_CACHE_SIZE_KB = int(os.getenv('SQLITE_CACHE_SIZE_KB', 16384))
+
+WRITE_BATCH_SIZE = int(os.getenv('LOCAL_STORE_BATCH_SIZE', 500))
+WRITE_FLUSH_SECONDS = float(os.getenv('LOCAL_STORE_FLUSH_SECONDS', 0.2))
+# Rows held in memory at most; add() flushes inline (backpressure) beyond this
+WRITE_MAX_BUFFER = int(os.getenv('LOCAL_STORE_MAX_BUFFER', 20000))
+# Attempts for a batch that keeps hitting "database is locked"
+WRITE_LOCKED_ATTEMPTS = 3
+
+
+def sqlite_engine_options(busy_timeout_ms=SQLITE_BUSY_TIMEOUT_MS, pool_size=SQLITE_POOL_SIZE,
+                          max_overflow=SQLITE_MAX_OVERFLOW):
+    """create_engine / SQLALCHEMY_ENGINE_OPTIONS kwargs for a file-backed SQLite database"""
+    return {
+        'poolclass': QueuePool,
+        'pool_size': pool_size,
+        'max_overflow': max_overflow,
+        'connect_args': {
+            # sqlite3 retries a locked database for this long before raising
+            'timeout': busy_timeout_ms / 1000,
+            # Pooled connections are handed to whichever thread checks them out
+            'check_same_thread': False,
+        },
+    }
+
+
+def configure_sqlite_engine(engine, busy_timeout_ms=SQLITE_BUSY_TIMEOUT_MS):
+    """Apply WAL, synchronous=NORMAL and the busy timeout to every connection of engine.
+
+    WAL lets readers run alongside the single writer and makes a commit an
+    append to the log; synchronous=NORMAL skips the fsync per commit (a
+    power loss can drop the last transactions, never corrupt the file).
+    Must be called before the engine's first connection. The pool is
+    discarded in forked children so workers never share a connection.
+    """
+    if engine.dialect.name != 'sqlite':
+        return engine
+
+    @event.listens_for(engine, 'connect')
+    def _set_sqlite_pragmas(dbapi_connection, _):
+        cursor = dbapi_connection.cursor()
+        cursor.execute('PRAGMA journal_mode=WAL')
+        cursor.execute('PRAGMA synchronous=NORMAL')
+        cursor.execute(f'PRAGMA busy_timeout={int(busy_timeout_ms)}')
+        cursor.execute('PRAGMA foreign_keys=ON')
+        cursor.execute('PRAGMA temp_store=MEMORY')
+        cursor.execute(f'PRAGMA cache_size=-{SQLITE_CACHE_SIZE_KB}')
+        cursor.close()
+
+    if hasattr(os, 'register_at_fork'):
+        os.register_at_fork(after_in_child=lambda: engine.dispose(close=False))
+    return engine
+
+
+class WriteBehindBatcher:
+    """Write-behind multi-row inserter for the local SQLite store.
+
+    add() only appends to an in-memory buffer; a background thread inserts
+    it by size or time, one transaction and one executemany per table per
+    batch, so many small writes cost one commit. SQLite has one writer at
+    a time across all processes, so fewer, larger transactions are what
+    keeps throughput up when every worker writes. When the buffer is full
+    add() flushes inline instead of growing it. The buffer is flushed at
+    interpreter exit.
+
+    A batch is retried only while SQLite reports "database is locked". Any
+    other error (a constraint, a bad value) makes the batch fall back to
+    one insert per row, so only the offending rows are lost.
+
+    sqlite3 calls block the OS thread. Under gunicorn's eventlet worker
+    (backend/gunicorn.conf.py) the writer thread is a green thread, so a
+    flush waiting on a locked database stalls the whole worker for up to
+    SQLITE_BUSY_TIMEOUT_MS per attempt.
+    """
+
+    def __init__(self, engine, batch_size=WRITE_BATCH_SIZE, flush_seconds=WRITE_FLUSH_SECONDS,
+                 max_buffer=WRITE_MAX_BUFFER, name='local-store'):
+        self.engine = engine
+        self.batch_size = batch_size
+        self.flush_seconds = flush_seconds
+        self.max_buffer = max_buffer
+        self.name = name
+        self._buffer = []
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopped = False
+        self._thread = None
+        self._thread_pid = None
+        self.stats = {'rows': 0, 'batches': 0, 'errors': 0}
+
+    def add(self, table, row):
+        """Queue one row for table (a Table or a model class); never waits on SQLite unless the buffer is full"""
+        table = getattr(table, '__table__', table)
+        self._ensure_thread()
+        with self._lock:
+            self._buffer.append((table, row))
+            size = len(self._buffer)
+        if size >= self.max_buffer:
+            self.flush()
+        elif size >= self.batch_size:
+            self._wakeup.set()
+
+    def flush(self):
+        """Insert everything buffered, batch_size rows per transaction"""
+        with self._flush_lock:
+            while True:
+                with self._lock:
+                    batch = self._buffer[:self.batch_size]
+                    del self._buffer[:self.batch_size]
+                if not batch:
+                    break
+                self._insert(batch)
+
+    def close(self):
+        self._stopped = True
+        self._wakeup.set()
+        self.flush()
+
+    def _ensure_thread(self):
+        if self._thread is not None and self._thread_pid == os.getpid():
+            return
+        with self._lock:
+            if self._thread is None or self._thread_pid != os.getpid():
+                # Rows buffered by the parent before a fork belong to the parent
+                if self._thread_pid is not None:
+                    self._buffer = []
+                self._thread = threading.Thread(target=self._run, name=f"{self.name}-writer", daemon=True)
+                self._thread_pid = os.getpid()
+                self._thread.start()
+                atexit.register(self.close)
+
+    def _run(self):
+        while not self._stopped:
+            self._wakeup.wait(self.flush_seconds)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"Error flushing {self.name}: {e}")
+
+    def _insert(self, batch):
+        by_table = defaultdict(list)
+        for table, row in batch:
+            by_table[table].append(row)
+        for attempt in range(WRITE_LOCKED_ATTEMPTS):
+            try:
+                with self.engine.begin() as connection:
+                    for table, rows in by_table.items():
+                        connection.execute(table.insert(), rows)
+            except OperationalError as e:
+                if 'database is locked' not in str(e):
+                    return self._insert_rows(batch)
+                # Locked past the busy timeout: back off and retry the batch
+                if attempt == WRITE_LOCKED_ATTEMPTS - 1:
+                    self.stats['errors'] += 1
+                    print(f"❌ Dropped {len(batch)} {self.name} rows: {e}")
+                    return False
+                time.sleep(0.05 * (attempt + 1))
+            except Exception:
+                return self._insert_rows(batch)
+            else:
+                self.stats['rows'] += len(batch)
+                self.stats['batches'] += 1
+                return True
+
+    def _insert_rows(self, batch):
+        """Insert a failed batch one row per transaction so only the bad rows are dropped"""
+        written = 0
+        for table, row in batch:
+            try:
+                with self.engine.begin() as connection:
+                    connection.execute(table.insert(), [row])
+                written += 1
+            except Exception as e:
+                self.stats['errors'] += 1
+                print(f"❌ Dropped a {self.name} row for {table.name}: {e}")
+        self.stats['rows'] += written
+        self.stats['batches'] += 1
+        return written == len(batch)
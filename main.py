@@ -3,13 +3,17 @@ import sys
 # DON'T CHANGE THIS !!!
 sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
 
-from flask import Flask, send_from_directory
+from flask import Flask, session
 from flask_cors import CORS
-from flask_socketio import SocketIO, emit
+from flask_socketio import SocketIO, emit, join_room
 from src.models.user import db
 from src.routes.user import user_bp
-from src.routes.terminal import terminal_bp
-import docker
+from src.routes.terminal import terminal_bp, get_docker_client
+from src.static_assets import StaticAssets
+from src.local_store import WriteBehindBatcher, configure_sqlite_engine, sqlite_engine_options
+from src.command_history import init_command_history, record_command
+from src.session_registry import create_session_registry, session_key
+from src.identity import verify_access_token
 import subprocess
 import threading
 import time
@@ -20,111 +24,121 @@ app.config['SECRET_KEY'] = os.getenv('SECRET_KEY', 'dev-secret-key-change-in-pro
 # Enable CORS for all routes
 CORS(app, origins="*")
 
-# Initialize SocketIO
-socketio = SocketIO(app, cors_allowed_origins="*")
+# Initialize SocketIO; with a message queue (redis://...) any worker can emit to any client
+socketio = SocketIO(app, cors_allowed_origins="*", message_queue=os.getenv('SOCKETIO_MESSAGE_QUEUE'))
 
 app.register_blueprint(user_bp, url_prefix='/api')
 app.register_blueprint(terminal_bp, url_prefix='/api')
 
 # uncomment if you need to use database
 app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{os.path.join(os.path.dirname(__file__), 'database', 'app.db')}"
+app.config['SQLALCHEMY_ENGINE_OPTIONS'] = sqlite_engine_options()
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 db.init_app(app)
 with app.app_context():
+    # WAL + synchronous=NORMAL + busy timeout, set before the first connection
+    configure_sqlite_engine(db.engine)
     db.create_all()
+    # Batched inserts for high-volume local writes: local_writes.add(Model, row)
+    local_writes = WriteBehindBatcher(db.engine)
+    # Searchable history of everything run through execute_command
+    init_command_history(db.engine, local_writes)
 
-# Docker client for container management
-docker_client = docker.from_env()
+# Terminal sessions: owner, hosting node/worker and last activity.
+# SESSION_REGISTRY_BACKEND=redis shares them across workers and nodes.
+session_registry = create_session_registry()
 
-# Store active terminal sessions
-active_sessions = {}
+def owner_room(user_id):
+    """Socket.IO room joined by every connection of a user"""
+    return f"user:{user_id}"
 
 @socketio.on('connect')
-def handle_connect():
+def handle_connect(auth=None):
+    # The client sends its Supabase access token in the handshake auth
+    user_id = verify_access_token((auth or {}).get('token'))
+    if not user_id:
+        print('Client rejected: no valid access token')
+        return False
+    session['user_id'] = user_id
+    join_room(owner_room(user_id))
     print('Client connected')
+    session_registry.start(run_session_command)
     emit('status', {'message': 'Connected to AI Agent Platform'})
 
 @socketio.on('disconnect')
 def handle_disconnect():
+    # Sessions belong to the user, not the connection: a reconnect or another
+    # tab picks them up again. Idle ones are reaped after SESSION_IDLE_TIMEOUT.
     print('Client disconnected')
 
 @socketio.on('execute_command')
 def handle_execute_command(data):
     terminal_id = data.get('terminal_id', 'terminal1')
+    # Sessions belong to the user verified at connect. Nothing in the payload
+    # (a client-supplied user_id) decides whose terminal this is or who
+    # receives its output.
+    user_id = session.get('user_id')
+    if not user_id:
+        emit('command_output', {'terminal_id': terminal_id, 'command': data.get('command', ''),
+                                'output': 'Not authenticated', 'type': 'error'})
+        return
+    session_id = session_key(user_id, terminal_id)
+
+    session_registry.start(run_session_command)
+    record = session_registry.acquire(session_id, user_id, terminal_id)
+    # Output is emitted to the user's room, so it reaches their clients whichever worker runs the command
+    message = {'command': data.get('command', ''), 'terminal_id': terminal_id, 'user_id': user_id}
+    if not session_registry.is_local(record):
+        if session_registry.dispatch(record['worker_id'], message):
+            return
+        print(f"⚠️  Owner {record['worker_id']} of {session_id} unreachable, running locally")
+    run_session_command(message)
+
+def run_session_command(data):
+    """Run a command for a session owned by this worker and emit its output to the user's room"""
+    terminal_id = data['terminal_id']
     command = data.get('command', '')
+    user_id = data['user_id']
     
     print(f"Executing command in {terminal_id}: {command}")
     
+    started_at = time.time()
+    exit_code = None
     # Route command to appropriate container or local shell
-    if command.startswith('claude'):
-        # Route to Claude Code container
-        try:
-            container = docker_client.containers.get('claude-code-instance')
+    try:
+        if command.startswith('claude'):
+            # Route to Claude Code container
+            container = get_docker_client().containers.get('claude-code-instance')
             result = container.exec_run(command, stdout=True, stderr=True)
-            output = result.output.decode('utf-8')
-            emit('command_output', {
-                'terminal_id': terminal_id,
-                'command': command,
-                'output': output,
-                'type': 'claude'
-            })
-        except Exception as e:
-            emit('command_output', {
-                'terminal_id': terminal_id,
-                'command': command,
-                'output': f"Error: {str(e)}",
-                'type': 'error'
-            })
-    elif command.startswith('gemini'):
-        # Route to Gemini CLI container
-        try:
-            container = docker_client.containers.get('gemini-cli-instance')
+            output, output_type, exit_code = result.output.decode('utf-8'), 'claude', result.exit_code
+        elif command.startswith('gemini'):
+            # Route to Gemini CLI container
+            container = get_docker_client().containers.get('gemini-cli-instance')
             result = container.exec_run(command, stdout=True, stderr=True)
-            output = result.output.decode('utf-8')
-            emit('command_output', {
-                'terminal_id': terminal_id,
-                'command': command,
-                'output': output,
-                'type': 'gemini'
-            })
-        except Exception as e:
-            emit('command_output', {
-                'terminal_id': terminal_id,
-                'command': command,
-                'output': f"Error: {str(e)}",
-                'type': 'error'
-            })
-    else:
-        # Execute in local shell
-        try:
+            output, output_type, exit_code = result.output.decode('utf-8'), 'gemini', result.exit_code
+        else:
+            # Execute in local shell
             result = subprocess.run(command, shell=True, capture_output=True, text=True, timeout=30)
-            output = result.stdout + result.stderr
-            emit('command_output', {
-                'terminal_id': terminal_id,
-                'command': command,
-                'output': output,
-                'type': 'shell'
-            })
-        except subprocess.TimeoutExpired:
-            emit('command_output', {
-                'terminal_id': terminal_id,
-                'command': command,
-                'output': "Command timed out after 30 seconds",
-                'type': 'error'
-            })
-        except Exception as e:
-            emit('command_output', {
-                'terminal_id': terminal_id,
-                'command': command,
-                'output': f"Error: {str(e)}",
-                'type': 'error'
-            })
+            output, output_type, exit_code = result.stdout + result.stderr, 'shell', result.returncode
+    except subprocess.TimeoutExpired:
+        output, output_type = "Command timed out after 30 seconds", 'error'
+    except Exception as e:
+        output, output_type = f"Error: {str(e)}", 'error'
+
+    socketio.emit('command_output', {
+        'terminal_id': terminal_id,
+        'command': command,
+        'output': output,
+        'type': output_type
+    }, to=owner_room(user_id))
+    record_command(user_id, terminal_id, command, output, output_type, exit_code,
+                   started_at, (time.time() - started_at) * 1000)
 
 @socketio.on('get_container_status')
 def handle_get_container_status():
     try:
-        claude_container = docker_client.containers.get('claude-code-instance')
-        gemini_container = docker_client.containers.get('gemini-cli-instance')
+        claude_container = get_docker_client().containers.get('claude-code-instance')
+        gemini_container = get_docker_client().containers.get('gemini-cli-instance')
         
         emit('container_status', {
             'claude': {
@@ -141,21 +155,16 @@ def handle_get_container_status():
             'error': str(e)
         })
 
+# Manifest of the built frontend, scanned once at startup (rebuild() after redeploying static files)
+static_assets = StaticAssets(app.static_folder)
+
 @app.route('/', defaults={'path': ''})
 @app.route('/<path:path>')
 def serve(path):
-    static_folder_path = app.static_folder
-    if static_folder_path is None:
-            return "Static folder not configured", 404
-
-    if path != "" and os.path.exists(os.path.join(static_folder_path, path)):
-        return send_from_directory(static_folder_path, path)
-    else:
-        index_path = os.path.join(static_folder_path, 'index.html')
-        if os.path.exists(index_path):
-            return send_from_directory(static_folder_path, 'index.html')
-        else:
-            return "index.html not found", 404
+    if app.static_folder is None:
+        return "Static folder not configured", 404
+
+    return static_assets.response(path)
 
 
 if __name__ == '__main__':
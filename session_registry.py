@@ -0,0 +1,362 @@
+import abc
+import atexit
+import json
+import os
+import socket
+import threading
+import time
+
+# 'memory' (single process only) or 'redis' (shared by every worker and node)
+SESSION_REGISTRY_BACKEND = os.getenv('SESSION_REGISTRY_BACKEND', 'memory')
+# A worker that has not heartbeated for this long is considered gone and its
+# sessions are taken over by the next worker that receives an event for them
+SESSION_WORKER_TTL = int(os.getenv('SESSION_WORKER_TTL', 30))
+# Sessions with no activity for this long are removed
+SESSION_IDLE_TIMEOUT = int(os.getenv('SESSION_IDLE_TIMEOUT', 3600))
+NODE_ID = os.getenv('NODE_ID') or socket.gethostname()
+REDIS_KEY_PREFIX = os.getenv('SESSION_REGISTRY_PREFIX', 'tubby')
+
+
+def session_key(owner, terminal_id):
+    """Registry id of a terminal; owner is the authenticated user it belongs to"""
+    return f"{owner}:{terminal_id}"
+
+
+class SessionRegistry(abc.ABC):
+    """Where each terminal session lives and who it belongs to.
+
+    A session record holds the owning user, the terminal, the node and
+    worker process that hosts its exec/PTY, and the last activity time.
+    Every worker heartbeats while it is alive. acquire() returns the
+    session's record, creating it for the calling worker, or taking it
+    over if its owner stopped heartbeating (recycled by max_requests,
+    crashed, node gone), so no session is orphaned. Events for a session
+    owned by another live worker are handed to it with dispatch().
+    """
+
+    def __init__(self, worker_ttl=SESSION_WORKER_TTL, idle_timeout=SESSION_IDLE_TIMEOUT):
+        self.worker_ttl = worker_ttl
+        self.idle_timeout = idle_timeout
+        self._handler = None
+        self._thread = None
+        self._thread_pid = None
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+
+    @property
+    def worker_id(self):
+        """node:pid of this worker; changes in a forked child"""
+        return f"{NODE_ID}:{os.getpid()}"
+
+    def is_local(self, record):
+        return record is not None and record['worker_id'] == self.worker_id
+
+    def new_record(self, session_id, user_id, terminal_id):
+        now = time.time()
+        return {
+            'session_id': session_id,
+            'user_id': str(user_id),
+            'terminal_id': str(terminal_id),
+            'node': NODE_ID,
+            'pid': os.getpid(),
+            'worker_id': self.worker_id,
+            'created_at': now,
+            'last_activity': now,
+        }
+
+    def start(self, handler=None):
+        """Begin heartbeating (and receiving dispatched events) in this process"""
+        if self._thread is not None and self._thread_pid == os.getpid():
+            return
+        with self._lock:
+            if self._thread is None or self._thread_pid != os.getpid():
+                self._handler = handler or self._handler
+                self._stopped = threading.Event()
+                self.heartbeat()
+                self._thread = threading.Thread(target=self._run, name='session-registry', daemon=True)
+                self._thread_pid = os.getpid()
+                self._thread.start()
+                atexit.register(self.stop)
+
+    def stop(self):
+        """Stop heartbeating; this worker's sessions can be taken over at once"""
+        self._stopped.set()
+        try:
+            self.forget_worker(self.worker_id)
+        except Exception as e:
+            print(f"Error deregistering worker {self.worker_id}: {e}")
+
+    def _run(self):
+        interval = max(1, self.worker_ttl // 3)
+        while not self._stopped.wait(interval):
+            try:
+                self.heartbeat()
+                self.reap_idle()
+            except Exception as e:
+                print(f"Session registry heartbeat failed: {e}")
+
+    def _handle(self, message):
+        if self._handler is None:
+            return
+        try:
+            self._handler(message)
+        except Exception as e:
+            print(f"Error handling dispatched session event: {e}")
+
+    # Implemented by backends
+    @abc.abstractmethod
+    def acquire(self, session_id, user_id, terminal_id):
+        pass
+
+    @abc.abstractmethod
+    def get(self, session_id):
+        pass
+
+    @abc.abstractmethod
+    def release(self, session_id):
+        pass
+
+    @abc.abstractmethod
+    def sessions_for_user(self, user_id):
+        pass
+
+    @abc.abstractmethod
+    def heartbeat(self):
+        pass
+
+    @abc.abstractmethod
+    def forget_worker(self, worker_id):
+        pass
+
+    @abc.abstractmethod
+    def is_worker_alive(self, worker_id):
+        pass
+
+    @abc.abstractmethod
+    def dispatch(self, worker_id, message):
+        pass
+
+    @abc.abstractmethod
+    def reap_idle(self):
+        pass
+
+
+class InMemorySessionRegistry(SessionRegistry):
+    """Registry for a single process (development, tests); nothing is shared"""
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self._sessions = {}
+        self._workers = {}
+        self._data_lock = threading.Lock()
+
+    def acquire(self, session_id, user_id, terminal_id):
+        with self._data_lock:
+            record = self._sessions.get(session_id)
+            if record is None or not self._alive(record['worker_id']):
+                record = self.new_record(session_id, user_id, terminal_id)
+                self._sessions[session_id] = record
+            else:
+                record['last_activity'] = time.time()
+            return dict(record)
+
+    def get(self, session_id):
+        with self._data_lock:
+            record = self._sessions.get(session_id)
+            return dict(record) if record else None
+
+    def release(self, session_id):
+        with self._data_lock:
+            self._sessions.pop(session_id, None)
+
+    def sessions_for_user(self, user_id):
+        with self._data_lock:
+            return [dict(r) for r in self._sessions.values() if r['user_id'] == str(user_id)]
+
+    def heartbeat(self):
+        with self._data_lock:
+            self._workers[self.worker_id] = time.time()
+
+    def forget_worker(self, worker_id):
+        with self._data_lock:
+            self._workers.pop(worker_id, None)
+
+    def is_worker_alive(self, worker_id):
+        with self._data_lock:
+            return self._alive(worker_id)
+
+    def _alive(self, worker_id):
+        if worker_id == self.worker_id:
+            return True
+        seen = self._workers.get(worker_id)
+        return seen is not None and time.time() - seen < self.worker_ttl
+
+    def dispatch(self, worker_id, message):
+        # Only this process exists, so every live session is local
+        self._handle(message)
+        return True
+
+    def reap_idle(self):
+        cutoff = time.time() - self.idle_timeout
+        with self._data_lock:
+            for session_id in [s for s, r in self._sessions.items() if r['last_activity'] < cutoff]:
+                del self._sessions[session_id]
+
+
+# Take a session over only if its owner is still the dead worker we saw,
+# so two workers racing for an orphaned session cannot both win.
+# KEYS[1] session hash, KEYS[2] the dead owner's heartbeat key
+# ARGV[1] expected owner, ARGV[2] record JSON
+_TAKEOVER_SCRIPT = """
+local current = redis.call('HGET', KEYS[1], 'worker_id')
+if current and current ~= ARGV[1] then return 0 end
+if redis.call('EXISTS', KEYS[2]) == 1 then return 0 end
+local record = cjson.decode(ARGV[2])
+for field, value in pairs(record) do redis.call('HSET', KEYS[1], field, tostring(value)) end
+return 1
+"""
+
+
+class RedisSessionRegistry(SessionRegistry):
+    """Registry shared by every worker and node through Redis.
+
+    Keys (under SESSION_REGISTRY_PREFIX):
+        session:<id>        hash with the session record
+        user_sessions:<uid> set of the user's session ids
+        activity            sorted set of session ids by last activity
+        worker:<node:pid>   heartbeat, expires after SESSION_WORKER_TTL
+        dispatch:<node:pid> pub/sub channel for events routed to that worker
+    """
+
+    def __init__(self, redis_client=None, prefix=REDIS_KEY_PREFIX, **kwargs):
+        super().__init__(**kwargs)
+        if redis_client is None:
+            import redis
+            redis_client = redis.Redis(
+                host=os.getenv('REDIS_HOST', 'localhost'),
+                port=int(os.getenv('REDIS_PORT', 6379)),
+                decode_responses=True,
+            )
+        self.redis = redis_client
+        self.prefix = prefix
+        self._takeover = self.redis.register_script(_TAKEOVER_SCRIPT)
+        self._pubsub_thread = None
+        self._pubsub_pid = None
+
+    def _key(self, *parts):
+        return ':'.join((self.prefix, *parts))
+
+    def _decode(self, data):
+        if not data:
+            return None
+        record = dict(data)
+        for field in ('created_at', 'last_activity'):
+            record[field] = float(record[field])
+        record['pid'] = int(record['pid'])
+        return record
+
+    def acquire(self, session_id, user_id, terminal_id):
+        key = self._key('session', session_id)
+        record = self._decode(self.redis.hgetall(key))
+        if record is not None and self.is_worker_alive(record['worker_id']):
+            now = time.time()
+            pipe = self.redis.pipeline()
+            pipe.hset(key, 'last_activity', now)
+            pipe.zadd(self._key('activity'), {session_id: now})
+            pipe.execute()
+            record['last_activity'] = now
+            return record
+
+        new = self.new_record(session_id, user_id, terminal_id)
+        previous_owner = record['worker_id'] if record else ''
+        taken = self._takeover(
+            keys=[key, self._key('worker', previous_owner)],
+            args=[previous_owner, json.dumps({k: '' if v is None else v for k, v in new.items()})],
+        )
+        if not taken:
+            # Another worker won the race; it owns the session now
+            return self._decode(self.redis.hgetall(key))
+        if previous_owner:
+            print(f"♻️  Session {session_id} taken over from {previous_owner} by {self.worker_id}")
+        pipe = self.redis.pipeline()
+        pipe.sadd(self._key('user_sessions', new['user_id']), session_id)
+        pipe.zadd(self._key('activity'), {session_id: new['last_activity']})
+        pipe.execute()
+        return new
+
+    def get(self, session_id):
+        return self._decode(self.redis.hgetall(self._key('session', session_id)))
+
+    def release(self, session_id):
+        record = self.get(session_id)
+        pipe = self.redis.pipeline()
+        pipe.delete(self._key('session', session_id))
+        pipe.zrem(self._key('activity'), session_id)
+        if record:
+            pipe.srem(self._key('user_sessions', record['user_id']), session_id)
+        pipe.execute()
+
+    def sessions_for_user(self, user_id):
+        session_ids = sorted(self.redis.smembers(self._key('user_sessions', str(user_id))))
+        if not session_ids:
+            return []
+        pipe = self.redis.pipeline()
+        for session_id in session_ids:
+            pipe.hgetall(self._key('session', session_id))
+        records = [self._decode(data) for data in pipe.execute()]
+        return [record for record in records if record]
+
+    def heartbeat(self):
+        self.redis.set(self._key('worker', self.worker_id), time.time(), ex=self.worker_ttl)
+
+    def forget_worker(self, worker_id):
+        self.redis.delete(self._key('worker', worker_id))
+
+    def is_worker_alive(self, worker_id):
+        if worker_id == self.worker_id:
+            return True
+        return bool(self.redis.exists(self._key('worker', worker_id)))
+
+    def dispatch(self, worker_id, message):
+        """Publish an event to the owning worker; False if nobody received it"""
+        if worker_id == self.worker_id:
+            self._handle(message)
+            return True
+        return self.redis.publish(self._key('dispatch', worker_id), json.dumps(message)) > 0
+
+    def start(self, handler=None):
+        super().start(handler)
+        if self._pubsub_pid != os.getpid():
+            # A forked child subscribes to its own channel; the parent's thread is not inherited
+            pubsub = self.redis.pubsub(ignore_subscribe_messages=True)
+            pubsub.subscribe(**{self._key('dispatch', self.worker_id): self._on_message})
+            self._pubsub_thread = pubsub.run_in_thread(sleep_time=1.0, daemon=True)
+            self._pubsub_pid = os.getpid()
+
+    def stop(self):
+        if self._pubsub_thread is not None and self._pubsub_pid == os.getpid():
+            self._pubsub_thread.stop()
+            self._pubsub_thread = None
+            self._pubsub_pid = None
+        super().stop()
+
+    def _on_message(self, message):
+        self._handle(json.loads(message['data']))
+
+    def reap_idle(self):
+        cutoff = time.time() - self.idle_timeout
+        for session_id in self.redis.zrangebyscore(self._key('activity'), 0, cutoff, start=0, num=500):
+            self.release(session_id)
+
+
+def create_session_registry(backend=SESSION_REGISTRY_BACKEND):
+    """Registry for the configured backend; falls back to in-memory if Redis is unusable"""
+    if backend == 'redis':
+        try:
+            registry = RedisSessionRegistry()
+            registry.redis.ping()
+            print(f"✅ Redis session registry ({registry.worker_id})")
+            return registry
+        except Exception as e:
+            print(f"⚠️  Redis session registry unavailable, sessions are per-process: {e}")
+    return InMemorySessionRegistry()
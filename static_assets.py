@@ -0,0 +1,161 @@
+import gzip
+import hashlib
+import mimetypes
+import os
+import re
+
+from flask import Response, request, send_file
+
+try:
+    import brotli
+    BROTLI_AVAILABLE = True
+except ImportError:
+    BROTLI_AVAILABLE = False
+
+# Vite emits content-hashed names such as assets/index-4f3a9c1b.js (8-char hash)
+HASHED_NAME_RE = re.compile(r'[-.][A-Za-z0-9_-]{8}\.[A-Za-z0-9]+$')
+COMPRESSIBLE_TYPES = ('text/', 'application/javascript', 'application/json', 'image/svg+xml',
+                      'application/xml', 'application/wasm', 'font/ttf', 'font/otf')
+# Smaller files are not worth compressing; larger ones are only served
+# compressed if the build wrote a .gz/.br next to them
+MIN_COMPRESS_SIZE = 1024
+MAX_IN_MEMORY_COMPRESS_SIZE = int(os.getenv('STATIC_MAX_IN_MEMORY_COMPRESS_SIZE', 8 * 1024 * 1024))
+
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+REVALIDATE_CACHE_CONTROL = 'no-cache'
+
+# Preference order when the client accepts several encodings equally
+_ENCODING_SUFFIXES = (('br', '.br'), ('gzip', '.gz'))
+
+
+class StaticAsset:
+    """One file of the static folder and its precompressed variants"""
+
+    __slots__ = ('path', 'mimetype', 'size', 'etag', 'immutable', 'variants')
+
+    def __init__(self, path, mimetype, size, etag, immutable):
+        self.path = path
+        self.mimetype = mimetype
+        self.size = size
+        self.etag = etag
+        self.immutable = immutable
+        # encoding -> file path (built alongside) or bytes (compressed at startup)
+        self.variants = {}
+
+
+def parse_accept_encoding(header):
+    """{encoding: q} from an Accept-Encoding header"""
+    accepted = {}
+    for item in (header or '').split(','):
+        name, _, params = item.strip().partition(';')
+        name = name.strip().lower()
+        if not name:
+            continue
+        q = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        accepted[name] = q
+    return accepted
+
+
+class StaticAssets:
+    """In-memory manifest of a built SPA's static folder.
+
+    The folder is scanned once: each file gets its mimetype, a content
+    ETag and any precompressed variants (.br/.gz written by the build, or
+    compressed in memory at startup). Requests are then answered from the
+    manifest without touching the filesystem to decide what to serve.
+    Unknown paths fall back to index.html for client-side routing.
+
+    Content-hashed asset names are cached as immutable for a year;
+    index.html and other unhashed files are revalidated with their ETag.
+    Call rebuild() after replacing the build output.
+    """
+
+    def __init__(self, static_folder, index='index.html'):
+        self.static_folder = static_folder
+        self.index = index
+        self._assets = {}
+        self.rebuild()
+
+    def rebuild(self):
+        assets = {}
+        if self.static_folder and os.path.isdir(self.static_folder):
+            for dirpath, _, filenames in os.walk(self.static_folder):
+                for filename in filenames:
+                    full_path = os.path.join(dirpath, filename)
+                    rel_path = os.path.relpath(full_path, self.static_folder).replace(os.sep, '/')
+                    if rel_path.endswith(('.gz', '.br')) and os.path.exists(full_path[:-3]):
+                        continue
+                    assets[rel_path] = self._load(rel_path, full_path)
+        self._assets = assets
+        compressed = sum(1 for asset in assets.values() if asset.variants)
+        print(f"✅ Static manifest built: {len(assets)} files, {compressed} with compressed variants")
+
+    def _load(self, rel_path, full_path):
+        mimetype = mimetypes.guess_type(rel_path)[0] or 'application/octet-stream'
+        with open(full_path, 'rb') as f:
+            content = f.read()
+        asset = StaticAsset(
+            full_path, mimetype, len(content), hashlib.sha256(content).hexdigest()[:32],
+            immutable=rel_path.startswith('assets/') and bool(HASHED_NAME_RE.search(rel_path))
+        )
+
+        for encoding, suffix in _ENCODING_SUFFIXES:
+            if os.path.exists(full_path + suffix):
+                asset.variants[encoding] = full_path + suffix
+
+        compressible = mimetype.startswith(COMPRESSIBLE_TYPES)
+        if compressible and MIN_COMPRESS_SIZE <= len(content) <= MAX_IN_MEMORY_COMPRESS_SIZE:
+            if 'gzip' not in asset.variants:
+                asset.variants['gzip'] = gzip.compress(content, compresslevel=9, mtime=0)
+            if 'br' not in asset.variants and BROTLI_AVAILABLE:
+                asset.variants['br'] = brotli.compress(content)
+        return asset
+
+    def lookup(self, path):
+        """Manifest entry for a request path, falling back to index.html; None if neither exists"""
+        return self._assets.get(path) or self._assets.get(self.index)
+
+    def choose_encoding(self, asset, accept_encoding):
+        """Best available encoding the client accepts, or None for identity"""
+        if not asset.variants:
+            return None
+        accepted = parse_accept_encoding(accept_encoding)
+        best, best_q = None, 0.0
+        for encoding, _ in _ENCODING_SUFFIXES:
+            q = accepted.get(encoding, accepted.get('*', 0.0))
+            if encoding in asset.variants and q > best_q:
+                best, best_q = encoding, q
+        return best
+
+    def response(self, path):
+        """Flask response for a request path under the static folder"""
+        asset = self.lookup(path)
+        if asset is None:
+            return f"{self.index} not found", 404
+
+        encoding = self.choose_encoding(asset, request.headers.get('Accept-Encoding'))
+        etag = f"{asset.etag}-{encoding}" if encoding else asset.etag
+
+        if request.if_none_match.contains(etag):
+            response = Response(status=304)
+        elif encoding is None:
+            response = send_file(asset.path, mimetype=asset.mimetype, etag=False, conditional=False)
+        else:
+            variant = asset.variants[encoding]
+            if isinstance(variant, bytes):
+                response = Response(variant, mimetype=asset.mimetype)
+            else:
+                response = send_file(variant, mimetype=asset.mimetype, etag=False, conditional=False)
+            response.headers['Content-Encoding'] = encoding
+
+        response.set_etag(etag)
+        if asset.variants:
+            response.vary.add('Accept-Encoding')
+        response.headers['Cache-Control'] = IMMUTABLE_CACHE_CONTROL if asset.immutable else REVALIDATE_CACHE_CONTROL
+        return response
@@ -1,27 +1,53 @@
 from flask import Blueprint, jsonify, request
-import docker
+from src.command_history import COMMAND_HISTORY_PAGE_SIZE, get_command_history, record_command
+from src.identity import verify_access_token
 import subprocess
+import threading
+import time
 
 terminal_bp = Blueprint('terminal', __name__)
 
-# Docker client for container management
-docker_client = docker.from_env()
+# Command history belongs to the user who ran the commands (main.py records
+# them under the user verified at socket connect). HTTP callers send the same
+# Supabase access token as a Bearer token; nothing is served for a user id
+# taken from the request.
+def history_owner():
+    """Auth uid of the caller's Bearer access token, or None if missing or invalid"""
+    scheme, _, token = request.headers.get('Authorization', '').partition(' ')
+    if scheme.lower() != 'bearer':
+        return None
+    return verify_access_token(token.strip())
+
+# Docker client for container management, connected on first use so that
+# importing this module (app boot, tests) never talks to the Docker daemon
+_docker_client = None
+_docker_lock = threading.Lock()
+
+def get_docker_client():
+    global _docker_client
+    if _docker_client is None:
+        with _docker_lock:
+            if _docker_client is None:
+                import docker
+                _docker_client = docker.from_env()
+    return _docker_client
 
 @terminal_bp.route('/containers/status', methods=['GET'])
 def get_container_status():
     """Get the status of AI agent containers"""
     try:
+        from docker.errors import NotFound
         containers = {}
         
         # Check Claude Code container
         try:
-            claude_container = docker_client.containers.get('claude-code-instance')
+            claude_container = get_docker_client().containers.get('claude-code-instance')
             containers['claude'] = {
                 'status': claude_container.status,
                 'name': claude_container.name,
                 'id': claude_container.id[:12]
             }
-        except docker.errors.NotFound:
+        except NotFound:
             containers['claude'] = {
                 'status': 'not_found',
                 'name': 'claude-code-instance',
@@ -30,13 +56,13 @@ def get_container_status():
         
         # Check Gemini CLI container
         try:
-            gemini_container = docker_client.containers.get('gemini-cli-instance')
+            gemini_container = get_docker_client().containers.get('gemini-cli-instance')
             containers['gemini'] = {
                 'status': gemini_container.status,
                 'name': gemini_container.name,
                 'id': gemini_container.id[:12]
             }
-        except docker.errors.NotFound:
+        except NotFound:
             containers['gemini'] = {
                 'status': 'not_found',
                 'name': 'gemini-cli-instance',
@@ -59,6 +85,7 @@ def execute_command():
     data = request.get_json()
     command = data.get('command', '')
     terminal_id = data.get('terminal_id', 'terminal1')
+    owner = history_owner()
     
     if not command:
         return jsonify({
@@ -66,50 +93,96 @@ def execute_command():
             'error': 'No command provided'
         }), 400
     
+    started_at = time.time()
     try:
         if command.startswith('claude'):
             # Route to Claude Code container
-            container = docker_client.containers.get('claude-code-instance')
+            container = get_docker_client().containers.get('claude-code-instance')
             result = container.exec_run(command, stdout=True, stderr=True)
-            output = result.output.decode('utf-8')
-            return jsonify({
-                'success': True,
-                'terminal_id': terminal_id,
-                'command': command,
-                'output': output,
-                'type': 'claude'
-            })
+            output, output_type, exit_code = result.output.decode('utf-8'), 'claude', result.exit_code
         elif command.startswith('gemini'):
             # Route to Gemini CLI container
-            container = docker_client.containers.get('gemini-cli-instance')
+            container = get_docker_client().containers.get('gemini-cli-instance')
             result = container.exec_run(command, stdout=True, stderr=True)
-            output = result.output.decode('utf-8')
-            return jsonify({
-                'success': True,
-                'terminal_id': terminal_id,
-                'command': command,
-                'output': output,
-                'type': 'gemini'
-            })
+            output, output_type, exit_code = result.output.decode('utf-8'), 'gemini', result.exit_code
         else:
             # Execute in local shell
             result = subprocess.run(command, shell=True, capture_output=True, text=True, timeout=30)
-            output = result.stdout + result.stderr
-            return jsonify({
-                'success': True,
-                'terminal_id': terminal_id,
-                'command': command,
-                'output': output,
-                'type': 'shell'
-            })
+            output, output_type, exit_code = result.stdout + result.stderr, 'shell', result.returncode
     except subprocess.TimeoutExpired:
+        _record(owner, terminal_id, command, 'Command timed out after 30 seconds', 'error', None, started_at)
         return jsonify({
             'success': False,
             'error': 'Command timed out after 30 seconds'
         }), 408
     except Exception as e:
+        _record(owner, terminal_id, command, f"Error: {str(e)}", 'error', None, started_at)
         return jsonify({
             'success': False,
             'error': str(e)
         }), 500
 
+    _record(owner, terminal_id, command, output, output_type, exit_code, started_at)
+    return jsonify({
+        'success': True,
+        'terminal_id': terminal_id,
+        'command': command,
+        'output': output,
+        'type': output_type
+    })
+
+def _record(owner, terminal_id, command, output, output_type, exit_code, started_at):
+    # Commands from unauthenticated callers belong to nobody, so they are not kept
+    if owner:
+        record_command(owner, terminal_id, command, output, output_type, exit_code,
+                       started_at, (time.time() - started_at) * 1000)
+
+def _history_page(rows, next_cursor):
+    return jsonify({
+        'success': True,
+        'history': rows,
+        'next_cursor': next_cursor
+    })
+
+@terminal_bp.route('/history', methods=['GET'])
+def get_command_history_page():
+    """Newest-first command history; pass next_cursor back as ?before= for the next page"""
+    owner = history_owner()
+    if not owner:
+        return jsonify({'success': False, 'error': 'Authentication required'}), 401
+    history = get_command_history()
+    if history is None:
+        return jsonify({'success': False, 'error': 'Command history not configured'}), 503
+    try:
+        rows, next_cursor = history.list(
+            owner,
+            terminal_id=request.args.get('terminal_id'),
+            before=request.args.get('before', type=int),
+            limit=request.args.get('limit', COMMAND_HISTORY_PAGE_SIZE, type=int)
+        )
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+    return _history_page(rows, next_cursor)
+
+@terminal_bp.route('/history/search', methods=['GET'])
+def search_command_history():
+    """Full-text search over commands and output, newest first, keyset paginated like /history"""
+    owner = history_owner()
+    if not owner:
+        return jsonify({'success': False, 'error': 'Authentication required'}), 401
+    history = get_command_history()
+    if history is None:
+        return jsonify({'success': False, 'error': 'Command history not configured'}), 503
+    query = request.args.get('q', '')
+    if not query.strip():
+        return jsonify({'success': False, 'error': 'No search query provided'}), 400
+    try:
+        rows, next_cursor = history.search(
+            owner, query,
+            terminal_id=request.args.get('terminal_id'),
+            before=request.args.get('before', type=int),
+            limit=request.args.get('limit', COMMAND_HISTORY_PAGE_SIZE, type=int)
+        )
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+    return _history_page(rows, next_cursor)